@@ -48,7 +48,6 @@ def set_properties(project):
     project.depends_on('yadtcommons')
     project.depends_on('yadtbroadcast-client-wamp2')
     project.depends_on('Twisted')
-    project.depends_on('fysom')
     project.depends_on('requests')
 
     project.set_property("verbose", True)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the events per second EventHandler.on_command_execution_event
+handles, by kind of event, with logging at WARN.
+
+The "chained" handler reproduces the former dispatch, which unpacked the WAMP
+v1/v2 arguments of every event and ran it through all handlers, each one
+checking the event id on its own, the "table" handler is the current
+EventHandler.
+
+Usage:
+PYTHONPATH=src/main/python python src/benchmark/python/event_dispatch_benchmark.py [<services> [<events>]]
+"""
+
+from __future__ import print_function
+
+import logging
+import sys
+import timeit
+
+from yadt_controller import event_handler as event_handler_module
+from yadt_controller.event_handler import EventHandler
+
+
+TRACKING_ID = 'benchmark'
+
+
+class IdleReactor(object):
+    """
+        Accepts the timeouts of the event handlers, but never runs them.
+    """
+
+    class DelayedCall(object):
+
+        def active(self):
+            return False
+
+    def callLater(self, delay, function, *args, **kwargs):
+        return IdleReactor.DelayedCall()
+
+
+class ChainedDispatchEventHandler(EventHandler):
+
+    def on_command_execution_event(self, *args):
+        event = args[-1]
+        EventHandler.on_command_execution_event(self, event)
+
+    def handle_event(self, event):
+        try:
+            self._pretty_print_event(event)
+            if event.get('id') == 'cmd' and event.get('state') == 'failed' and event.get('message'):
+                self._output_error_report(event)
+            if event.get('id') == 'call-info':
+                self._output_call_info(event)
+            if event.get('id') == 'service-change' and event.get('payload'):
+                self._output_service_change(event)
+            if event.get('state'):
+                self._apply_state_transition_to_state_machine(event)
+        except Exception as e:
+            event_handler_module.logger.debug("Error while processing event : %s", e)
+
+
+def create_event(event_id, tracking_id=TRACKING_ID, **fields):
+    event = {'id': event_id, 'type': 'event', 'target': 'target', 'tracking_id': tracking_id, 'payload': None}
+    event.update(fields)
+    return event
+
+
+def create_event_handler(event_handler_class):
+    event_handler = event_handler_class('localhost', 8081, 'target')
+    event_handler.completion_callback = lambda: None
+    event_handler.prepare_execution_request(waiting_timeout=30, pending_timeout=300, command_to_execute='update',
+                                            arguments=['update'], tracking_id=TRACKING_ID)
+    return event_handler
+
+
+def measure_events_per_second(event_handler_class, events, number_of_runs):
+    """
+        Every run feeds the events to a new, started event handler.
+    """
+    event_handlers = [create_event_handler(event_handler_class) for _ in range(number_of_runs)]
+    for event_handler in event_handlers:
+        event_handler.execution_state_machine.request()
+    event_handlers = iter(event_handlers)
+
+    def run():
+        on_command_execution_event = next(event_handlers).on_command_execution_event
+        for event in events:
+            on_command_execution_event(event)
+
+    seconds = timeit.timeit(run, number=number_of_runs)
+    return len(events) * number_of_runs / seconds
+
+
+def main():
+    number_of_services = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    number_of_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    event_handler_module.reactor = IdleReactor()
+    logging.basicConfig(level=logging.WARN)
+
+    payload = [{'uri': 'service://host/service{0:04d}'.format(index), 'state': 'up'}
+               for index in range(number_of_services)]
+    scenarios = (('foreign', [create_event('cmd', tracking_id='foreign', state='started')] * 10),
+                 ('heartbeat', [create_event('heartbeat', tracking_id=None)] * 10),
+                 ('call-info', [create_event('call-info', host='host', log_file='/var/log/update.log')] * 10),
+                 ('service-change', [create_event('service-change', payload=payload)] * 10),
+                 ('execution', [create_event('cmd', cmd='update', state='started'),
+                                create_event('call-info', host='host', log_file='/var/log/update.log'),
+                                create_event('service-change', payload=payload),
+                                create_event('cmd', cmd='update', state='finished')]))
+
+    print('{0} services per service-change event, {1} runs per scenario'.format(number_of_services, number_of_runs))
+    print('{0:<16} {1:>16} {2:>16} {3:>8}'.format('events', 'chained evt/s', 'table evt/s', 'speedup'))
+    for description, events in scenarios:
+        chained = measure_events_per_second(ChainedDispatchEventHandler, events, number_of_runs)
+        table = measure_events_per_second(EventHandler, events, number_of_runs)
+        print('{0:<16} {1:>16.0f} {2:>16.0f} {3:>7.2f}x'.format(description, chained, table, table / chained))
+
+
+if __name__ == '__main__':
+    main()
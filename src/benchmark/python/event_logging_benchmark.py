@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the per-event cost of EventHandler.on_command_execution_event for
+large service-change payloads at different log levels.
+
+The "eager" handler reproduces the former logging, which formatted every
+event and service change regardless of the log level, the "lazy" handler is
+the current EventHandler.
+
+Usage:
+PYTHONPATH=src/main/python python src/benchmark/python/event_logging_benchmark.py [<services> [<events>]]
+"""
+
+from __future__ import print_function
+
+import logging
+import os
+import sys
+import timeit
+
+from yadt_controller import event_handler as event_handler_module
+from yadt_controller.event_handler import EventHandler
+
+TRACKING_ID = 'benchmark'
+
+logger = event_handler_module.logger
+
+
+class EagerLoggingEventHandler(EventHandler):
+    """
+        The event handling chain as it was before the logging was deferred,
+        copied from the former EventHandler.
+    """
+
+    def on_command_execution_event(self, *args):
+        try:
+            # Wamp v1: onEvent is callbacked with topic and event
+            target, event = args
+        except ValueError:
+            # Wamp v2: onEvent is callbacked with event
+            event, = args
+
+        if event.get('tracking_id') != self.tracking_id:
+            if event.get('state'):
+                event_description = '{0} {1}'.format(
+                    event.get('id'), event.get('state'))
+            else:
+                event_description = '{0}'.format(event.get('id'))
+            logger.debug(
+                'Ignoring event {0} with a foreign tracking ID: {1}.'.format(event_description,
+                                                                             event.get('tracking_id')))
+            return
+
+        try:
+            self._pretty_print_event(event)
+            self._output_error_report(event)
+            self._output_call_info(event)
+            self._output_service_change(event)
+            self._apply_state_transition_to_state_machine(event)
+        except Exception as e:
+            logger.debug("Error while processing event : %s" % e)
+
+    def _output_service_change(self, event):
+        if event.get('id') == 'service-change' and event.get('payload'):
+            for service_change in event.get('payload'):
+                message = '{0} is now {1}.'.format(
+                    service_change.get('uri'), service_change.get('state'))
+                logger.info(message)
+                if self.progress_handler is not None:
+                    self.progress_handler.output_progress(sys.stdout, message)
+
+    def _output_error_report(self, event):
+        if self._event_is_an_error_report(event):
+            logger.error('*' * 5 + 'Error report' + '*' * 5)
+            for error_message_line in event.get('message').split('\n'):
+                logger.error(error_message_line)
+            logger.error("See also full log on {0} : {1}".format(self.remote_host,
+                                                                 self.remote_log_file))
+
+    def _event_is_an_error_report(self, event):
+        return event.get('id') == 'cmd' and event.get('state') == 'failed' and event.get('message')
+
+    def _output_call_info(self, event):
+        if self._event_is_a_call_info(event):
+            self.remote_host = event.get('host')
+            self.remote_log_file = event.get('log_file')
+            logger.info('Logfile on %s is at : %s' % (self.remote_host, self.remote_log_file))
+
+    def _event_is_a_call_info(self, event):
+        return event.get('id') == 'call-info'
+
+    def _apply_state_transition_to_state_machine(self, event):
+        if event.get('state'):
+            fun = getattr(self.execution_state_machine, event.get('state'))
+            if fun:
+                previous_fsm_state = self.execution_state_machine.current
+                fun(msg=event['id'])
+                current_fsm_state = self.execution_state_machine.current
+                logger.debug(
+                    'Transition from "{0}" to "{1}" since event "{2}" occured.'.format(previous_fsm_state,
+                                                                                       current_fsm_state,
+                                                                                       event['state']))
+
+    def _pretty_print_event(self, event):
+        payload = None
+        try:
+            if event.get('payload'):
+                payload = ' '.join(
+                    ['%s=%s' % (key, value)
+                     for d in event.get('payload')
+                     for key, value in d.items()])
+        except:
+            pass
+        logger.debug('Event "%s" received' % ' '.join(filter(None,
+                                                             [event['id'],
+                                                              event.get('cmd'),
+                                                              event.get(
+                                                                  'state'),
+                                                              payload])))
+
+
+def create_event_handler(event_handler_class):
+    event_handler = event_handler_class('localhost', 8081, 'target')
+    event_handler.tracking_id = TRACKING_ID
+    event_handler.progress_handler = None
+    return event_handler
+
+
+def create_service_change_event(number_of_services, tracking_id=TRACKING_ID):
+    payload = [{'uri': 'service://host{0:04d}/service{0:04d}'.format(index),
+                'state': 'up'} for index in range(number_of_services)]
+    return {'id': 'service-change',
+            'type': 'event',
+            'target': 'target',
+            'tracking_id': tracking_id,
+            'payload': payload}
+
+
+def measure_microseconds_per_event(event_handler, event, number_of_events):
+    seconds = min(timeit.repeat(lambda: event_handler.on_command_execution_event(event),
+                                number=number_of_events, repeat=3))
+    return seconds * 1000000 / number_of_events
+
+
+def main():
+    number_of_services = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    number_of_events = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    null_stream = open(os.devnull, 'w')
+    logging.getLogger().addHandler(logging.StreamHandler(null_stream))
+
+    own_event = create_service_change_event(number_of_services)
+    foreign_event = create_service_change_event(number_of_services, tracking_id='foreign')
+
+    print('{0} services per service-change event, {1} events per run'.format(number_of_services,
+                                                                             number_of_events))
+    print('{0:<8} {1:<10} {2:>14} {3:>14} {4:>8}'.format('level', 'event', 'eager us/evt', 'lazy us/evt',
+                                                         'speedup'))
+    for level in (logging.DEBUG, logging.INFO, logging.WARN):
+        event_handler_module.logger.setLevel(level)
+        for description, event in (('own', own_event), ('foreign', foreign_event)):
+            eager = measure_microseconds_per_event(create_event_handler(EagerLoggingEventHandler),
+                                                   event, number_of_events)
+            lazy = measure_microseconds_per_event(create_event_handler(EventHandler),
+                                                  event, number_of_events)
+            print('{0:<8} {1:<10} {2:>14.1f} {3:>14.1f} {4:>7.1f}x'.format(logging.getLevelName(level), description,
+                                                                           eager, lazy, eager / lazy))
+    null_stream.close()
+
+
+if __name__ == '__main__':
+    main()
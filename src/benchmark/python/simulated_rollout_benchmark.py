@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Runs executions end to end through the Controller and its EventHandlers
+against a simulated broadcaster and fleet of receivers, in this process, and
+reports the throughput, the outcomes and the timeouts.
+
+Usage:
+PYTHONPATH=src/main/python python src/benchmark/python/simulated_rollout_benchmark.py [options]
+"""
+
+from __future__ import print_function
+
+import logging
+import os
+import random
+
+from docopt import docopt
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
+
+from yadt_controller.controller import Controller
+from yadt_controller.metrics import ControllerMetrics
+from yadt_controller.simulation import SimulatedBroadcaster, SimulatedReceivers
+from yadt_controller.timing import monotonic
+
+
+USAGE = """
+Usage:
+simulated_rollout_benchmark.py [options]
+
+Options:
+--executions=<n>        Concurrent executions, one per target [default: 200].
+--services=<n>          Service changes reported per execution [default: 10].
+--start-latency=<s>     Seconds until a receiver starts a command [default: 0.05].
+--execution-time=<s>    Seconds a command runs [default: 0.5].
+--failure-ratio=<r>     Ratio of failing commands [default: 0].
+--unanswered-ratio=<r>  Ratio of requests never answered [default: 0].
+--stuck-ratio=<r>       Ratio of commands started but never finished [default: 0].
+--noise-rate=<n>        Foreign events per second [default: 0].
+--noise-services=<n>    Service changes per foreign event [default: 10].
+--waiting-timeout=<s>   Waiting timeout of the executions [default: 5].
+--pending-timeout=<s>   Pending timeout of the executions [default: 10].
+--seed=<n>              Seed of the simulation [default: 0].
+"""
+
+
+def run_rollout(options, metrics, results):
+    randomness = random.Random(int(options['--seed']))
+    receivers = SimulatedReceivers(start_latency=float(options['--start-latency']),
+                                   execution_time=float(options['--execution-time']),
+                                   failure_ratio=float(options['--failure-ratio']),
+                                   unanswered_ratio=float(options['--unanswered-ratio']),
+                                   stuck_ratio=float(options['--stuck-ratio']),
+                                   services=int(options['--services']),
+                                   randomness=randomness)
+    broadcaster = SimulatedBroadcaster(receivers,
+                                       noise_rate=float(options['--noise-rate']),
+                                       noise_services=int(options['--noise-services']),
+                                       randomness=randomness)
+    controller = Controller('localhost', 8081, result_reporter=metrics)
+    metrics.add_event_source(controller.event_dispatcher)
+    controller.connect(broadcaster)
+
+    executions = [controller.execute('target{0:05d}'.format(index), 'update',
+                                     waiting_timeout=float(options['--waiting-timeout']),
+                                     pending_timeout=float(options['--pending-timeout']))
+                  for index in range(int(options['--executions']))]
+
+    def stop(completed):
+        results.extend(result for _, result in completed)
+        broadcaster.stop()
+        reactor.stop()
+
+    DeferredList(executions).addCallback(stop)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main():
+    options = docopt(USAGE)
+    null_stream = open(os.devnull, 'w')
+    logging.basicConfig(stream=null_stream, level=logging.WARN)
+
+    metrics = ControllerMetrics()
+    results = []
+    started_at = monotonic()
+    reactor.callWhenRunning(run_rollout, options, metrics, results)
+    reactor.run()
+    seconds = monotonic() - started_at
+    null_stream.close()
+
+    events = sum(source.dispatched_events + source.dropped_events for source in metrics.event_sources)
+    dropped_events = sum(source.dropped_events for source in metrics.event_sources)
+    durations = [sum(result.phases.values()) for result in results]
+    print('{0} executions in {1:.3f}s, {2:.1f} executions/s'.format(len(results), seconds, len(results) / seconds))
+    print('{0} events ({1} foreign) in {2:.3f}s, {3:.0f} events/s'.format(events, dropped_events, seconds,
+                                                                          events / seconds))
+    print('outcomes: {0} success, {1} failure; timeouts: {2} waiting, {3} pending'.format(
+        metrics.executions['success'], metrics.executions['failure'],
+        metrics.timeouts['waiting'], metrics.timeouts['pending']))
+    print('execution duration: p50 {0:.3f}s, p95 {1:.3f}s, max {2:.3f}s'.format(
+        percentile(durations, 0.5), percentile(durations, 0.95), max(durations or [0])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the start up time of the --version and the info code paths of
+yadtcontroller and fails if one of them exceeds its budget or imports
+modules it does not need.
+
+The info request goes to a closed local port, so that the measurement covers
+the whole code path without depending on a broadcaster.
+When the interpreter supports -X importtime (Python >= 3.7) the slowest
+imports are listed as well.
+
+Usage:
+startup_benchmark.py [options]
+
+Options:
+--runs=<runs>                     Number of runs per code path [default: 10].
+--version-budget=<milliseconds>   Median start up time allowed for --version [default: 150].
+--info-budget=<milliseconds>      Median start up time allowed for info [default: 400].
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+SCRIPT = '''
+import sys
+sys.argv = {argv!r}
+import yadt_controller
+try:
+    yadt_controller.run()
+except SystemExit:
+    pass
+sys.stdout.write(" ".join(sorted(sys.modules)))
+'''
+
+INFO_ARGUMENTS = ['--broadcaster-host=127.0.0.1', '--broadcaster-port=9',
+                  '--config-file=/dev/null', '-q', 'target', '1', 'info']
+
+FORBIDDEN_MODULES = {'--version': ('twisted', 'yadtbroadcastclient', 'requests'),
+                     'info': ('twisted', 'yadtbroadcastclient')}
+
+
+def run_code_path(arguments, extra_interpreter_options=()):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+    script = SCRIPT.format(argv=['yadtcontroller'] + arguments)
+    command = [sys.executable] + list(extra_interpreter_options) + ['-c', script]
+    started = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environment)
+    output, errors = process.communicate()
+    elapsed_milliseconds = (time.time() - started) * 1000
+    return elapsed_milliseconds, output.decode('utf-8').split(), errors.decode('utf-8')
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def print_slowest_imports(arguments, count=10):
+    _, _, errors = run_code_path(arguments, extra_interpreter_options=('-X', 'importtime'))
+    imports = []
+    for line in errors.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_microseconds, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative_microseconds), module.strip()))
+    for cumulative_microseconds, module in sorted(imports, reverse=True)[:count]:
+        print('    {0:>8.1f}ms  {1}'.format(cumulative_microseconds / 1000.0, module))
+
+
+def main():
+    options = docopt(__doc__)
+    runs = int(options['--runs'])
+    budgets = {'--version': float(options['--version-budget']),
+               'info': float(options['--info-budget'])}
+    code_paths = (('--version', ['--version']), ('info', INFO_ARGUMENTS))
+    supports_importtime = sys.version_info >= (3, 7)
+
+    failures = []
+    for name, arguments in code_paths:
+        timings = []
+        loaded_modules = []
+        for _ in range(runs):
+            elapsed_milliseconds, loaded_modules, _ = run_code_path(arguments)
+            timings.append(elapsed_milliseconds)
+        median_milliseconds = median(timings)
+        print('{0:<10} median {1:>7.1f}ms  min {2:>7.1f}ms  budget {3:>7.1f}ms  {4} modules'.format(
+            name, median_milliseconds, min(timings), budgets[name], len(loaded_modules)))
+        if supports_importtime:
+            print_slowest_imports(arguments)
+
+        if median_milliseconds > budgets[name]:
+            failures.append('{0} took {1:.1f}ms, budget is {2:.1f}ms'.format(name, median_milliseconds,
+                                                                             budgets[name]))
+        for module in FORBIDDEN_MODULES[name]:
+            if module in loaded_modules:
+                failures.append('{0} imported {1}'.format(name, module))
+
+    for failure in failures:
+        print('FAILED: {0}'.format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,10 +21,22 @@ yadtcontroller
 The yadtcontroller application is connects to a YADT broadcaster and
 issue orders to connected YADT receivers through the broadcaster, or retrieves
 information from the broadcaster directly.
+Orders can be issued to many targets at once by passing a comma separated list
+of targets or a targets file, all of them share a single broadcaster connection.
+The info of many targets is fetched concurrently and printed as one JSON
+document per target, in the order the targets completed.
+With serve, yadtcontroller keeps its broadcaster connection open and accepts
+requests on a Unix domain socket, requests are submitted to it with --socket.
+Several broadcasters can be given as a comma separated list of host[:port],
+the controller connects to the one responding first and fails over to the
+others when it has to reconnect.
 
 Usage:
 yadtcontroller [options] <target> <waiting_timeout> <pending_timeout> [--] <cmd> <args>...
+yadtcontroller [options] --targets-file=<targets_file> <waiting_timeout> <pending_timeout> [--] <cmd> <args>...
 yadtcontroller [options] <target> <waiting_timeout> info
+yadtcontroller [options] --targets-file=<targets_file> <waiting_timeout> info
+yadtcontroller [options] serve <socket_path>
 yadtcontroller (-h | --help)
 yadtcontroller --version
 
@@ -34,9 +46,24 @@ Options:
 -v --verbose  Spit out a lot of information.
 -q --quiet    Be especially quiet (overrides the verbose flag).
 --teamcity    Use TeamCity progress messages.
---broadcaster-host=<host>   Override broadcaster host to use for publishing [default: localhost].
+--broadcaster-host=<hosts>  Override broadcaster hosts to use for publishing [default: localhost].
 --broadcaster-port=<port>   Override broadcaster port to use for publishing [default: 8081].
 --config-file=<config_file> Load configuration from this file               [default: /etc/yadtshell/controller.cfg].
+--targets-file=<targets_file> Execute the command on every target listed in this file (one target per line).
+--max-in-flight=<count>     Handle at most this many targets at the same time (multiple targets only).
+--max-failures=<count>      Stop the rollout once this many targets failed (multiple targets only).
+--error-report-timeout=<seconds> Wait at most this long for error reports after a failure [default: 10].
+--socket=<socket_path>      Submit the request to the controller daemon listening on this socket.
+--info-cache-ttl=<seconds>  Cache info documents this long, then revalidate them with the broadcaster.
+--info-cache-dir=<directory> Keep the info cache in this directory, to share it between runs (requires a TTL).
+--stream                    Write the info while it is received instead of buffering it (single target only).
+--fields=<fields>           Stream only these comma separated fields of the info, e.g. hosts,services.state.
+--json-output=<file>        Write the events and the summary of executions as JSON lines to this file (- for stdout).
+--timings-file=<file>       Write the durations of the phases of executions to this file.
+--timings-format=<format>   Format of the timings file, prometheus (textfile collector) or statsd [default: prometheus].
+--metrics-file=<file>       Write Prometheus metrics of the executions to this file (textfile collector).
+--metrics-port=<port>       Serve Prometheus metrics via HTTP on this port (serve only).
+--record-events=<file>      Append the raw broadcaster events to this journal (see yadtcontroller-replay).
 
 """
 
@@ -51,91 +78,480 @@ BROADCASTER_HOST_OPTION = '--broadcaster-host'
 PENDING_TIMEOUT_ARGUMENT = '<pending_timeout>'
 WAITING_TIMEOUT_ARGUMENT = '<waiting_timeout>'
 TARGET_ARGUMENT = '<target>'
+TARGETS_FILE_OPTION = '--targets-file'
+TARGET_SEPARATOR = ','
+MAX_IN_FLIGHT_OPTION = '--max-in-flight'
+MAX_FAILURES_OPTION = '--max-failures'
+ERROR_REPORT_TIMEOUT_OPTION = '--error-report-timeout'
 COMMAND_ARGUMENT = '<cmd>'
 ARGUMENT_ARGUMENT = '<args>'
 INFO_COMMAND = 'info'
+SERVE_COMMAND = 'serve'
+SOCKET_PATH_ARGUMENT = '<socket_path>'
+SOCKET_OPTION = '--socket'
+INFO_CACHE_TTL_OPTION = '--info-cache-ttl'
+INFO_CACHE_DIRECTORY_OPTION = '--info-cache-dir'
+STREAM_OPTION = '--stream'
+FIELDS_OPTION = '--fields'
+FIELD_SEPARATOR = ','
+JSON_OUTPUT_OPTION = '--json-output'
+TIMINGS_FILE_OPTION = '--timings-file'
+TIMINGS_FORMAT_OPTION = '--timings-format'
+METRICS_FILE_OPTION = '--metrics-file'
+METRICS_PORT_OPTION = '--metrics-port'
+RECORD_EVENTS_OPTION = '--record-events'
 
 MINIMAL_WAITING_TIMEOUT = 30
+DEFAULT_INFO_WORKERS = 10
 
+import json
 import sys
+from collections import namedtuple
 from logging import basicConfig, INFO, DEBUG, WARN, getLogger
 
-from docopt import docopt, parse_defaults
+from docopt import DocoptExit, docopt, parse_defaults
 
-from configuration import BROADCASTER_HOST_KEY, BROADCASTER_PORT_KEY, TARGET_KEY, load
-from yadt_controller.event_handler import EventHandler
+from configuration import (BROADCASTER_HOST_KEY, BROADCASTER_PORT_KEY, BROADCASTER_ENDPOINTS_KEY, TARGET_KEY, load,
+                           parse_endpoints)
 from yadt_controller.tracking import generate_tracking_id
-from yadt_controller.terminal import TeamCityProgressMessageHandler
-from yadt_controller.rest_api import TargetInfoEndpoint, EndpointException
+from yadt_controller.terminal import (TeamCityProgressMessageHandler, CombinedResultReporter,
+                                      open_json_lines_result_reporter)
+
+# Twisted, the WAMP client and requests take most of the start up time. They
+# are imported by the code paths needing them only, so that --help, --version
+# and info do not pay for the WAMP client.
+
+ControllerOptions = namedtuple('ControllerOptions', ['broadcaster_host',
+                                                     'broadcaster_port',
+                                                     'broadcaster_endpoints',
+                                                     'target',
+                                                     'targets',
+                                                     'info',
+                                                     'waiting_timeout',
+                                                     'pending_timeout',
+                                                     'command',
+                                                     'arguments',
+                                                     'teamcity',
+                                                     'verbose',
+                                                     'quiet',
+                                                     'max_in_flight',
+                                                     'max_failures',
+                                                     'error_report_timeout',
+                                                     'serve_socket',
+                                                     'daemon_socket',
+                                                     'info_cache_ttl',
+                                                     'info_cache_directory',
+                                                     'stream',
+                                                     'fields',
+                                                     'json_output',
+                                                     'timings_file',
+                                                     'timings_format',
+                                                     'metrics_file',
+                                                     'metrics_port',
+                                                     'record_events'])
+
+_cached_defaults = None
 
 
 def run():
     basicConfig(format='%(asctime)s [%(levelname)7s] %(message)s')
     getLogger().setLevel(INFO)
 
-    parsed_options = docopt(__doc__, version=__version__)
+    options = parse_options()
 
-    _apply_log_level_configuration_from_options(parsed_options)
+    _apply_log_level_configuration_from_options(options)
 
-    config = _determine_configuration()
+    logger = getLogger('yadt_controller')
 
-    event_handler = EventHandler(
-        config[BROADCASTER_HOST_KEY], config[BROADCASTER_PORT_KEY], config[TARGET_KEY])
+    if options.serve_socket:
+        _serve(options, logger)
+        return
 
-    progress_handler = None
-    if parsed_options.get('--teamcity'):
-        progress_handler = TeamCityProgressMessageHandler()
+    if options.daemon_socket:
+        _submit_to_daemon(options, logger)
+        return
 
-    logger = getLogger('yadt_controller')
+    if options.info:
+        _request_info(options, logger)
+        return
 
-    if parsed_options.get(INFO_COMMAND):
-        waiting_timeout = int(parsed_options.get(WAITING_TIMEOUT_ARGUMENT))
-        logger.debug('Requesting info on target {0}.'.format(
-            event_handler.target))
-        try:
-            endpoint = TargetInfoEndpoint(event_handler.target,
-                                          event_handler.host,
-                                          event_handler.port)
-            print(endpoint.fetch(waiting_timeout))
-        except EndpointException as e:
-            logger.error(e)
-            sys.exit(1)
-
-    if parsed_options.get(COMMAND_ARGUMENT):
-        waiting_timeout = int(parsed_options[WAITING_TIMEOUT_ARGUMENT])
-        if waiting_timeout < MINIMAL_WAITING_TIMEOUT:
-            message = ('Given waiting timeout (%rs) is less than minimal allowed timeout (%rs), ' +
-                       'using the minimal timeout instead.')
-            logger.warning(
-                message % (waiting_timeout,
-                           MINIMAL_WAITING_TIMEOUT))
-            waiting_timeout = MINIMAL_WAITING_TIMEOUT
-        pending_timeout = int(parsed_options[PENDING_TIMEOUT_ARGUMENT])
-        command_to_execute = parsed_options[COMMAND_ARGUMENT]
-        arguments = parsed_options[ARGUMENT_ARGUMENT]
+    from yadt_controller.event_handler import EventHandler, DEFAULT_ERROR_REPORT_TIMEOUT
+
+    event_handler = EventHandler(
+        options.broadcaster_host, options.broadcaster_port, options.target, endpoints=options.broadcaster_endpoints)
+
+    progress_handler = None
+    if options.teamcity:
+        from twisted.internet import reactor
+
+        progress_handler = TeamCityProgressMessageHandler(reactor)
+
+    if options.command:
+        waiting_timeout = _determine_waiting_timeout(options.waiting_timeout, logger)
+        arguments = list(options.arguments)
+        error_report_timeout = options.error_report_timeout
+        if error_report_timeout is None:
+            error_report_timeout = DEFAULT_ERROR_REPORT_TIMEOUT
+        metrics = _create_metrics(options)
+        result_reporter = _create_result_reporter(options, metrics)
+        event_journal = _create_event_journal(options)
+
+        if options.targets:
+            from yadt_controller.multi_target import MultiTargetExecution
+
+            logger.debug('Requesting execution of {0} with arguments {1} on targets {2}.'.format(
+                options.command, arguments, ', '.join(options.targets)))
+            execution = MultiTargetExecution(options.broadcaster_host,
+                                             options.broadcaster_port,
+                                             list(options.targets),
+                                             max_in_flight=options.max_in_flight,
+                                             max_failures=options.max_failures,
+                                             endpoints=options.broadcaster_endpoints)
+            if metrics is not None:
+                metrics.add_event_source(execution.event_dispatcher)
+            execution.initialize_for_execution_request(
+                waiting_timeout=waiting_timeout,
+                pending_timeout=options.pending_timeout,
+                command_to_execute=options.command,
+                arguments=arguments,
+                progress_handler=progress_handler,
+                error_report_timeout=error_report_timeout,
+                result_reporter=result_reporter,
+                event_journal=event_journal)
+            return
 
         tracking_id = _add_generated_tracking_id_to_arguments(
             arguments, event_handler)
+        if metrics is not None:
+            metrics.add_event_source(event_handler)
 
         message = ('Requesting execution of {0} with arguments {1} on target {2}. Will wait {3} seconds for the ' +
                    'command to start, and {4} seconds for the command to complete.')
-        logger.debug(message.format(command_to_execute,
+        logger.debug(message.format(options.command,
                                     arguments,
                                     event_handler.target,
                                     waiting_timeout,
-                                    pending_timeout))
+                                    options.pending_timeout))
 
         event_handler.initialize_for_execution_request(
             waiting_timeout=waiting_timeout,
-            pending_timeout=pending_timeout,
-            command_to_execute=command_to_execute,
+            pending_timeout=options.pending_timeout,
+            command_to_execute=options.command,
             arguments=arguments,
             tracking_id=tracking_id,
-            progress_handler=progress_handler)
+            progress_handler=progress_handler,
+            error_report_timeout=error_report_timeout,
+            result_reporter=result_reporter,
+            event_journal=event_journal)
+
 
+def parse_options():
+    """
+        Parses the command line and the configuration file once.
 
-def _determine_configuration():
+        @return: ControllerOptions holding everything run() needs.
+    """
     parsed_options = docopt(__doc__, version=__version__)
+    config = _determine_configuration(parsed_options)
+
+    targets = None
+    multi_target_capable = parsed_options.get(COMMAND_ARGUMENT) or parsed_options.get(INFO_COMMAND)
+    if multi_target_capable and _is_multi_target_request(parsed_options):
+        targets = tuple(_determine_targets(parsed_options))
+        if not targets:
+            raise DocoptExit('no targets given')
+    if targets and (parsed_options.get(STREAM_OPTION) or parsed_options.get(FIELDS_OPTION)):
+        raise DocoptExit('{0} and {1} need a single target.'.format(STREAM_OPTION, FIELDS_OPTION))
+
+    return ControllerOptions(broadcaster_host=config[BROADCASTER_HOST_KEY],
+                             broadcaster_port=config[BROADCASTER_PORT_KEY],
+                             broadcaster_endpoints=config[BROADCASTER_ENDPOINTS_KEY],
+                             target=config[TARGET_KEY],
+                             targets=targets,
+                             info=bool(parsed_options.get(INFO_COMMAND)),
+                             waiting_timeout=_get_optional_int(parsed_options, WAITING_TIMEOUT_ARGUMENT),
+                             pending_timeout=_get_optional_int(parsed_options, PENDING_TIMEOUT_ARGUMENT),
+                             command=parsed_options.get(COMMAND_ARGUMENT),
+                             arguments=tuple(parsed_options.get(ARGUMENT_ARGUMENT) or ()),
+                             teamcity=bool(parsed_options.get('--teamcity')),
+                             verbose=bool(parsed_options.get('--verbose')),
+                             quiet=bool(parsed_options.get('--quiet')),
+                             max_in_flight=_get_optional_positive_int(parsed_options, MAX_IN_FLIGHT_OPTION),
+                             max_failures=_get_optional_positive_int(parsed_options, MAX_FAILURES_OPTION),
+                             error_report_timeout=_get_optional_int(parsed_options, ERROR_REPORT_TIMEOUT_OPTION),
+                             serve_socket=parsed_options.get(SOCKET_PATH_ARGUMENT) if parsed_options.get(
+                                 SERVE_COMMAND) else None,
+                             daemon_socket=parsed_options.get(SOCKET_OPTION),
+                             info_cache_ttl=_get_optional_int(parsed_options, INFO_CACHE_TTL_OPTION),
+                             info_cache_directory=parsed_options.get(INFO_CACHE_DIRECTORY_OPTION),
+                             stream=bool(parsed_options.get(STREAM_OPTION)),
+                             fields=_determine_fields(parsed_options),
+                             json_output=parsed_options.get(JSON_OUTPUT_OPTION),
+                             timings_file=parsed_options.get(TIMINGS_FILE_OPTION),
+                             timings_format=parsed_options.get(TIMINGS_FORMAT_OPTION),
+                             metrics_file=parsed_options.get(METRICS_FILE_OPTION),
+                             metrics_port=_get_optional_int(parsed_options, METRICS_PORT_OPTION),
+                             record_events=parsed_options.get(RECORD_EVENTS_OPTION))
+
+
+def _create_metrics(options):
+    if not options.metrics_file:
+        return None
+    from yadt_controller.metrics import ControllerMetrics
+
+    return ControllerMetrics(options.metrics_file)
+
+
+def _create_result_reporter(options, metrics=None):
+    reporters = []
+    if options.json_output:
+        reporters.append(open_json_lines_result_reporter(options.json_output))
+    if options.timings_file:
+        from yadt_controller.timing import PhaseTimingsFile, PROMETHEUS_FORMAT
+
+        reporters.append(PhaseTimingsFile(options.timings_file, options.timings_format or PROMETHEUS_FORMAT))
+    if metrics is not None:
+        reporters.append(metrics)
+    if not reporters:
+        return None
+    if len(reporters) == 1:
+        return reporters[0]
+    return CombinedResultReporter(reporters)
+
+
+def _create_event_journal(options):
+    if not options.record_events:
+        return None
+    from yadt_controller.journal import open_event_journal
+
+    return open_event_journal(options.record_events)
+
+
+def _request_info(options, logger):
+    if options.targets:
+        _request_info_on_targets(options, logger)
+        return
+
+    from yadt_controller.rest_api import TargetInfoEndpoint, EndpointException, select_endpoint
+
+    logger.debug('Requesting info on target {0}.'.format(options.target))
+    try:
+        host, port = select_endpoint(options.broadcaster_endpoints)
+        endpoint = TargetInfoEndpoint(options.target,
+                                      host,
+                                      int(port),
+                                      cache=_create_info_cache(options))
+        if options.stream or options.fields:
+            _stream_info(endpoint, options)
+        else:
+            print(endpoint.fetch(options.waiting_timeout))
+    except EndpointException as e:
+        logger.error(e)
+        sys.exit(1)
+    except ValueError as e:
+        logger.error('The info of {0} is no valid JSON : {1}'.format(options.target, e))
+        sys.exit(1)
+
+
+def _stream_info(endpoint, options):
+    chunks = endpoint.stream(options.waiting_timeout)
+    if not options.fields:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        return
+
+    from yadt_controller.json_stream import project
+
+    for field, value in project(chunks, options.fields):
+        print(json.dumps({'field': field, 'value': value}, sort_keys=True))
+        sys.stdout.flush()
+
+
+def _request_info_on_targets(options, logger):
+    from yadt_controller.rest_api import configure_pool_size, fetch_target_infos, select_endpoint, EndpointException
+
+    max_workers = options.max_in_flight
+    if max_workers is None:
+        max_workers = DEFAULT_INFO_WORKERS
+    logger.debug('Requesting info on {0} targets, at most {1} at a time.'.format(len(options.targets), max_workers))
+    configure_pool_size(max_workers)
+    try:
+        host, port = select_endpoint(options.broadcaster_endpoints)
+    except EndpointException as e:
+        logger.error(e)
+        sys.exit(1)
+
+    failed_targets = []
+    for target_info in fetch_target_infos(options.targets,
+                                          host,
+                                          int(port),
+                                          options.waiting_timeout,
+                                          max_workers=max_workers,
+                                          cache=_create_info_cache(options)):
+        if target_info.error is not None:
+            failed_targets.append(target_info.target)
+        print(_format_target_info(target_info))
+        sys.stdout.flush()
+
+    if failed_targets:
+        logger.error('Could not fetch the info of {0} of {1} targets: {2}'.format(len(failed_targets),
+                                                                                  len(options.targets),
+                                                                                  ', '.join(failed_targets)))
+        sys.exit(1)
+
+
+def _format_target_info(target_info):
+    info = target_info.info
+    if info is not None:
+        try:
+            info = json.loads(info)
+        except ValueError:
+            pass
+    error = None
+    if target_info.error is not None:
+        error = str(target_info.error)
+    return json.dumps({'target': target_info.target, 'info': info, 'error': error}, sort_keys=True)
+
+
+def _create_info_cache(options):
+    if options.info_cache_ttl is None:
+        return None
+    from yadt_controller.info_cache import InfoCache
+
+    return InfoCache(ttl_in_seconds=options.info_cache_ttl, directory=options.info_cache_directory)
+
+
+def _serve(options, logger):
+    from yadt_controller.daemon import ControllerDaemon
+
+    logger.debug('Serving requests on {0}.'.format(options.serve_socket))
+    ControllerDaemon(options.broadcaster_host,
+                     options.broadcaster_port,
+                     options.serve_socket,
+                     info_cache=_create_info_cache(options),
+                     metrics_port=options.metrics_port,
+                     endpoints=options.broadcaster_endpoints).serve()
+
+
+def _submit_to_daemon(options, logger):
+    import socket
+    from yadt_controller import socket_api
+
+    if options.targets:
+        logger.error('The controller daemon accepts one target per request.')
+        sys.exit(1)
+
+    if options.info:
+        request = socket_api.create_info_request(options.target, options.waiting_timeout)
+    else:
+        request = socket_api.create_execution_request(options.target,
+                                                      options.command,
+                                                      options.arguments,
+                                                      _determine_waiting_timeout(options.waiting_timeout, logger),
+                                                      options.pending_timeout,
+                                                      options.error_report_timeout)
+    progress_handler = None
+    if options.teamcity:
+        progress_handler = TeamCityProgressMessageHandler()
+    commandline = ' '.join([options.command or ''] + list(options.arguments))
+
+    try:
+        for message in socket_api.submit(options.daemon_socket, request):
+            message_type = message.get('type')
+            if message_type == socket_api.ACCEPTED_MESSAGE:
+                logger.info("Requesting: '{0}' on target {1}".format(commandline, message.get('target')))
+            elif message_type == socket_api.PROGRESS_MESSAGE:
+                if progress_handler:
+                    # the daemon sends one progress message at a time
+                    progress_handler.output_progress(sys.stdout, message.get('text'))
+                    progress_handler.flush()
+                else:
+                    logger.info(message.get('text'))
+            elif message_type == socket_api.INFO_MESSAGE:
+                print(message.get('info'))
+                return
+            elif message_type == socket_api.RESULT_MESSAGE:
+                if message.get('log_file'):
+                    logger.info('Logfile on {0} is at : {1}'.format(message.get('remote_host'),
+                                                                    message.get('log_file')))
+                if message.get('error_report'):
+                    logger.error('*' * 5 + 'Error report' + '*' * 5)
+                    for error_message_line in message.get('error_report').split('\n'):
+                        logger.error(error_message_line)
+                    logger.error('See also full log on {0} : {1}'.format(message.get('remote_host'),
+                                                                         message.get('log_file')))
+                exit_code = message.get('exit_code')
+                logger.info("{0}: '{1}' on target {2}".format('Success' if exit_code == 0 else 'FAILED',
+                                                              commandline, message.get('target')))
+                sys.exit(exit_code)
+            elif message_type == socket_api.ERROR_MESSAGE:
+                logger.error(message.get('error'))
+                sys.exit(1)
+    except socket.error as e:
+        logger.error('Cannot reach the controller daemon on {0} : {1}'.format(options.daemon_socket, e))
+        sys.exit(1)
+
+    logger.error('The controller daemon closed the connection without a result.')
+    sys.exit(1)
+
+
+def _determine_waiting_timeout(waiting_timeout, logger):
+    if waiting_timeout < MINIMAL_WAITING_TIMEOUT:
+        message = ('Given waiting timeout (%rs) is less than minimal allowed timeout (%rs), ' +
+                   'using the minimal timeout instead.')
+        logger.warning(
+            message % (waiting_timeout,
+                       MINIMAL_WAITING_TIMEOUT))
+        waiting_timeout = MINIMAL_WAITING_TIMEOUT
+    return waiting_timeout
+
+
+def _is_multi_target_request(parsed_options):
+    if parsed_options.get(TARGETS_FILE_OPTION):
+        return True
+    return TARGET_SEPARATOR in (parsed_options.get(TARGET_ARGUMENT) or '')
+
+
+def _determine_fields(parsed_options):
+    if not parsed_options.get(FIELDS_OPTION):
+        return None
+    fields = [field.strip() for field in parsed_options[FIELDS_OPTION].split(FIELD_SEPARATOR)]
+    return tuple(field for field in fields if field)
+
+
+def _get_optional_int(parsed_options, option):
+    value = parsed_options.get(option)
+    if value is None:
+        return None
+    return int(value)
+
+
+def _get_optional_positive_int(parsed_options, option):
+    value = _get_optional_int(parsed_options, option)
+    if value is not None and value < 1:
+        raise DocoptExit('{0} must be at least 1.'.format(option))
+    return value
+
+
+def _determine_targets(parsed_options):
+    if parsed_options.get(TARGETS_FILE_OPTION):
+        from yadt_controller.multi_target import read_targets_file
+
+        targets = read_targets_file(parsed_options[TARGETS_FILE_OPTION])
+    else:
+        targets = parsed_options[TARGET_ARGUMENT].split(TARGET_SEPARATOR)
+
+    unique_targets = []
+    for target in targets:
+        target = target.strip()
+        if target and target not in unique_targets:
+            unique_targets.append(target)
+    return unique_targets
+
+
+def _determine_configuration(parsed_options):
     defaults = _get_defaults()
 
     configuration_file_name = parsed_options[CONFIG_FILE_OPTION]
@@ -144,26 +560,37 @@ def _determine_configuration():
 
     config[TARGET_KEY] = parsed_options[TARGET_ARGUMENT]
 
-    if defaults[BROADCASTER_HOST_OPTION] != parsed_options[BROADCASTER_HOST_OPTION]:
-        config[BROADCASTER_HOST_KEY] = parsed_options[BROADCASTER_HOST_OPTION]
+    host_overridden = defaults[BROADCASTER_HOST_OPTION] != parsed_options[BROADCASTER_HOST_OPTION]
+    port_overridden = defaults[BROADCASTER_PORT_OPTION] != parsed_options[BROADCASTER_PORT_OPTION]
+
+    if port_overridden:
+        config[BROADCASTER_PORT_KEY] = int(parsed_options[BROADCASTER_PORT_OPTION])
 
-    if defaults[BROADCASTER_PORT_OPTION] != parsed_options[BROADCASTER_PORT_OPTION]:
-        config[BROADCASTER_PORT_KEY] = parsed_options[BROADCASTER_PORT_OPTION]
+    if host_overridden:
+        config[BROADCASTER_ENDPOINTS_KEY] = parse_endpoints(parsed_options[BROADCASTER_HOST_OPTION],
+                                                            config[BROADCASTER_PORT_KEY])
+    elif port_overridden:
+        config[BROADCASTER_ENDPOINTS_KEY] = [(host, config[BROADCASTER_PORT_KEY])
+                                             for host, _ in config[BROADCASTER_ENDPOINTS_KEY]]
+    config[BROADCASTER_HOST_KEY], config[BROADCASTER_PORT_KEY] = config[BROADCASTER_ENDPOINTS_KEY][0]
     return config
 
 
 def _get_defaults():
-    defaults = {}
-    for default in parse_defaults(__doc__):
-        if default.name in [BROADCASTER_HOST_OPTION, BROADCASTER_PORT_OPTION]:
-            defaults[default.name] = default.value
-    return defaults
-
-
-def _apply_log_level_configuration_from_options(parsed_options):
-    if parsed_options.get('--verbose'):
+    global _cached_defaults
+    if _cached_defaults is None:
+        defaults = {}
+        for default in parse_defaults(__doc__):
+            if default.name in [BROADCASTER_HOST_OPTION, BROADCASTER_PORT_OPTION]:
+                defaults[default.name] = default.value
+        _cached_defaults = defaults
+    return _cached_defaults
+
+
+def _apply_log_level_configuration_from_options(options):
+    if options.verbose:
         getLogger().setLevel(DEBUG)
-    if parsed_options.get('--quiet'):
+    if options.quiet:
         getLogger().setLevel(WARN)
 
 
@@ -0,0 +1,182 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        The broadcaster client reconnects on its own when the session drops,
+        backing off exponentially (1s, 2s, 4s, ... up to a minute). Events
+        published while disconnected are queued and sent on reconnect, but
+        only the target given to the client is subscribed again and the
+        session open handlers run only once. Subscriptions to further
+        targets would be lost with the first reconnect.
+
+        The ReconnectingWampBroadcaster runs reconnect handlers after every
+        session but the first one, so that those subscriptions can be
+        renewed, and publishes at most one execution request per tracking ID,
+        whether it is sent right away or queued until the reconnect.
+
+        Given several broadcasters, every connection attempt probes all of
+        them in parallel and connects to the one responding first, so that
+        a broadcaster going down is replaced on reconnect.
+
+        Subscribers are called with the event only, as WAMP v2 sessions do.
+        A WAMP v1 client, calling them with topic and event, is wrapped once
+        per session instead of inspecting the arguments of every event.
+"""
+
+import logging
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
+from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.protocol import Factory, Protocol
+from twisted.python.failure import Failure
+from yadtbroadcastclient import WampBroadcaster
+
+try:
+    from autobahn.wamp1.protocol import WampClientProtocol as Wamp1ClientProtocol
+except ImportError:  # autobahn without WAMP v1 support
+    Wamp1ClientProtocol = None
+
+
+logger = logging.getLogger('broadcaster')
+
+DEFAULT_PROBE_TIMEOUT = 2
+
+
+class NoBroadcasterResponded(Exception):
+    pass
+
+
+def is_wamp1_client(client):
+    return Wamp1ClientProtocol is not None and isinstance(client, Wamp1ClientProtocol)
+
+
+class Wamp1ClientAdapter(object):
+    """
+        Offers the subscribe and publish of a WAMP v2 session on a WAMP v1
+        client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def subscribe(self, handler, topic):
+        self.client.subscribe(topic, lambda _, event: handler(event))
+
+    def publish(self, topic, event):
+        self.client.publish(topic, event)
+
+
+def probe_endpoints(endpoints, timeout=DEFAULT_PROBE_TIMEOUT, connect=None):
+    """
+        Opens a TCP connection to every broadcaster at once.
+
+        @return: Deferred firing with the (host, port) of the first
+        broadcaster accepting the connection, failing with
+        NoBroadcasterResponded when none does.
+    """
+    connect = connect or _connect_tcp
+    probes = []
+    for endpoint in endpoints:
+        probe = connect(endpoint[0], endpoint[1], timeout)
+        probe.addCallback(_close_probe, endpoint)
+        probes.append(probe)
+    responded = DeferredList(probes, fireOnOneCallback=True, consumeErrors=True)
+    return responded.addCallback(_first_responder, endpoints)
+
+
+def _connect_tcp(host, port, timeout):
+    factory = Factory()
+    factory.protocol = Protocol
+    return TCP4ClientEndpoint(reactor, host, port, timeout=timeout).connect(factory)
+
+
+def _close_probe(protocol, endpoint):
+    protocol.transport.loseConnection()
+    return endpoint
+
+
+def _first_responder(result, endpoints):
+    if isinstance(result, tuple):
+        endpoint, _ = result
+        return endpoint
+    raise NoBroadcasterResponded('none of the broadcasters {0} responded'.format(
+        ', '.join('{0}:{1}'.format(host, port) for host, port in endpoints)))
+
+
+class ReconnectingWampBroadcaster(WampBroadcaster):
+
+    def __init__(self, host, port, target=None, endpoints=None):
+        self.endpoints = list(endpoints or [(host, port)])
+        self.probing = False
+        self.reconnect_handlers = []
+        self.sessions_opened = 0
+        self.published_tracking_ids = set()
+        super(ReconnectingWampBroadcaster, self).__init__(host, port, target)
+
+    def _connect(self):
+        if len(self.endpoints) < 2:
+            return super(ReconnectingWampBroadcaster, self)._connect()
+        if self.client or self.probing:
+            return
+        self.probing = True
+        probe_endpoints(self.endpoints).addBoth(self._connect_to_first_responder)
+
+    def _connect_to_first_responder(self, result):
+        self.probing = False
+        if isinstance(result, Failure):
+            logger.warning('Could not connect, %s', result.getErrorMessage())
+            return
+        self.host, self.port = result
+        self.url = 'ws://%s:%s/' % (self.host, self.port)
+        logger.debug('Connecting to broadcaster at %s', self.url)
+        super(ReconnectingWampBroadcaster, self)._connect()
+
+    def addOnReconnectHandler(self, handler):
+        self.reconnect_handlers.append(handler)
+
+    def onSessionOpen(self):
+        if is_wamp1_client(self.client):
+            self.client = Wamp1ClientAdapter(self.client)
+        self.sessions_opened += 1
+        reconnected = self.sessions_opened > 1
+        if reconnected:
+            logger.info('Reconnected to broadcaster at %s', self.url)
+        super(ReconnectingWampBroadcaster, self).onSessionOpen()
+        if reconnected:
+            for handler in list(self.reconnect_handlers):
+                handler()
+
+    def publish_request_for_target(self, target, cmd, args, tracking_id=None):
+        """
+            @return: False if a request with the same tracking ID was published
+            already, True otherwise.
+        """
+        if tracking_id is not None:
+            if tracking_id in self.published_tracking_ids:
+                logger.debug('Not publishing request %s again', tracking_id)
+                return False
+            self.published_tracking_ids.add(tracking_id)
+        super(ReconnectingWampBroadcaster, self).publish_request_for_target(target, cmd, args,
+                                                                            tracking_id=tracking_id)
+        return True
+
+    def forget_request(self, tracking_id):
+        """
+            Called once the execution is complete, long running controllers
+            would pile up tracking IDs otherwise.
+        """
+        self.published_tracking_ids.discard(tracking_id)
@@ -22,6 +22,13 @@
         [broadcaster]
         host = broadcaster.domain.tld
         port = 8081
+
+    host may list several broadcasters, separated by commas. The port is
+    used for all of them unless given with the host:
+
+        [broadcaster]
+        host = broadcaster1.domain.tld, broadcaster2.domain.tld:8082
+        port = 8081
 """
 
 __author__ = 'Marcel Wolf, Maximilien Riehl, Michael Gruber'
@@ -35,6 +42,7 @@ SECTION_BROADCASTER = 'broadcaster'
 
 BROADCASTER_HOST_KEY = 'broadcaster-host'
 BROADCASTER_PORT_KEY = 'broadcaster-port'
+BROADCASTER_ENDPOINTS_KEY = 'broadcaster-endpoints'
 TARGET_KEY = 'target'
 
 logger = getLogger('configuration')
@@ -80,6 +88,24 @@ class ControllerConfigLoader (object):
         return self._parser.read_configuration_file(filename)
 
 
+def parse_endpoints(hosts, port):
+    """
+        @return: list of (host, port) tuples, one per comma separated entry
+                 of hosts. Entries without a port get the given port.
+    """
+    endpoints = []
+    for entry in str(hosts).split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, separator, entry_port = entry.rpartition(':')
+        if separator and entry_port.isdigit() and ':' not in host:
+            endpoints.append((host, int(entry_port)))
+        else:
+            endpoints.append((entry, port))
+    return endpoints or [(hosts, port)]
+
+
 def load(filename, defaults=None):
     """
         loads configuration from a file.
@@ -93,7 +119,10 @@ def load(filename, defaults=None):
     except ConfigurationException as exception:
         logger.warn(str(exception))
 
-    configuration = {BROADCASTER_HOST_KEY: config_loader.get_broadcaster_host(),
-                     BROADCASTER_PORT_KEY: config_loader.get_broadcaster_port()}
+    endpoints = parse_endpoints(config_loader.get_broadcaster_host(), config_loader.get_broadcaster_port())
+    host, port = endpoints[0]
+    configuration = {BROADCASTER_HOST_KEY: host,
+                     BROADCASTER_PORT_KEY: port,
+                     BROADCASTER_ENDPOINTS_KEY: endpoints}
 
     return configuration
@@ -0,0 +1,265 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        The controller as a library: Controller.execute() returns a Deferred
+        firing with the ExecutionResult once the execution is complete.
+        The controller neither runs nor stops the reactor and never exits the
+        process, so it can be embedded in any program running a Twisted
+        reactor, e.g.
+
+            controller = Controller('broadcaster', 8081)
+            result = yield controller.execute('target', 'update', ['--foo'])
+
+        Any number of executions may run concurrently, they share one
+        broadcaster session. With the asyncio reactor, the Deferred can be
+        awaited from asyncio code via Deferred.asFuture(loop).
+
+        Programs without a reactor use the BlockingController, which runs
+        the reactor in a background thread and blocks until the result is
+        there:
+
+            controller = BlockingController('broadcaster', 8081)
+            for target in targets:
+                result = controller.execute(target, 'update')
+"""
+
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from functools import partial
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.threads import blockingCallFromThread
+from twisted.python.threadable import isInIOThread
+
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+from yadt_controller.event_handler import EventHandler, DEFAULT_ERROR_REPORT_TIMEOUT
+from yadt_controller.timing import CONNECTING
+from yadt_controller.tracking import generate_tracking_id
+
+
+logger = logging.getLogger('controller')
+
+DEFAULT_WAITING_TIMEOUT = 30
+DEFAULT_PENDING_TIMEOUT = 300
+
+ExecutionResult = namedtuple('ExecutionResult', ['target',
+                                                 'tracking_id',
+                                                 'command',
+                                                 'arguments',
+                                                 'exit_code',
+                                                 'state',
+                                                 'remote_host',
+                                                 'log_file',
+                                                 'error_report',
+                                                 'service_changes',
+                                                 'phases'])
+
+
+class Controller(object):
+    """
+        Executes commands over one broadcaster session, which is opened by
+        the first execution. Executions requested before the session is
+        open are published as soon as it is. When the session drops, the
+        broadcaster client reconnects and all targets are subscribed again.
+        Events published by the receivers in the meantime are lost, so
+        running executions may end with a timeout.
+    """
+
+    def __init__(self, host, port, result_reporter=None, endpoints=None, event_journal=None):
+        self.host = host
+        self.port = int(port)
+        self.endpoints = endpoints
+        self.result_reporter = result_reporter
+        self.event_journal = event_journal
+        self.event_dispatcher = TrackingIdDispatcher()
+        self.event_dispatcher.event_journal = event_journal
+        self.wamp_broadcaster = None
+        self.subscribed_targets = set()
+        self.session_open = False
+        self.unpublished_event_handlers = []
+
+    def connect(self, wamp_broadcaster=None):
+        """
+            Opens the broadcaster session, over the given broadcaster client
+            if any, e.g. a simulation.SimulatedBroadcaster.
+        """
+        if self.wamp_broadcaster is not None:
+            return
+        if wamp_broadcaster is None:
+            wamp_broadcaster = ReconnectingWampBroadcaster(self.host, self.port, endpoints=self.endpoints)
+        self.wamp_broadcaster = wamp_broadcaster
+        self.wamp_broadcaster.onEvent = self.event_dispatcher.dispatch
+        self.wamp_broadcaster.addOnSessionOpenHandler(self.on_session_open)
+        self.wamp_broadcaster.addOnReconnectHandler(self.on_reconnect)
+
+    def execute(self, target, command, arguments=(), waiting_timeout=DEFAULT_WAITING_TIMEOUT,
+                pending_timeout=DEFAULT_PENDING_TIMEOUT, error_report_timeout=DEFAULT_ERROR_REPORT_TIMEOUT,
+                progress_handler=None, tracking_id=None):
+        """
+            @return: Deferred firing with the ExecutionResult, whether the
+            command succeeded or not.
+        """
+        if tracking_id is None:
+            tracking_id = generate_tracking_id(target)
+        arguments = list(arguments)
+        arguments.append('--tracking-id={0}'.format(tracking_id))
+
+        if tracking_id in self.event_dispatcher.event_handlers:
+            return fail(ValueError('tracking ID {0} is already in use'.format(tracking_id)))
+
+        event_handler = EventHandler(self.host, self.port, target)
+        completed = Deferred()
+        event_handler.completion_callback = partial(self.on_execution_complete, event_handler, completed)
+        event_handler.prepare_execution_request(waiting_timeout=waiting_timeout,
+                                                pending_timeout=pending_timeout,
+                                                command_to_execute=command,
+                                                arguments=arguments,
+                                                tracking_id=tracking_id,
+                                                progress_handler=progress_handler,
+                                                error_report_timeout=error_report_timeout,
+                                                result_reporter=self.result_reporter,
+                                                event_journal=self.event_journal)
+        self.event_dispatcher.register(event_handler)
+        event_handler.display_summary('Requesting')
+
+        self.connect()
+        event_handler.wamp_broadcaster = self.wamp_broadcaster
+        self.subscribe(target)
+        if self.session_open:
+            event_handler.publish_execution_request()
+        else:
+            event_handler.timings.mark(CONNECTING)
+            self.unpublished_event_handlers.append(event_handler)
+        return completed
+
+    def on_session_open(self):
+        self.session_open = True
+        for target in self.subscribed_targets:
+            self._subscribe_to_broadcaster(target)
+        unpublished_event_handlers, self.unpublished_event_handlers = self.unpublished_event_handlers, []
+        for event_handler in unpublished_event_handlers:
+            event_handler.on_session_open()
+
+    def on_reconnect(self):
+        running_executions = len(self.event_dispatcher.event_handlers)
+        if running_executions:
+            logger.warning('Broadcaster session was lost, events of {0} running executions may be missing'.format(
+                running_executions))
+        for target in self.subscribed_targets:
+            self._subscribe_to_broadcaster(target)
+
+    def on_execution_complete(self, event_handler, completed):
+        self.event_dispatcher.unregister(event_handler)
+        self.wamp_broadcaster.forget_request(event_handler.tracking_id)
+        if self.event_journal is not None:
+            self.event_journal.flush()
+        event_handler.display_summary('Success' if event_handler.exit_code == 0 else 'FAILED')
+        completed.callback(ExecutionResult(target=event_handler.target,
+                                           tracking_id=event_handler.tracking_id,
+                                           command=event_handler.command_to_execute,
+                                           arguments=event_handler.get_short_arguments(),
+                                           exit_code=event_handler.exit_code,
+                                           state=event_handler.execution_state_machine.current,
+                                           remote_host=event_handler.remote_host,
+                                           log_file=event_handler.remote_log_file,
+                                           error_report=event_handler.error_report,
+                                           service_changes=event_handler.service_changes,
+                                           phases=event_handler.timings.phases()))
+
+    def close(self):
+        """
+            Closes the event journal, call it once no execution is running
+            any more.
+        """
+        if self.event_journal is not None:
+            self.event_journal.close()
+
+    def subscribe(self, target):
+        if target in self.subscribed_targets:
+            return
+        self.subscribed_targets.add(target)
+        if self.session_open:
+            self._subscribe_to_broadcaster(target)
+
+    def _subscribe_to_broadcaster(self, target):
+        if self.wamp_broadcaster.client is None:
+            # disconnected, subscribed again on reconnect
+            return
+        logger.debug('Subscribing to {0}'.format(target))
+        self.wamp_broadcaster.client.subscribe(self.event_dispatcher.dispatch, target)
+
+
+class BlockingController(object):
+    """
+        Runs executions for threads outside of the reactor and blocks until
+        they are complete. The first execution starts the reactor in a
+        daemon thread (unless it is running already), where it keeps
+        running, since a reactor cannot be restarted once stopped. Any
+        number of threads may execute at the same time.
+    """
+
+    def __init__(self, host, port, result_reporter=None, endpoints=None, event_journal=None):
+        self.controller = Controller(host, port, result_reporter=result_reporter, endpoints=endpoints,
+                                     event_journal=event_journal)
+        self.reactor_thread = None
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def execute(self, target, command, arguments=(), **execution_options):
+        """
+            Takes the same options as Controller.execute.
+
+            @return: the ExecutionResult.
+        """
+        if reactor.running and isInIOThread():
+            raise RuntimeError('BlockingController would block the reactor, use Controller instead')
+        if self.stopped:
+            raise RuntimeError('BlockingController was stopped, the reactor cannot be restarted')
+        self._start_reactor()
+        return blockingCallFromThread(reactor, self.controller.execute, target, command, arguments,
+                                      **execution_options)
+
+    def stop(self):
+        """
+            Stops the reactor started by this controller and closes the event
+            journal, no executions are possible afterwards. Called when the
+            interpreter exits.
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            reactor_thread, self.reactor_thread = self.reactor_thread, None
+        if reactor_thread is not None:
+            reactor.callFromThread(reactor.stop)
+            reactor_thread.join()
+        self.controller.close()
+
+    def _start_reactor(self):
+        with self.lock:
+            if self.reactor_thread is not None or reactor.running:
+                return
+            self.reactor_thread = threading.Thread(target=reactor.run,
+                                                   kwargs={'installSignalHandlers': False},
+                                                   name='yadtcontroller-reactor')
+            self.reactor_thread.daemon = True
+            self.reactor_thread.start()
+        atexit.register(self.stop)
@@ -0,0 +1,182 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        The controller daemon keeps one broadcaster session open and accepts
+        execution and info requests on a Unix domain socket, so that callers
+        issuing many short commands do not pay for connecting to the
+        broadcaster every time. The protocol is described in
+        yadt_controller.socket_api.
+"""
+
+import logging
+from functools import partial
+
+from twisted.internet import reactor
+from twisted.internet.protocol import Factory
+from twisted.internet.threads import deferToThread
+from twisted.protocols.basic import LineReceiver
+from twisted.web.server import Site
+
+from yadt_controller.controller import Controller
+from yadt_controller.event_handler import DEFAULT_ERROR_REPORT_TIMEOUT
+from yadt_controller.metrics import ControllerMetrics, create_metrics_resource
+from yadt_controller.rest_api import TargetInfoEndpoint, select_endpoint
+from yadt_controller.socket_api import (EXECUTE_REQUEST, INFO_REQUEST, ACCEPTED_MESSAGE, PROGRESS_MESSAGE,
+                                        RESULT_MESSAGE, INFO_MESSAGE, ERROR_MESSAGE, LINE_DELIMITER,
+                                        encode_message, decode_message)
+from yadt_controller.tracking import generate_tracking_id, get_identity
+
+
+logger = logging.getLogger('daemon')
+
+SOCKET_MODE = 0o660
+
+
+class ControllerRequestProtocol(LineReceiver):
+    """
+        One client connection carrying exactly one request. The protocol
+        doubles as the progress handler of the execution it requested, so
+        that progress messages are streamed back to the client.
+    """
+
+    delimiter = LINE_DELIMITER
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+        self.request_received = False
+
+    def lineReceived(self, line):
+        if self.request_received:
+            return
+        self.request_received = True
+        try:
+            request = decode_message(line)
+            self.daemon.handle_request(request, self)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warn('Refusing invalid request %r : %s', line, e)
+            self.finish({'type': ERROR_MESSAGE, 'error': 'invalid request: {0}'.format(e)})
+
+    def send_message(self, message):
+        if self.connected:
+            self.sendLine(encode_message(message))
+
+    def finish(self, message):
+        self.send_message(message)
+        if self.connected:
+            self.transport.loseConnection()
+
+    def output_progress(self, stream, message):
+        self.send_message({'type': PROGRESS_MESSAGE, 'text': message})
+
+    def flush(self):
+        pass
+
+
+class ControllerRequestFactory(Factory):
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def buildProtocol(self, address):
+        return ControllerRequestProtocol(self.daemon)
+
+
+class ControllerDaemon(object):
+
+    def __init__(self, host, port, socket_path, info_cache=None, metrics_port=None, endpoints=None):
+        self.host = host
+        self.port = int(port)
+        self.endpoints = endpoints or [(host, self.port)]
+        self.socket_path = socket_path
+        self.info_cache = info_cache
+        self.metrics_port = metrics_port
+        self.metrics = None
+        if metrics_port is not None:
+            self.metrics = ControllerMetrics()
+        self.controller = Controller(host, port, result_reporter=self.metrics, endpoints=endpoints)
+        if self.metrics is not None:
+            self.metrics.add_event_source(self.controller.event_dispatcher)
+
+    def serve(self):
+        self.controller.connect()
+        # resolves the host name before the first execution needs it
+        reactor.callInThread(get_identity)
+        reactor.listenUNIX(self.socket_path, ControllerRequestFactory(self), mode=SOCKET_MODE, wantPID=True)
+        logger.info('Listening on {0}, broadcaster is {1}:{2}'.format(self.socket_path, self.host, self.port))
+        if self.metrics is not None:
+            reactor.listenTCP(self.metrics_port, Site(create_metrics_resource(self.metrics)))
+            logger.info('Serving metrics on port {0}'.format(self.metrics_port))
+        reactor.run()
+
+    def handle_request(self, request, client):
+        request_type = request['request']
+        if request_type == EXECUTE_REQUEST:
+            self.execute(request, client)
+        elif request_type == INFO_REQUEST:
+            self.request_info(request, client)
+        else:
+            raise ValueError('unknown request {0!r}'.format(request_type))
+
+    def execute(self, request, client):
+        target = request['target']
+        error_report_timeout = request.get('error_report_timeout')
+        if error_report_timeout is None:
+            error_report_timeout = DEFAULT_ERROR_REPORT_TIMEOUT
+        # invalid requests are refused before they are accepted
+        command = request.get('command')
+        if not command:
+            raise ValueError('missing command')
+        waiting_timeout = int(request['waiting_timeout'])
+        pending_timeout = int(request['pending_timeout'])
+        error_report_timeout = int(error_report_timeout)
+        tracking_id = generate_tracking_id(target)
+        client.send_message({'type': ACCEPTED_MESSAGE, 'target': target, 'tracking_id': tracking_id})
+        completed = self.controller.execute(target,
+                                            command,
+                                            request.get('arguments') or [],
+                                            waiting_timeout=waiting_timeout,
+                                            pending_timeout=pending_timeout,
+                                            error_report_timeout=error_report_timeout,
+                                            progress_handler=client,
+                                            tracking_id=tracking_id)
+        completed.addCallbacks(partial(self._send_result, client), partial(self._send_error, client))
+        return completed
+
+    def request_info(self, request, client):
+        # fetching is blocking, keep the reactor (and thus other executions) going
+        deferred = deferToThread(self._fetch_info, request['target'], request.get('timeout') or 5)
+        deferred.addCallbacks(partial(self._send_info, client), partial(self._send_error, client))
+        return deferred
+
+    def _fetch_info(self, target, timeout_in_seconds):
+        host, port = select_endpoint(self.endpoints)
+        return TargetInfoEndpoint(target, host, port, cache=self.info_cache).fetch(timeout_in_seconds)
+
+    def _send_result(self, client, result):
+        client.finish({'type': RESULT_MESSAGE,
+                       'target': result.target,
+                       'tracking_id': result.tracking_id,
+                       'exit_code': result.exit_code,
+                       'remote_host': result.remote_host,
+                       'log_file': result.log_file,
+                       'error_report': result.error_report})
+
+    def _send_info(self, client, info):
+        client.finish({'type': INFO_MESSAGE, 'info': info})
+
+    def _send_error(self, client, failure):
+        client.finish({'type': ERROR_MESSAGE, 'error': str(failure.value)})
@@ -0,0 +1,51 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        Routes broadcaster events to the event handler owning their tracking
+        ID. Events of foreign executions (other operators, other controllers)
+        are dropped with a single dictionary lookup.
+"""
+
+
+class TrackingIdDispatcher(object):
+
+    def __init__(self):
+        self.event_handlers = {}
+        self.dispatched_events = 0
+        self.dropped_events = 0
+        self.event_journal = None
+
+    def register(self, event_handler):
+        tracking_id = event_handler.tracking_id
+        registered_handler = self.event_handlers.get(tracking_id)
+        if registered_handler is not None and registered_handler is not event_handler:
+            raise ValueError('tracking ID {0} is already in use'.format(tracking_id))
+        self.event_handlers[tracking_id] = event_handler
+
+    def unregister(self, event_handler):
+        if self.event_handlers.get(event_handler.tracking_id) is event_handler:
+            del self.event_handlers[event_handler.tracking_id]
+
+    def dispatch(self, event):
+        if self.event_journal is not None:
+            self.event_journal.record(event)
+        event_handler = self.event_handlers.get(event.get('tracking_id'))
+        if event_handler is None:
+            self.dropped_events += 1
+            return
+        self.dispatched_events += 1
+        event_handler.handle_event(event)
@@ -27,16 +27,20 @@ from __future__ import print_function
 import logging
 import sys
 
-from yadtbroadcastclient import WampBroadcaster
 from twisted.internet import reactor
 
 from execution_state_machine import create_execution_state_machine_with_callbacks
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from yadt_controller.timing import (ExecutionTimings, format_phases, CONNECTING, SESSION_OPEN, PUBLISHED, STARTED,
+                                    FINISHED, FAILED, COMPLETED)
 
 
 logger = logging.getLogger('event_handler')
 broadcaster_logger = logging.getLogger('broadcaster')
 broadcaster_logger.setLevel(logging.DEBUG)
 
+DEFAULT_ERROR_REPORT_TIMEOUT = 10
+
 
 class EventHandler(object):
 
@@ -50,31 +54,100 @@ class EventHandler(object):
                 port)
             raise ValueError(error_message)
 
-    def __init__(self, host, port, target):
+    def __init__(self, host, port, target, endpoints=None):
         port = int(port)
         self._validate_port(port)
         self.host = host
         self.port = port
         self.target = target
+        self.endpoints = endpoints
         self.remote_host = None
         self.remote_log_file = None
         self.exit_code = None
+        # schedules the timeouts, replaced to run executions on another reactor, e.g. a Clock
+        self.reactor = reactor
+        self.completion_callback = None
+        self.outcome_callback = None
+        self.error_report_timeout = DEFAULT_ERROR_REPORT_TIMEOUT
+        self.error_report_received = False
+        self.error_report = None
+        self.call_info_received = False
+        self.execution_completed = False
+        self.delayed_completion = None
+        self.waiting_timeout_call = None
+        self.pending_timeout_call = None
+        self.result_reporter = None
+        self.event_journal = None
+        self.timings = ExecutionTimings()
+        self.dispatched_events = 0
+        self.dropped_events = 0
+        self.service_changes = []
+        # event id to the method handling it, cmd events are further dispatched by their state
+        self.event_dispatch_table = {'cmd': self._handle_command,
+                                     'call-info': self._output_call_info,
+                                     'service-change': self._output_service_change}
+        # further states of cmd events are transitions
+        self.command_dispatch_table = {'failed': self._handle_failure}
 
     def initialize_for_execution_request(self, waiting_timeout=None,
                                          pending_timeout=None,
                                          command_to_execute=None,
                                          arguments=None,
                                          tracking_id=None,
-                                         progress_handler=None):
+                                         progress_handler=None,
+                                         error_report_timeout=DEFAULT_ERROR_REPORT_TIMEOUT,
+                                         result_reporter=None,
+                                         event_journal=None):
+        self._prepare_broadcast_client()
+        self.prepare_execution_request(waiting_timeout=waiting_timeout,
+                                       pending_timeout=pending_timeout,
+                                       command_to_execute=command_to_execute,
+                                       arguments=arguments,
+                                       tracking_id=tracking_id,
+                                       progress_handler=progress_handler,
+                                       error_report_timeout=error_report_timeout,
+                                       result_reporter=result_reporter,
+                                       event_journal=event_journal)
+        self.wamp_broadcaster.onEvent = self.on_command_execution_event
+        self.wamp_broadcaster.addOnSessionOpenHandler(
+            self.on_session_open)
+        self.display_summary("Requesting")
+        self.reactor.run()
+        if self.exit_code != 0:
+            self.display_summary("FAILED")
+        else:
+            self.display_summary("Success")
+        if result_reporter is not None:
+            result_reporter.flush()
+        if event_journal is not None:
+            event_journal.close()
+        sys.exit(self.exit_code)
+
+    def prepare_execution_request(self, waiting_timeout=None,
+                                  pending_timeout=None,
+                                  command_to_execute=None,
+                                  arguments=None,
+                                  tracking_id=None,
+                                  progress_handler=None,
+                                  error_report_timeout=DEFAULT_ERROR_REPORT_TIMEOUT,
+                                  result_reporter=None,
+                                  event_journal=None):
+        """
+            Sets up the execution state machine and the waiting timeout, but
+            neither connects to the broadcaster nor runs the reactor. The
+            caller is responsible for providing self.wamp_broadcaster and
+            for routing the events to on_command_execution_event.
+        """
         self.progress_handler = progress_handler
+        self.result_reporter = result_reporter
+        self.event_journal = event_journal
+        self.error_report_timeout = error_report_timeout
         self.tracking_id = tracking_id
         self.waiting_timeout = waiting_timeout
         self.pending_timeout = pending_timeout
         self.command_to_execute = command_to_execute
         self.arguments = arguments or []
 
-        self._prepare_broadcast_client()
-
         self.execution_state_machine = \
             create_execution_state_machine_with_callbacks(
                 self.on_waiting_command_execution,
@@ -83,56 +156,43 @@ class EventHandler(object):
                 self.on_command_execution_success,
                 self.on_command_execution_failure,
                 self.on_execution_waiting_timeout,
-                self.on_execution_pending_timeout)
-        self.wamp_broadcaster.onEvent = self.on_command_execution_event
-        self.wamp_broadcaster.addOnSessionOpenHandler(
-            self.publish_execution_request)
-        reactor.callLater(
+                self.on_execution_pending_timeout,
+                self.on_state_transition)
+        self.waiting_timeout_call = self.reactor.callLater(
             self.waiting_timeout, self.execution_state_machine.waiting_timeout)
-        self.display_summary("Requesting")
-        reactor.run()
-        if self.exit_code != 0:
-            self.display_summary("FAILED")
-        else:
-            self.display_summary("Success")
-        sys.exit(self.exit_code)
-
-    def on_command_execution_event(self, *args):
-        try:
-            # Wamp v1: onEvent is callbacked with topic and event
-            target, event = args
-        except ValueError as e:
-            # Wamp v2: onEvent is callbacked with event
-            event, = args
 
+    def on_command_execution_event(self, event):
+        if self.event_journal is not None:
+            self.event_journal.record(event)
         if event.get('tracking_id') != self.tracking_id:
-            if event.get('state'):
-                event_description = '{0} {1}'.format(
-                    event.get('id'), event.get('state'))
-            else:
-                event_description = '{0}'.format(event.get('id'))
-            logger.debug(
-                'Ignoring event {0} with a foreign tracking ID: {1}.'.format(event_description,
-                                                                             event.get('tracking_id')))
+            self.dropped_events += 1
             return
-
+        self.dispatched_events += 1
+        self.handle_event(event)
+
+    def handle_event(self, event):
+        handler = self.event_dispatch_table.get(event.get('id'))
+        if handler is None:
+            if not event.get('state'):
+                return
+            handler = self._apply_state_transition_to_state_machine
         try:
             self._pretty_print_event(event)
-            self._output_error_report(event)
-            self._output_call_info(event)
-            self._output_service_change(event)
-            self._apply_state_transition_to_state_machine(event)
-        except Exception as e:
-            logger.debug("Error while processing event : %s" % e)
+            handler(event)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.debug("Error while processing event : %s", e)
 
     def on_waiting_command_execution(self, event):
         pass
 
     def on_pending_command_execution(self, event):
-        if self.progress_handler:
-            self.progress_handler.output_progress(
-                sys.stdout, '{0} started'.format(self.arguments[0]))
-        reactor.callLater(
+        # reports received while waiting came from receivers that failed, not from the one executing the command
+        self.error_report_received = False
+        self.error_report = None
+        self.call_info_received = False
+        self._output_transition_progress('started')
+        self.timings.mark(STARTED)
+        self.pending_timeout_call = self.reactor.callLater(
             self.pending_timeout, self.execution_state_machine.pending_timeout)
 
     def on_failed_command_execution(self, event):
@@ -143,30 +203,76 @@ class EventHandler(object):
             logger.error('The command failed.')
 
     def on_command_execution_success(self, event):
-        if self.progress_handler:
-            self.progress_handler.output_progress(
-                sys.stdout, '{0} successful'.format(self.arguments[0]))
+        self._output_transition_progress('successful')
+        self.timings.mark(FINISHED)
         self.exit_code = 0
-        reactor.stop()
+        self._notify_outcome()
+        self._complete_execution()
 
     def on_command_execution_failure(self, event):
-        if self.progress_handler:
-            self.progress_handler.output_progress(
-                sys.stdout, '{0} failed'.format(self.arguments[0]))
-        logger.debug('Waiting for possible error reports from a receiver..')
+        self._output_transition_progress('failed')
+        self.timings.mark(FINISHED)
+        self.timings.mark(FAILED)
         self.exit_code = 1
-        reactor.callLater(10, reactor.stop)
+        self._notify_outcome()
+        # no receiver started the command, so none is going to report the failure
+        if event.event == 'waiting_timeout' or self._failure_was_reported():
+            self._complete_execution()
+            return
+        logger.debug('Waiting for possible error reports from a receiver..')
+        self.delayed_completion = self.reactor.callLater(self.error_report_timeout, self._complete_execution)
+
+    def _output_transition_progress(self, transition):
+        # service changes are written once per reactor iteration, transitions right away
+        if self.progress_handler:
+            self.progress_handler.output_progress(sys.stdout, '{0} {1}'.format(self.arguments[0], transition))
+            self.progress_handler.flush()
+
+    def _notify_outcome(self):
+        if self.outcome_callback:
+            self.outcome_callback()
+
+    def _failure_was_reported(self):
+        return self.error_report_received and self.call_info_received
+
+    def _complete_execution_if_failure_was_reported(self):
+        if self.exit_code == 1 and self._failure_was_reported():
+            self._complete_execution()
+
+    def _complete_execution(self):
+        if self.execution_completed:
+            return
+        self.execution_completed = True
+        # the reactor may outlive this execution (multi target, daemon)
+        for delayed_call in (self.delayed_completion, self.waiting_timeout_call, self.pending_timeout_call):
+            if delayed_call is not None and delayed_call.active():
+                delayed_call.cancel()
+        self.timings.mark(COMPLETED)
+        self._report_summary()
+        complete = self.completion_callback or self.reactor.stop
+        complete()
 
     def publish_execution_request(self):
         request_was_already_sent = self.execution_state_machine.current != "idle"
         if request_was_already_sent:
             return
-        logger.debug('Publishing execution request : execute {0} on {1}'.format(
-            self.command_to_execute, self.target))
+        logger.debug('Publishing execution request : execute %s on %s',
+                     self.command_to_execute, self.target)
+        self.timings.mark(PUBLISHED)
+        if self.event_journal is not None:
+            self.event_journal.record_execution(self)
         self.execution_state_machine.request(
             message='Execute {0} on {1}.'.format(self.command_to_execute, self.target))
         self.wamp_broadcaster.publish_request_for_target(
-            self.target, self.command_to_execute, self.arguments)
+            self.target, self.command_to_execute, self.arguments, tracking_id=self.tracking_id)
+
+    def on_session_open(self):
+        self.timings.mark(SESSION_OPEN)
+        self.publish_execution_request()
+
+    def on_state_transition(self, event):
+        if self.result_reporter is not None:
+            self._report('transition', source=event.src, destination=event.dst, trigger=event.event)
 
     def on_execution_waiting_timeout(self, event):
         if self.execution_state_machine.current in ('pending', 'success'):
@@ -183,51 +289,71 @@ class EventHandler(object):
                                                                 self.pending_timeout))
 
     def _prepare_broadcast_client(self):
-        self.wamp_broadcaster = WampBroadcaster(
-            self.host, self.port, self.target)
+        self.timings.mark(CONNECTING)
+        self.wamp_broadcaster = ReconnectingWampBroadcaster(
+            self.host, self.port, self.target, endpoints=self.endpoints)
 
     def _output_service_change(self, event):
-        if event.get('id') == 'service-change' and event.get('payload'):
+        if event.get('payload'):
+            log_service_changes = logger.isEnabledFor(logging.INFO)
+            report_service_changes = self.result_reporter is not None
             for service_change in event.get('payload'):
-                message = '{0} is now {1}.'.format(
-                    service_change.get('uri'), service_change.get('state'))
-                logger.info(message)
+                uri = service_change.get('uri')
+                state = service_change.get('state')
+                self.service_changes.append((uri, state))
+                if log_service_changes:
+                    logger.info('%s is now %s.', uri, state)
+                if report_service_changes:
+                    self._report('service-change', uri=uri, state=state)
                 if self.progress_handler is not None:
-                    self.progress_handler.output_progress(sys.stdout, message)
+                    self.progress_handler.output_progress(sys.stdout, '{0} is now {1}.'.format(uri, state))
 
-    def _output_error_report(self, event):
-        if self._event_is_an_error_report(event):
-            logger.error('*' * 5 + 'Error report' + '*' * 5)
-            for error_message_line in event.get('message').split('\n'):
-                logger.error(error_message_line)
-            logger.error("See also full log on {0} : {1}".format(self.remote_host,
-                                                                 self.remote_log_file))
+    def _handle_command(self, event):
+        state = event.get('state')
+        if state:
+            self.command_dispatch_table.get(state, self._apply_state_transition_to_state_machine)(event)
 
-    def _event_is_an_error_report(self, event):
-        return event.get('id') == 'cmd' and event.get('state') == 'failed' and event.get('message')
+    def _handle_failure(self, event):
+        # the receiver follows the failed event with an error report, a failed event carrying the message
+        if event.get('message'):
+            self._output_error_report(event)
+        self._apply_state_transition_to_state_machine(event)
 
-    def _output_call_info(self, event):
-        if self._event_is_a_call_info(event):
-            self.remote_host = event.get('host')
-            self.remote_log_file = event.get('log_file')
-            logger.info('Logfile on %s is at : %s' % (self.remote_host, self.remote_log_file))
+    def _output_error_report(self, event):
+        logger.error('*' * 5 + 'Error report' + '*' * 5)
+        for error_message_line in event.get('message').split('\n'):
+            logger.error(error_message_line)
+        logger.error("See also full log on %s : %s", self.remote_host, self.remote_log_file)
+        if self.result_reporter is not None:
+            self._report('error-report', message=event.get('message'), host=self.remote_host,
+                         log_file=self.remote_log_file)
+        self.error_report_received = True
+        self.error_report = event.get('message')
+        self._complete_execution_if_failure_was_reported()
 
-    def _event_is_a_call_info(self, event):
-        return event.get('id') == 'call-info'
+    def _output_call_info(self, event):
+        self.remote_host = event.get('host')
+        self.remote_log_file = event.get('log_file')
+        logger.info('Logfile on %s is at : %s', self.remote_host, self.remote_log_file)
+        if self.result_reporter is not None:
+            self._report('call-info', host=self.remote_host, log_file=self.remote_log_file)
+        self.call_info_received = True
+        self._complete_execution_if_failure_was_reported()
 
     def _apply_state_transition_to_state_machine(self, event):
-        if event.get('state'):
-            fun = getattr(self.execution_state_machine, event.get('state'))
-            if fun:
-                previous_fsm_state = self.execution_state_machine.current
-                fun(msg=event['id'])
-                current_fsm_state = self.execution_state_machine.current
-                logger.debug(
-                    'Transition from "{0}" to "{1}" since event "{2}" occured.'.format(previous_fsm_state,
-                                                                                       current_fsm_state,
-                                                                                       event['state']))
+        state = event['state']
+        fsm = self.execution_state_machine
+        if not fsm.can(state):
+            logger.debug('Ignoring event "%s" in state "%s".', state, fsm.current)
+            return
+        previous_fsm_state = fsm.current
+        fsm.trigger(state, msg=event['id'])
+        logger.debug('Transition from "%s" to "%s" since event "%s" occured.',
+                     previous_fsm_state, fsm.current, state)
 
     def _pretty_print_event(self, event):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
         payload = None
         try:
             if event.get('payload'):
@@ -237,16 +363,36 @@ class EventHandler(object):
                      for key, value in d.iteritems()])
         except:
             pass
-        logger.debug('Event "%s" received' % ' '.join(filter(None,
-                                                             [event['id'],
-                                                              event.get('cmd'),
-                                                              event.get(
-                                                                  'state'),
-                                                              payload])))
+        logger.debug('Event "%s" received', ' '.join(filter(None,
+                                                            [event['id'],
+                                                             event.get('cmd'),
+                                                             event.get('state'),
+                                                             payload])))
+
+    def _report(self, event, **fields):
+        self.result_reporter.report(event, target=self.target, tracking_id=self.tracking_id, **fields)
+
+    def _report_summary(self):
+        if self.result_reporter is None:
+            return
+        self._report('summary',
+                     command=self.command_to_execute,
+                     arguments=self.get_short_arguments(),
+                     exit_code=self.exit_code,
+                     state=self.execution_state_machine.current,
+                     remote_host=self.remote_host,
+                     log_file=self.remote_log_file,
+                     duration=self.timings.elapsed(PUBLISHED, COMPLETED),
+                     phases=self.timings.phases())
+
+    def get_short_arguments(self):
+        return [argument for argument in self.arguments if not argument.startswith("--tracking-id")]
 
     def display_summary(self, prefix):
-        short_arguments = filter(lambda argument: not argument.startswith("--tracking-id"), self.arguments)
-        commandline = "{0} {1}".format(self.command_to_execute, " ".join(short_arguments))
+        commandline = "{0} {1}".format(self.command_to_execute, " ".join(self.get_short_arguments()))
         logger.info("{0}: '{1}' on target {2}".format(prefix,
                                                       commandline,
                                                       self.target))
+        phases = self.timings.phases()
+        if phases:
+            logger.info("Phases on target {0}: {1}".format(self.target, format_phases(phases)))
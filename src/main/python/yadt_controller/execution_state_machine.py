@@ -17,8 +17,137 @@
         The state machine that describes the protocol followed by the YADT
         controller. The events received from a YADT broadcaster alter the initial
         state until it is finished or errored.
+
+        The transitions are compiled into a table indexed by event and state
+        code once, every execution only holds its current state code and its
+        callbacks.
 """
-from fysom import Fysom
+
+IDLE, WAITING, PENDING, SUCCESS, FAILURE = range(5)
+STATES = ('idle', 'waiting', 'pending', 'success', 'failure')
+EVENTS = ('request', 'started', 'finished', 'failed', 'pending_timeout', 'waiting_timeout')
+
+TRANSITIONS = (
+    ('started', 'waiting', 'pending'),
+    ('started', 'pending', 'pending'),
+    ('request', 'idle', 'waiting'),
+    ('request', 'failure', 'failure'),
+    ('finished', 'idle', 'success'),
+    ('finished', 'pending', 'success'),
+    ('finished', 'success', 'success'),
+    ('failed', 'waiting', 'waiting'),
+    ('failed', 'pending', 'failure'),
+    ('failed', 'failure', 'failure'),
+    ('pending_timeout', 'pending', 'failure'),
+    ('waiting_timeout', 'idle', 'failure'),
+    ('waiting_timeout', 'waiting', 'failure'),
+    ('waiting_timeout', 'pending', 'pending'),
+    ('waiting_timeout', 'failure', 'failure'),
+    ('waiting_timeout', 'success', 'success'),
+)
+
+
+def _compile_transition_table(transitions):
+    """
+        @return: dictionary of event to a tuple holding the destination
+        state code for every source state code, None where the event is not
+        permitted.
+    """
+    destinations = dict((event, [None] * len(STATES)) for event in EVENTS)
+    for event, source, destination in transitions:
+        destinations[event][STATES.index(source)] = STATES.index(destination)
+    return dict((event, tuple(destinations[event])) for event in EVENTS)
+
+
+_TRANSITION_TABLE = _compile_transition_table(TRANSITIONS)
+
+
+class InvalidTransitionError(Exception):
+    pass
+
+
+class UnknownEventError(InvalidTransitionError):
+    pass
+
+
+class Transition(object):
+    """
+        Passed to the callbacks, with the event, the source and destination
+        state (src, dst) and the keyword arguments the event was triggered
+        with as attributes.
+    """
+
+    def __init__(self, fsm, event, src, dst, attributes):
+        self.fsm = fsm
+        self.event = event
+        self.src = src
+        self.dst = dst
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+
+class ExecutionStateMachine(object):
+    """
+        When an event changes the state, the transition callback is called
+        first, then the callback of the new state and then the callback of
+        the event. When the state stays the same only the callback of the
+        event is called.
+    """
+
+    __slots__ = ('state', 'state_callbacks', 'event_callbacks', 'transition_callback')
+
+    def __init__(self, state_callbacks, event_callbacks, transition_callback=None):
+        self.state = IDLE
+        self.state_callbacks = tuple(state_callbacks.get(state) for state in STATES)
+        self.event_callbacks = event_callbacks
+        self.transition_callback = transition_callback
+
+    @property
+    def current(self):
+        return STATES[self.state]
+
+    def can(self, event):
+        destinations = _TRANSITION_TABLE.get(event)
+        return destinations is not None and destinations[self.state] is not None
+
+    def trigger(self, event, **attributes):
+        destinations = _TRANSITION_TABLE.get(event)
+        if destinations is None:
+            raise UnknownEventError('unknown event {0}'.format(event))
+        source = self.state
+        destination = destinations[source]
+        if destination is None:
+            raise InvalidTransitionError('event {0} inappropriate in current state {1}'.format(event,
+                                                                                               STATES[source]))
+        transition = Transition(self, event, STATES[source], STATES[destination], attributes)
+        if destination != source:
+            if self.transition_callback is not None:
+                self.transition_callback(transition)
+            self.state = destination
+            state_callback = self.state_callbacks[destination]
+            if state_callback is not None:
+                state_callback(transition)
+        event_callback = self.event_callbacks.get(event)
+        if event_callback is not None:
+            event_callback(transition)
+
+    def request(self, **attributes):
+        self.trigger('request', **attributes)
+
+    def started(self, **attributes):
+        self.trigger('started', **attributes)
+
+    def finished(self, **attributes):
+        self.trigger('finished', **attributes)
+
+    def failed(self, **attributes):
+        self.trigger('failed', **attributes)
+
+    def pending_timeout(self, **attributes):
+        self.trigger('pending_timeout', **attributes)
+
+    def waiting_timeout(self, **attributes):
+        self.trigger('waiting_timeout', **attributes)
 
 
 def create_execution_state_machine_with_callbacks(waiting_callback,
@@ -27,36 +156,18 @@ def create_execution_state_machine_with_callbacks(waiting_callback,
                                                   success_callback,
                                                   failure_callback,
                                                   waiting_timeout_callback,
-                                                  pending_timeout_callback):
-
-    fsm = Fysom({
-        'initial': 'idle',
-        'events': [
-            {'name': 'started', 'src': 'waiting', 'dst': 'pending'},
-            {'name': 'started', 'src': 'pending', 'dst': 'pending'},
-            {'name': 'request', 'src': 'idle', 'dst': 'waiting'},
-            {'name': 'request', 'src': 'failure', 'dst': 'failure'},
-            {'name': 'finished', 'src': 'idle', 'dst': 'success'},
-            {'name': 'finished', 'src': 'pending', 'dst': 'success'},
-            {'name': 'finished', 'src': 'success', 'dst': 'success'},
-            {'name': 'failed', 'src': 'waiting', 'dst': 'waiting'},
-            {'name': 'failed', 'src': 'pending', 'dst': 'failure'},
-            {'name': 'failed', 'src': 'failure', 'dst': 'failure'},
-            {'name': 'pending_timeout', 'src': 'pending', 'dst': 'failure'},
-            {'name': 'waiting_timeout', 'src': 'idle', 'dst': 'failure'},
-            {'name': 'waiting_timeout', 'src': 'waiting', 'dst': 'failure'},
-            {'name': 'waiting_timeout', 'src': 'pending', 'dst': 'pending'},
-            {'name': 'waiting_timeout', 'src': 'failure', 'dst': 'failure'},
-            {'name': 'waiting_timeout', 'src': 'success', 'dst': 'success'},
-        ],
-        'callbacks': {
-            'onwaiting': waiting_callback,
-            'onfailed': failed_callback,
-            'onpending': pending_callback,
-            'onsuccess': success_callback,
-            'onfailure': failure_callback,
-            'onwaiting_timeout': waiting_timeout_callback,
-            'onpending_timeout': pending_timeout_callback
-        }
-    })
-    return fsm
+                                                  pending_timeout_callback,
+                                                  transition_callback=None):
+    """
+        The transition_callback is called with the event (src, dst, event)
+        before the state machine enters a different state, that is before
+        the callback of the new state.
+    """
+    return ExecutionStateMachine(state_callbacks={'waiting': waiting_callback,
+                                                  'pending': pending_callback,
+                                                  'success': success_callback,
+                                                  'failure': failure_callback},
+                                 event_callbacks={'failed': failed_callback,
+                                                  'waiting_timeout': waiting_timeout_callback,
+                                                  'pending_timeout': pending_timeout_callback},
+                                 transition_callback=transition_callback)
@@ -0,0 +1,205 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        A cache for the info documents of the broadcaster, kept in memory
+        and optionally in a directory, so that controllers started seconds
+        apart share it.
+
+        An entry younger than the TTL is served without asking the
+        broadcaster. An older entry is revalidated with the ETag and
+        Last-Modified values the broadcaster sent along with it, or dropped
+        if the broadcaster sent none.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+
+logger = logging.getLogger('info_cache')
+
+DEFAULT_TTL_IN_SECONDS = 30
+DEFAULT_MAX_ENTRIES = 1000
+
+CacheEntry = namedtuple('CacheEntry', ['info', 'etag', 'last_modified', 'stored_at'])
+
+
+class InfoCache(object):
+
+    def __init__(self, ttl_in_seconds=DEFAULT_TTL_IN_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, directory=None,
+                 clock=time.time):
+        if ttl_in_seconds < 0:
+            raise ValueError('TTL must not be negative, got {0}'.format(ttl_in_seconds))
+        if max_entries < 1:
+            raise ValueError('max_entries must be at least 1, got {0}'.format(max_entries))
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_entries = max_entries
+        self.directory = directory
+        self.clock = clock
+        self.entries = {}
+        # number of files in the directory, listed once and then counted
+        self.cache_files = None
+        self.lock = threading.Lock()
+
+    def get(self, host, port, target):
+        """
+            @return: the cached entry, fresh or in need of revalidation,
+            None when nothing usable is cached.
+        """
+        key = self._create_key(host, port, target)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._store_in_memory(key, entry)
+            if entry is None:
+                return None
+            if not self.is_fresh(entry) and not self.can_be_revalidated(entry):
+                self._remove(key)
+                return None
+            return entry
+
+    def is_fresh(self, entry):
+        return self.clock() - entry.stored_at < self.ttl_in_seconds
+
+    def can_be_revalidated(self, entry):
+        return bool(entry.etag or entry.last_modified)
+
+    def put(self, host, port, target, info, etag=None, last_modified=None):
+        key = self._create_key(host, port, target)
+        entry = CacheEntry(info, etag, last_modified, self.clock())
+        with self.lock:
+            self._store_in_memory(key, entry)
+            self._save(key, entry)
+        return entry
+
+    def refresh(self, host, port, target):
+        """
+            Restarts the TTL of an entry the broadcaster confirmed to be
+            unchanged.
+        """
+        key = self._create_key(host, port, target)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry = entry._replace(stored_at=self.clock())
+            self._store_in_memory(key, entry)
+            self._save(key, entry)
+            return entry
+
+    def _create_key(self, host, port, target):
+        return '{0}:{1}/{2}'.format(host, port, target)
+
+    def _store_in_memory(self, key, entry):
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            oldest_key = min(self.entries, key=lambda stored_key: self.entries[stored_key].stored_at)
+            self._remove(oldest_key)
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        if self.directory and _remove_file(self._path(key)) and self.cache_files:
+            self.cache_files -= 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as cache_file:
+                entry = CacheEntry(**json.load(cache_file))
+        except (IOError, OSError, ValueError, TypeError):
+            return None
+        return entry
+
+    def _save(self, key, entry):
+        if not self.directory:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = self._path(key)
+            new_cache_file = not os.path.exists(path)
+            # write and rename, so that concurrent controllers never read a partial entry
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(file_descriptor, 'w') as cache_file:
+                    json.dump(dict(entry._asdict()), cache_file)
+                os.rename(temporary_path, path)
+                temporary_path = None
+            finally:
+                if temporary_path is not None:
+                    _remove_file(temporary_path)
+            if new_cache_file:
+                self._count_new_cache_file()
+        except (IOError, OSError) as e:
+            logger.warn('Could not write info cache entry to %s : %s', self.directory, e)
+
+    def _count_new_cache_file(self):
+        if self.cache_files is None:
+            self.cache_files = len(self._list_cache_files())
+        else:
+            self.cache_files += 1
+        if self.cache_files > self.max_entries:
+            self.cache_files = self._limit_directory_size()
+
+    def _list_cache_files(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json')]
+
+    def _limit_directory_size(self):
+        """
+            Removes the oldest files beyond max_entries, and a tenth of
+            max_entries more, so that the directory is not listed again
+            for the next few entries.
+
+            @return: the number of files left.
+        """
+        cache_files = self._list_cache_files()
+        if len(cache_files) <= self.max_entries:
+            return len(cache_files)
+        cache_files.sort(key=self._modification_time)
+        files_to_keep = self.max_entries - self.max_entries // 10
+        # a file may have been removed by another controller in the meantime
+        for cache_file in cache_files[:len(cache_files) - files_to_keep]:
+            _remove_file(cache_file)
+        return files_to_keep
+
+    def _modification_time(self, path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+
+def _remove_file(path):
+    """
+        @return: True if the file was removed, False if it did not exist.
+    """
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
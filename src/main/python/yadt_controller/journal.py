@@ -0,0 +1,200 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        The event journal records the executions requested by the controller
+        and every raw event it receives from the broadcaster, foreign events
+        included, one compact JSON document per line:
+
+            {"t":0.0,"execution":{"tracking_id":"...","target":"...","command":"...",...}}
+            {"t":0.412,"event":{"id":"cmd","state":"started","tracking_id":"...",...}}
+
+        t is the time in seconds since the journal was opened, taken from a
+        monotonic clock. Journals are appended to, a run starts again at 0.
+
+        replay() feeds a journal back through EventHandlers and their
+        execution state machines, without a broadcaster. The timeouts are
+        scheduled on a clock that never advances unless another reactor is
+        given, so they are not replayed.
+"""
+
+from __future__ import print_function
+
+import json
+import logging
+import sys
+import time
+from collections import namedtuple
+
+from docopt import docopt
+
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+from yadt_controller.timing import monotonic
+
+
+REPLAY_USAGE = """
+Replays an event journal recorded with yadtcontroller --record-events through
+the event handlers of the recorded executions, as fast as possible by default.
+Exits with 1 unless every replayed execution completed successfully.
+
+Usage:
+yadtcontroller-replay [options] <journal>
+yadtcontroller-replay (-h | --help)
+
+Options:
+-h --help         Show this screen.
+-v --verbose      Show every replayed event.
+--speed=<factor>  Replay at this multiple of the recorded pace, e.g. 1 for the recorded pace.
+"""
+
+ReplayResult = namedtuple('ReplayResult', ['event_handlers', 'events', 'dispatched_events', 'dropped_events',
+                                           'seconds'])
+
+
+class EventJournal(object):
+
+    def __init__(self, journal_file, clock=monotonic):
+        self.journal_file = journal_file
+        self.clock = clock
+        self.opened_at = clock()
+
+    def record_execution(self, event_handler):
+        self._write('execution', {'tracking_id': event_handler.tracking_id,
+                                  'target': event_handler.target,
+                                  'command': event_handler.command_to_execute,
+                                  'arguments': event_handler.arguments,
+                                  'waiting_timeout': event_handler.waiting_timeout,
+                                  'pending_timeout': event_handler.pending_timeout})
+
+    def record(self, event):
+        self._write('event', event)
+
+    def _write(self, kind, value):
+        entry = {'t': round(self.clock() - self.opened_at, 6), kind: value}
+        self.journal_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def flush(self):
+        self.journal_file.flush()
+
+    def close(self):
+        self.journal_file.close()
+
+
+def open_event_journal(filename):
+    return EventJournal(open(filename, 'a'))
+
+
+def read_journal(journal_file):
+    """
+        @return: generator of the journal entries, as dictionaries.
+    """
+    for line in journal_file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class _DiscardingBroadcaster(object):
+
+    def publish_request_for_target(self, target, cmd, args, tracking_id=None):
+        pass
+
+
+def replay(entries, speed=None, sleep=time.sleep, clock=monotonic, reactor=None):
+    """
+        Replays the journal entries as fast as possible, or at speed times
+        the recorded pace (1 for the recorded pace). Every execution
+        recorded gets an EventHandler, which is complete once the replayed
+        events completed it. The timeouts of the executions are scheduled
+        on the given reactor.
+
+        @return: ReplayResult
+    """
+    # imported here, so that reading a journal does not import the WAMP client
+    from twisted.internet.task import Clock
+    from yadt_controller.event_handler import EventHandler
+
+    if reactor is None:
+        reactor = Clock()
+
+    dispatcher = TrackingIdDispatcher()
+    event_handlers = []
+    events = 0
+    started_at = clock()
+    pace = None
+    previously_recorded_at = None
+    for entry in entries:
+        if speed:
+            recorded_at = entry.get('t', 0)
+            # the time goes back where the next run was appended to the journal
+            if previously_recorded_at is None or recorded_at < previously_recorded_at:
+                pace = (recorded_at, clock())
+            previously_recorded_at = recorded_at
+            delay = (recorded_at - pace[0]) / speed - (clock() - pace[1])
+            if delay > 0:
+                sleep(delay)
+
+        event = entry.get('event')
+        if event is not None:
+            events += 1
+            dispatcher.dispatch(event)
+        elif 'execution' in entry:
+            event_handler = _create_event_handler(EventHandler, entry['execution'], reactor)
+            dispatcher.register(event_handler)
+            event_handlers.append(event_handler)
+            event_handler.publish_execution_request()
+    return ReplayResult(event_handlers=event_handlers,
+                        events=events,
+                        dispatched_events=dispatcher.dispatched_events,
+                        dropped_events=dispatcher.dropped_events,
+                        seconds=clock() - started_at)
+
+
+def _create_event_handler(event_handler_class, execution, reactor):
+    event_handler = event_handler_class('localhost', 8081, execution['target'])
+    event_handler.reactor = reactor
+    event_handler.completion_callback = lambda: None
+    event_handler.prepare_execution_request(waiting_timeout=execution['waiting_timeout'],
+                                            pending_timeout=execution['pending_timeout'],
+                                            command_to_execute=execution['command'],
+                                            arguments=execution['arguments'],
+                                            tracking_id=execution['tracking_id'])
+    event_handler.wamp_broadcaster = _DiscardingBroadcaster()
+    return event_handler
+
+
+def run_replay(argv=None):
+    options = docopt(REPLAY_USAGE, argv=argv)
+    logging.basicConfig(format='%(asctime)s [%(levelname)7s] %(message)s',
+                        level=logging.DEBUG if options['--verbose'] else logging.INFO)
+    speed = float(options['--speed']) if options['--speed'] else None
+    with open(options['<journal>']) as journal_file:
+        result = replay(read_journal(journal_file), speed=speed)
+
+    exit_code = 0
+    for event_handler in result.event_handlers:
+        if event_handler.exit_code is None:
+            event_handler.display_summary('INCOMPLETE')
+            exit_code = 1
+        elif event_handler.exit_code != 0:
+            event_handler.display_summary('FAILED')
+            exit_code = 1
+        else:
+            event_handler.display_summary('Success')
+    events_per_second = result.events / result.seconds if result.seconds else float('inf')
+    print('Replayed {0} events ({1} dropped) of {2} executions in {3:.3f}s, {4:.0f} events/s'.format(
+        result.events, result.dropped_events, len(result.event_handlers), result.seconds, events_per_second))
+    sys.exit(exit_code)
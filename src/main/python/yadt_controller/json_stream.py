@@ -0,0 +1,293 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        Incremental JSON parsing, so that large info documents can be
+        processed while they are received instead of being buffered and
+        decoded as a whole.
+
+        JsonEventParser turns chunks of text into parse events, project()
+        picks the requested fields out of a stream of chunks. A field is a
+        dotted path of object keys, arrays are transparent: "services.state"
+        matches the state of every element of the services array.
+"""
+
+import json
+import re
+
+START_MAP = 'start_map'
+MAP_KEY = 'map_key'
+END_MAP = 'end_map'
+START_ARRAY = 'start_array'
+END_ARRAY = 'end_array'
+VALUE = 'value'
+
+_TOKEN = re.compile(r'''
+    [ \t\r\n]*
+    (?:
+        (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)
+      | (?P<literal>true|false|null)
+      | (?P<punctuation>[{}\[\]:,])
+    )''', re.VERBOSE)
+# everything up to the next string or bracket, used to skip whole containers
+_SKIP_TOKEN = re.compile(r'[^"{}\[\]]*(?:(?P<string>"[^"\\]*(?:\\.[^"\\]*)*")|(?P<bracket>[{}\[\]]))')
+_NUMBER_CONTINUATIONS = ('', '.', 'e', 'E', '+', '-')
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+_EXPECT_VALUE = 'value'
+_EXPECT_VALUE_OR_END_ARRAY = 'value or ]'
+_EXPECT_KEY = 'key'
+_EXPECT_KEY_OR_END_MAP = 'key or }'
+_EXPECT_COLON = ':'
+_EXPECT_COMMA_OR_END = ', or end of container'
+_EXPECT_NOTHING = 'end of document'
+
+
+class JsonEventParser(object):
+    """
+        Push parser for one JSON document. feed() accepts the next chunk of
+        text and returns a generator of the (event, value) tuples it
+        completed, which has to be consumed before the next chunk is fed.
+        close() checks that the document is complete.
+
+        Right after a start_map or start_array event, skip_container()
+        skips the rest of that container without parsing it, only its
+        end_map or end_array event is generated.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.containers = []
+        self.expected = _EXPECT_VALUE
+        self.skip_depth = 0
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        return self._parse(final=False)
+
+    def close(self):
+        for event in self._parse(final=True):
+            yield event
+        if self.expected != _EXPECT_NOTHING:
+            raise ValueError('Unexpected end of document, expected {0}'.format(self.expected))
+
+    def skip_container(self):
+        self.skip_depth = 1
+
+    def _parse(self, final):
+        buffer = self.buffer
+        length = len(buffer)
+        position = 0
+        try:
+            while position < length:
+                if self.skip_depth:
+                    position = self._skip(buffer, position)
+                    if self.skip_depth:
+                        break
+                    container = self.containers.pop()
+                    self._after_value()
+                    yield container, None
+                    continue
+
+                match = _TOKEN.match(buffer, position)
+                if match is None:
+                    if not buffer[position:].strip():
+                        position = length
+                        break
+                    if final:
+                        raise ValueError('Invalid JSON at {0!r}'.format(buffer[position:position + 20].strip()))
+                    break  # the token continues in the next chunk
+                kind = match.lastgroup
+                end = match.end()
+                if kind == 'number' and not final and buffer[end:end + 1] in _NUMBER_CONTINUATIONS:
+                    break  # the number may continue in the next chunk
+                position = end
+                for event in self._handle_token(kind, match.group(kind)):
+                    yield event
+        finally:
+            self.buffer = buffer[position:]
+        if final and self.skip_depth:
+            raise ValueError('Unexpected end of document, expected end of container')
+
+    def _skip(self, buffer, position):
+        depth = self.skip_depth
+        while depth:
+            match = _SKIP_TOKEN.match(buffer, position)
+            if match is None:
+                break  # a string continues in the next chunk, or there is no bracket yet
+            position = match.end()
+            bracket = match.group('bracket')
+            if bracket is None:
+                continue
+            if bracket in '{[':
+                depth += 1
+            else:
+                depth -= 1
+        self.skip_depth = depth
+        return position
+
+    def _handle_token(self, kind, token):
+        expected = self.expected
+        if expected in (_EXPECT_VALUE, _EXPECT_VALUE_OR_END_ARRAY):
+            if kind == 'string':
+                self._after_value()
+                return ((VALUE, _decode_string(token)),)
+            if kind == 'number':
+                self._after_value()
+                return ((VALUE, _decode_number(token)),)
+            if kind == 'literal':
+                self._after_value()
+                return ((VALUE, _LITERALS[token]),)
+            if token == '{':
+                self.containers.append(END_MAP)
+                self.expected = _EXPECT_KEY_OR_END_MAP
+                return ((START_MAP, None),)
+            if token == '[':
+                self.containers.append(END_ARRAY)
+                self.expected = _EXPECT_VALUE_OR_END_ARRAY
+                return ((START_ARRAY, None),)
+            if token == ']' and expected == _EXPECT_VALUE_OR_END_ARRAY:
+                return self._end_container(END_ARRAY)
+        elif expected == _EXPECT_COMMA_OR_END:
+            container = self.containers[-1]
+            if token == ',':
+                self.expected = _EXPECT_KEY if container == END_MAP else _EXPECT_VALUE
+                return ()
+            if (token == '}' and container == END_MAP) or (token == ']' and container == END_ARRAY):
+                return self._end_container(container)
+        elif expected in (_EXPECT_KEY, _EXPECT_KEY_OR_END_MAP):
+            if kind == 'string':
+                self.expected = _EXPECT_COLON
+                return ((MAP_KEY, _decode_string(token)),)
+            if token == '}' and expected == _EXPECT_KEY_OR_END_MAP:
+                return self._end_container(END_MAP)
+        elif expected == _EXPECT_COLON:
+            if token == ':':
+                self.expected = _EXPECT_VALUE
+                return ()
+        raise ValueError('Unexpected {0!r}, expected {1}'.format(token, self.expected))
+
+    def _end_container(self, event):
+        self.containers.pop()
+        self._after_value()
+        return ((event, None),)
+
+    def _after_value(self):
+        self.expected = _EXPECT_COMMA_OR_END if self.containers else _EXPECT_NOTHING
+
+
+def _decode_string(token):
+    if '\\' in token:
+        return json.loads(token)
+    return token[1:-1]
+
+
+def _decode_number(token):
+    if '.' in token or 'e' in token or 'E' in token:
+        return float(token)
+    return int(token)
+
+
+class _ValueBuilder(object):
+
+    def __init__(self):
+        self.containers = []
+        self.keys = []
+        self.value = None
+
+    def handle_event(self, event, value):
+        """
+            @return: True once the value is complete.
+        """
+        if event == START_MAP:
+            self._start_container({})
+        elif event == START_ARRAY:
+            self._start_container([])
+        elif event == MAP_KEY:
+            self.keys[-1] = value
+        elif event == VALUE:
+            if not self.containers:
+                self.value = value
+                return True
+            self._add(value)
+        else:
+            self.keys.pop()
+            self.value = self.containers.pop()
+            return not self.containers
+        return False
+
+    def _start_container(self, container):
+        if self.containers:
+            self._add(container)
+        self.containers.append(container)
+        self.keys.append(None)
+
+    def _add(self, value):
+        container = self.containers[-1]
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[self.keys[-1]] = value
+
+
+def project(chunks, fields):
+    """
+        Parses the chunks of one JSON document and yields (field, value)
+        for every value matching one of the fields, as soon as it is
+        complete. Only the matching values are built in memory, containers
+        which cannot contain a match are skipped. A value nested in another
+        match is reported as part of the outer match.
+    """
+    wanted_paths = {}
+    paths_leading_to_fields = set()
+    for field in fields:
+        path = tuple(field.split('.'))
+        wanted_paths[path] = field
+        for length in range(len(path)):
+            paths_leading_to_fields.add(path[:length])
+    parser = JsonEventParser()
+    path = []
+    builder = None
+    field = None
+
+    for chunk in _chunks_and_end(chunks):
+        events = parser.close() if chunk is None else parser.feed(chunk)
+        for event, value in events:
+            if builder is None and event in (START_MAP, START_ARRAY, VALUE):
+                current_path = tuple(path)
+                field = wanted_paths.get(current_path)
+                if field is not None:
+                    builder = _ValueBuilder()
+                elif event != VALUE and current_path not in paths_leading_to_fields:
+                    parser.skip_container()
+
+            if event == START_MAP:
+                path.append(None)
+            elif event == MAP_KEY:
+                path[-1] = value
+            elif event == END_MAP:
+                path.pop()
+
+            if builder is not None and builder.handle_event(event, value):
+                yield field, builder.value
+                builder = None
+
+
+def _chunks_and_end(chunks):
+    for chunk in chunks:
+        yield chunk
+    yield None
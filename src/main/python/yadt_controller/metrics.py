@@ -0,0 +1,150 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        Metrics of the controller in the Prometheus text format: executions
+        by outcome, timeouts by phase, events received and dropped (events of
+        foreign executions) and a histogram of the phase durations per phase.
+        Rates are left to Prometheus, e.g.
+        rate(yadtcontroller_events_dropped_total[5m]).
+
+        The metrics are collected as a result reporter. Batch runs write them
+        to a file for the textfile collector, the daemon serves them via HTTP.
+"""
+
+import logging
+
+from yadt_controller.timing import PHASES, escape_label_value, write_file_atomically
+
+logger = logging.getLogger('metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+TIMEOUT_TRIGGERS = {'waiting_timeout': 'waiting', 'pending_timeout': 'pending'}
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[index] += 1
+
+    def format_samples(self, name, labels):
+        lines = []
+        for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, upper_bound, bucket_count))
+        lines.append('{0}_bucket{{{1},le="+Inf"}} {2}'.format(name, labels, self.count))
+        lines.append('{0}_sum{{{1}}} {2!r}'.format(name, labels, self.sum))
+        lines.append('{0}_count{{{1}}} {2}'.format(name, labels, self.count))
+        return lines
+
+
+class ControllerMetrics(object):
+    """
+        A result reporter counting the transitions and summaries it is
+        given. The event counts are read from the event sources, objects
+        with dispatched_events and dropped_events counters, when the
+        metrics are formatted.
+
+        If a filename is given, flush() writes the metrics to it.
+    """
+
+    def __init__(self, filename=None, buckets=DEFAULT_BUCKETS):
+        self.filename = filename
+        self.buckets = buckets
+        self.executions = {'success': 0, 'failure': 0}
+        self.timeouts = {'waiting': 0, 'pending': 0}
+        self.phase_durations = dict((phase, Histogram(buckets)) for phase, _, _ in PHASES)
+        self.event_sources = []
+
+    def add_event_source(self, event_source):
+        self.event_sources.append(event_source)
+
+    def report(self, event, **fields):
+        if event == 'transition':
+            timed_out_phase = TIMEOUT_TRIGGERS.get(fields.get('trigger'))
+            if timed_out_phase is not None:
+                self.timeouts[timed_out_phase] += 1
+        elif event == 'summary':
+            self.executions['success' if fields.get('exit_code') == 0 else 'failure'] += 1
+            for phase, duration in (fields.get('phases') or {}).items():
+                self.phase_durations[phase].observe(duration)
+
+    def flush(self):
+        if self.filename is None:
+            return
+        try:
+            write_file_atomically(self.filename, self.format())
+        except (IOError, OSError) as e:
+            logger.warn('Could not write metrics to %s : %s', self.filename, e)
+
+    def close(self):
+        self.flush()
+
+    def format(self):
+        dispatched_events = sum(source.dispatched_events for source in self.event_sources)
+        dropped_events = sum(source.dropped_events for source in self.event_sources)
+        lines = []
+        _add_metric(lines, 'yadtcontroller_executions_total', 'counter', 'Completed executions by outcome.',
+                    [('outcome="{0}"'.format(outcome), self.executions[outcome]) for outcome in ('success', 'failure')])
+        _add_metric(lines, 'yadtcontroller_timeouts_total', 'counter', 'Executions timed out by phase.',
+                    [('phase="{0}"'.format(phase), self.timeouts[phase]) for phase in ('waiting', 'pending')])
+        _add_metric(lines, 'yadtcontroller_events_received_total', 'counter',
+                    'Events received from the broadcaster.', [(None, dispatched_events + dropped_events)])
+        _add_metric(lines, 'yadtcontroller_events_dropped_total', 'counter',
+                    'Events dropped because they belong to foreign executions.', [(None, dropped_events)])
+        name = 'yadtcontroller_execution_phase_seconds'
+        lines.append('# HELP {0} Duration of the phases of executions.'.format(name))
+        lines.append('# TYPE {0} histogram'.format(name))
+        for phase, _, _ in PHASES:
+            labels = 'phase="{0}"'.format(escape_label_value(phase))
+            lines.extend(self.phase_durations[phase].format_samples(name, labels))
+        return ''.join(line + '\n' for line in lines)
+
+
+def _add_metric(lines, name, metric_type, help_text, samples):
+    lines.append('# HELP {0} {1}'.format(name, help_text))
+    lines.append('# TYPE {0} {1}'.format(name, metric_type))
+    for labels, value in samples:
+        if labels is None:
+            lines.append('{0} {1}'.format(name, value))
+        else:
+            lines.append('{0}{{{1}}} {2}'.format(name, labels, value))
+
+
+def create_metrics_resource(metrics):
+    """
+        @return: a twisted.web resource serving the metrics on every path.
+    """
+    from twisted.web.resource import Resource
+
+    class MetricsResource(Resource):
+        isLeaf = True
+
+        def render_GET(self, request):
+            request.setHeader(b'Content-Type', CONTENT_TYPE.encode('ascii'))
+            return metrics.format().encode('utf-8')
+
+    return MetricsResource()
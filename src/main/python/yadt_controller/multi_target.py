@@ -0,0 +1,235 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        Publishes one command to many targets over a single broadcaster
+        session. Every target is driven by its own EventHandler (and thus its
+        own execution state machine and exit code), the results are
+        aggregated once all executions are complete. The number of concurrent
+        executions can be bounded, and a rollout can be stopped after a
+        given number of failures.
+"""
+
+import logging
+import sys
+from functools import partial
+
+from twisted.internet import reactor
+
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+from yadt_controller.event_handler import EventHandler, DEFAULT_ERROR_REPORT_TIMEOUT
+from yadt_controller.timing import ExecutionTimings, CONNECTING, SESSION_OPEN
+from yadt_controller.tracking import generate_tracking_id
+
+
+logger = logging.getLogger('multi_target')
+
+
+def read_targets_file(filename):
+    """
+        Reads the targets from the given file, one target per line. Empty
+        lines and lines starting with a # are ignored.
+
+        @return: list of targets
+    """
+    targets = []
+    with open(filename) as targets_file:
+        for line in targets_file:
+            target = line.strip()
+            if target and not target.startswith('#'):
+                targets.append(target)
+    return targets
+
+
+class MultiTargetExecution(object):
+    """
+        Runs one command on many targets. At most max_in_flight executions
+        run at the same time (all of them if max_in_flight is None), a new
+        target is started as soon as a running execution reached success or
+        failure. Once max_failures executions failed, no further targets
+        are started and the remaining ones are reported as skipped.
+    """
+
+    def __init__(self, host, port, targets, max_in_flight=None, max_failures=None, endpoints=None):
+        if not targets:
+            raise ValueError('at least one target is required')
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1, got {0}'.format(max_in_flight))
+        if max_failures is not None and max_failures < 1:
+            raise ValueError('max_failures must be at least 1, got {0}'.format(max_failures))
+        self.host = host
+        self.port = int(port)
+        self.endpoints = endpoints
+        self.targets = targets
+        self.max_in_flight = max_in_flight or len(targets)
+        self.max_failures = max_failures
+        self.event_handlers = [EventHandler(host, port, target) for target in targets]
+        self.queued_event_handlers = list(self.event_handlers)
+        self.started_event_handlers = []
+        self.finished_event_handlers = set()
+        self.completed_event_handlers = set()
+        self.unconnected_event_handlers = []
+        self.event_dispatcher = TrackingIdDispatcher()
+        self.failures = 0
+        self.timings = ExecutionTimings()
+        self.rollout_aborted = False
+        self.connect_timeout_call = None
+        self.exit_code = None
+
+    def initialize_for_execution_request(self, waiting_timeout=None,
+                                         pending_timeout=None,
+                                         command_to_execute=None,
+                                         arguments=None,
+                                         progress_handler=None,
+                                         error_report_timeout=DEFAULT_ERROR_REPORT_TIMEOUT,
+                                         result_reporter=None,
+                                         event_journal=None):
+        self.waiting_timeout = waiting_timeout
+        self.error_report_timeout = error_report_timeout
+        self.pending_timeout = pending_timeout
+        self.command_to_execute = command_to_execute
+        self.arguments = arguments or []
+        self.progress_handler = progress_handler
+        self.result_reporter = result_reporter
+        self.event_journal = event_journal
+        self.event_dispatcher.event_journal = event_journal
+
+        self._prepare_broadcast_client()
+
+        for event_handler in self.event_handlers:
+            event_handler.wamp_broadcaster = self.wamp_broadcaster
+            event_handler.outcome_callback = partial(self.on_execution_finished, event_handler)
+            event_handler.completion_callback = partial(self.on_execution_complete, event_handler)
+
+        self.wamp_broadcaster.onEvent = self.event_dispatcher.dispatch
+        self.wamp_broadcaster.addOnSessionOpenHandler(
+            self.publish_execution_requests)
+        self.wamp_broadcaster.addOnReconnectHandler(self.subscribe_targets)
+        # the executions arm their own waiting timeouts once the session is open
+        self.connect_timeout_call = reactor.callLater(self.waiting_timeout, self.on_connect_timeout)
+        logger.info("Requesting: '{0} {1}' on {2} targets, at most {3} at a time".format(command_to_execute,
+                                                                                         ' '.join(self.arguments),
+                                                                                         len(self.targets),
+                                                                                         self.max_in_flight))
+        reactor.run()
+        self.exit_code = self.determine_exit_code()
+        self.display_summary()
+        if result_reporter is not None:
+            result_reporter.flush()
+        if event_journal is not None:
+            event_journal.close()
+        sys.exit(self.exit_code)
+
+    def publish_execution_requests(self):
+        if self.connect_timeout_call is not None and self.connect_timeout_call.active():
+            self.connect_timeout_call.cancel()
+        self.timings.mark(SESSION_OPEN)
+        self.subscribe_targets()
+        self.start_queued_executions()
+
+    def subscribe_targets(self):
+        for target in self.targets:
+            logger.debug('Subscribing to {0}'.format(target))
+            self.wamp_broadcaster.client.subscribe(self.event_dispatcher.dispatch, target)
+
+    def start_queued_executions(self):
+        while self.queued_event_handlers and not self.rollout_aborted:
+            if self.executions_in_flight() >= self.max_in_flight:
+                return
+            self.start_execution(self.queued_event_handlers.pop(0))
+
+    def start_execution(self, event_handler):
+        arguments = list(self.arguments)
+        tracking_id = generate_tracking_id(event_handler.target)
+        arguments.append('--tracking-id={0}'.format(tracking_id))
+        event_handler.prepare_execution_request(waiting_timeout=self.waiting_timeout,
+                                                pending_timeout=self.pending_timeout,
+                                                command_to_execute=self.command_to_execute,
+                                                arguments=arguments,
+                                                tracking_id=tracking_id,
+                                                progress_handler=self.progress_handler,
+                                                error_report_timeout=self.error_report_timeout,
+                                                result_reporter=self.result_reporter,
+                                                event_journal=self.event_journal)
+        # all executions share the connection, a queued one waited for its turn in the publish phase
+        for point in (CONNECTING, SESSION_OPEN):
+            if point in self.timings.points:
+                event_handler.timings.mark(point, at=self.timings.points[point])
+        self.started_event_handlers.append(event_handler)
+        self.event_dispatcher.register(event_handler)
+        event_handler.publish_execution_request()
+
+    def on_connect_timeout(self):
+        logger.error('Could not open a broadcaster session within {0} seconds, failing {1} targets.'.format(
+            self.waiting_timeout, len(self.queued_event_handlers)))
+        self.unconnected_event_handlers, self.queued_event_handlers = self.queued_event_handlers, []
+        for event_handler in self.unconnected_event_handlers:
+            event_handler.exit_code = 1
+            self.failures += 1
+        self.rollout_aborted = True
+        reactor.stop()
+
+    def executions_in_flight(self):
+        return len(self.started_event_handlers) - len(self.finished_event_handlers)
+
+    def on_execution_finished(self, event_handler):
+        self.finished_event_handlers.add(event_handler)
+        if event_handler.exit_code != 0:
+            self.failures += 1
+            if self.max_failures is not None and self.failures >= self.max_failures and not self.rollout_aborted:
+                self.rollout_aborted = True
+                logger.error('Stopping rollout after {0} failed executions, {1} targets will be skipped.'.format(
+                    self.failures, len(self.queued_event_handlers)))
+        self.start_queued_executions()
+
+    def on_execution_complete(self, event_handler):
+        self.completed_event_handlers.add(event_handler)
+        self.event_dispatcher.unregister(event_handler)
+        nothing_left_to_start = self.rollout_aborted or not self.queued_event_handlers
+        if nothing_left_to_start and len(self.completed_event_handlers) == len(self.started_event_handlers):
+            reactor.stop()
+
+    def determine_exit_code(self):
+        for event_handler in self.event_handlers:
+            if event_handler.exit_code != 0:
+                return 1
+        return 0
+
+    def display_summary(self):
+        failed_targets = []
+        skipped_targets = []
+        for event_handler in self.event_handlers:
+            if event_handler in self.queued_event_handlers:
+                skipped_targets.append(event_handler.target)
+            elif event_handler in self.unconnected_event_handlers:
+                failed_targets.append(event_handler.target)
+            elif event_handler.exit_code == 0:
+                event_handler.display_summary("Success")
+            else:
+                event_handler.display_summary("FAILED")
+                failed_targets.append(event_handler.target)
+
+        succeeded_targets = len(self.targets) - len(failed_targets) - len(skipped_targets)
+        logger.info('{0} of {1} targets succeeded.'.format(succeeded_targets, len(self.targets)))
+        if failed_targets:
+            logger.error('Failed targets: {0}'.format(', '.join(failed_targets)))
+        if skipped_targets:
+            logger.error('Skipped targets: {0}'.format(', '.join(skipped_targets)))
+
+    def _prepare_broadcast_client(self):
+        self.timings.mark(CONNECTING)
+        self.wamp_broadcaster = ReconnectingWampBroadcaster(self.host, self.port, endpoints=self.endpoints)
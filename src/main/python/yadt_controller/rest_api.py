@@ -14,39 +14,241 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+"""
+        Client for the REST API of the YADT broadcaster. All requests go
+        through one shared requests session, so that connections to the
+        broadcaster are pooled and kept alive between requests.
+
+        Given several broadcasters, select_endpoint probes them in parallel
+        and picks the one responding first.
+"""
+
+import codecs
 import logging
+import socket
+import threading
+from collections import namedtuple
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 
-from requests import get, codes
+from requests import Session, codes
+from requests.adapters import HTTPAdapter
 
 
 logger = logging.getLogger("rest_api")
 logging.getLogger("requests").setLevel(logging.ERROR)
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_PROBE_TIMEOUT = 2
+NOT_MODIFIED = 304
+
+TargetInfo = namedtuple('TargetInfo', ['target', 'info', 'error'])
+
+_shared_session = None
+
 
 class EndpointException(BaseException):
     pass
 
 
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+        @return: a requests session keeping up to pool_size connections per
+        broadcaster alive.
+    """
+    if pool_size < 1:
+        raise ValueError('pool size must be at least 1, got {0}'.format(pool_size))
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_shared_session():
+    global _shared_session
+    if _shared_session is None:
+        _shared_session = create_session()
+    return _shared_session
+
+
+def configure_pool_size(pool_size):
+    """
+        Replaces the shared session by one with the given pool size.
+    """
+    global _shared_session
+    previous_session = _shared_session
+    _shared_session = create_session(pool_size)
+    if previous_session is not None:
+        previous_session.close()
+
+
+def select_endpoint(endpoints, timeout_in_seconds=DEFAULT_PROBE_TIMEOUT, connect=socket.create_connection):
+    """
+        Opens a TCP connection to every broadcaster at once, a single
+        broadcaster is returned without probing.
+
+        @return: the (host, port) of the first broadcaster accepting the
+        connection.
+        @raise EndpointException: when none of them does.
+    """
+    if len(endpoints) == 1:
+        return endpoints[0]
+
+    probe_results = Queue()
+
+    def probe(endpoint):
+        try:
+            connect(endpoint, timeout_in_seconds).close()
+        except Exception as e:
+            probe_results.put((endpoint, e))
+        else:
+            probe_results.put((endpoint, None))
+
+    for endpoint in endpoints:
+        prober = threading.Thread(target=probe, args=(endpoint,))
+        prober.daemon = True
+        prober.start()
+
+    errors = []
+    for _ in endpoints:
+        endpoint, error = probe_results.get()
+        if error is None:
+            logger.debug("Selected broadcaster {0}:{1}".format(*endpoint))
+            return endpoint
+        errors.append('{0}:{1} ({2})'.format(endpoint[0], endpoint[1], error))
+    raise EndpointException('None of the broadcasters responded: {0}'.format(', '.join(errors)))
+
+
+def fetch_target_infos(targets, host, port, timeout_in_seconds=5, session=None, max_workers=1, cache=None):
+    """
+        Fetches the info of many targets over the same connection pool,
+        using up to max_workers threads. Failing targets do not stop the
+        others, their error is reported in the result instead.
+
+        @return: generator of TargetInfo, one per target, in the order the
+        fetches completed.
+    """
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1, got {0}'.format(max_workers))
+    targets = list(targets)
+    if max_workers == 1 or len(targets) < 2:
+        for target in targets:
+            yield _fetch_target_info(target, host, port, timeout_in_seconds, session, cache)
+        return
+
+    queued_targets = Queue()
+    for target in targets:
+        queued_targets.put(target)
+    target_infos = Queue()
+
+    def fetch_queued_targets():
+        while True:
+            try:
+                target = queued_targets.get_nowait()
+            except Empty:
+                return
+            target_infos.put(_fetch_target_info(target, host, port, timeout_in_seconds, session, cache))
+
+    for _ in range(min(max_workers, len(targets))):
+        worker = threading.Thread(target=fetch_queued_targets)
+        worker.daemon = True
+        worker.start()
+
+    for _ in targets:
+        yield target_infos.get()
+
+
+def _fetch_target_info(target, host, port, timeout_in_seconds, session, cache):
+    endpoint = TargetInfoEndpoint(target, host, port, session=session, cache=cache)
+    try:
+        return TargetInfo(target, endpoint.fetch(timeout_in_seconds), None)
+    except EndpointException as e:
+        return TargetInfo(target, None, e)
+    except Exception as e:
+        return TargetInfo(target, None, EndpointException(e))
+
+
 class TargetInfoEndpoint(object):
 
-    def __init__(self, target, host, port):
+    def __init__(self, target, host, port, session=None, cache=None):
         self.target = target
         self.host = host
         self.port = port
+        self.session = session
+        self.cache = cache
+
+    def stream(self, timeout_in_seconds=5, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+            Fetches the info without buffering it, bypassing the cache.
+
+            @return: generator of text chunks
+        """
+        info_url = self._create_info_url()
+        logger.debug("Streaming info from {0}".format(info_url))
+
+        session = self.session or get_shared_session()
+        try:
+            response = session.get(info_url, timeout=timeout_in_seconds, stream=True)
+        except Exception as e:
+            raise EndpointException(e)
+
+        try:
+            self.validate_response(response)
+            return self._decode_chunks(response, chunk_size)
+        except EndpointException:
+            response.close()
+            raise
+
+    def _decode_chunks(self, response, chunk_size):
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        try:
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b'', True)
+            except Exception as e:
+                raise EndpointException(e)
+        finally:
+            response.close()
+
+    def _create_info_url(self):
+        return "http://{0}:{1}/api/v1/targets/{2}/full".format(self.host, self.port, self.target)
 
     def fetch(self, timeout_in_seconds=5):
-        info_url = "http://{0}:{1}/api/v1/targets/{2}/full".format(self.host,
-                                                                   self.port,
-                                                                   self.target)
+        cached_entry = None
+        if self.cache is not None:
+            cached_entry = self.cache.get(self.host, self.port, self.target)
+            if cached_entry is not None and self.cache.is_fresh(cached_entry):
+                logger.debug("Using cached info of {0}".format(self.target))
+                return cached_entry.info
+
+        info_url = self._create_info_url()
         logger.debug("Fetching info from {0}".format(info_url))
 
+        session = self.session or get_shared_session()
         try:
-            response = get(info_url, timeout=timeout_in_seconds)
+            if cached_entry is not None:
+                response = session.get(info_url, timeout=timeout_in_seconds,
+                                       headers=self._create_revalidation_headers(cached_entry))
+            else:
+                response = session.get(info_url, timeout=timeout_in_seconds)
         except Exception as e:
             raise EndpointException(e)
 
+        if cached_entry is not None and response.status_code == NOT_MODIFIED:
+            self.cache.refresh(self.host, self.port, self.target)
+            return cached_entry.info
+
         self.validate_response(response)
 
+        if self.cache is not None:
+            self.cache.put(self.host, self.port, self.target, response.text,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
         return response.text
 
     def validate_response(self, response):
@@ -54,3 +256,11 @@ class TargetInfoEndpoint(object):
             raise EndpointException(
                 "Info request returned non-ok code {0} ({1})".format(response.status_code,
                                                                      response.reason))
+
+    def _create_revalidation_headers(self, cached_entry):
+        headers = {}
+        if cached_entry.etag:
+            headers['If-None-Match'] = cached_entry.etag
+        if cached_entry.last_modified:
+            headers['If-Modified-Since'] = cached_entry.last_modified
+        return headers
@@ -0,0 +1,175 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        A stand-in for the broadcaster and a fleet of receivers, running in
+        the process of the controller, so that throughput and timeout
+        behaviour can be measured on one box without a network:
+
+            receivers = SimulatedReceivers(start_latency=0.05, execution_time=1, failure_ratio=0.1)
+            broadcaster = SimulatedBroadcaster(receivers, noise_rate=500)
+            controller = Controller('localhost', 8081)
+            controller.connect(broadcaster)
+
+        The receivers answer every request like a yadtreceiver does: started,
+        call-info, service changes and finished, or failed followed by an
+        error report. Some requests can be left unanswered, or started but
+        never finished, to provoke waiting and pending timeouts. Noise are
+        events of foreign executions on the subscribed targets.
+
+        The broadcaster and the receivers schedule on the given reactor. The
+        timeouts of the executions are scheduled by the EventHandlers on the
+        global reactor, so a deterministic simulation on a
+        twisted.internet.task.Clock replaces yadt_controller.event_handler.reactor
+        with the same clock.
+"""
+
+import random
+
+from twisted.internet import reactor as default_reactor
+
+
+class SimulatedReceivers(object):
+    """
+        Latencies are in seconds, each one varies by up to jitter (a
+        fraction of it) per request. The ratios are probabilities per
+        request.
+    """
+
+    def __init__(self, start_latency=0.05, execution_time=0.5, jitter=0.5, failure_ratio=0, unanswered_ratio=0,
+                 stuck_ratio=0, services=10, randomness=None):
+        self.start_latency = start_latency
+        self.execution_time = execution_time
+        self.jitter = jitter
+        self.failure_ratio = failure_ratio
+        self.unanswered_ratio = unanswered_ratio
+        self.stuck_ratio = stuck_ratio
+        self.services = services
+        self.random = randomness or random.Random()
+
+    def handle_request(self, broadcaster, target, cmd, tracking_id):
+        if self.random.random() < self.unanswered_ratio:
+            return
+        started_after = self._vary(self.start_latency)
+        finished_after = started_after + self._vary(self.execution_time)
+        host = 'receiver-{0}'.format(target)
+
+        def publish_later(delay, event_id, **fields):
+            broadcaster.reactor.callLater(delay, broadcaster.publish, target,
+                                          _create_event(event_id, target, tracking_id, cmd=cmd, **fields))
+
+        publish_later(started_after, 'cmd', state='started')
+        publish_later(started_after, 'call-info', host=host, log_file='/var/log/yadtreceiver/{0}.log'.format(
+            tracking_id))
+        if self.random.random() < self.stuck_ratio:
+            return
+        if self.services:
+            publish_later(finished_after, 'service-change', payload=[
+                {'uri': 'service://{0}/service{1}'.format(host, index), 'state': 'up'}
+                for index in range(self.services)])
+        if self.random.random() < self.failure_ratio:
+            publish_later(finished_after, 'cmd', state='failed')
+            publish_later(finished_after, 'cmd', state='failed', message='{0} failed on {1}'.format(cmd, host))
+        else:
+            publish_later(finished_after, 'cmd', state='finished')
+
+    def _vary(self, latency):
+        return max(0, latency * (1 + self.jitter * (2 * self.random.random() - 1)))
+
+
+class SimulatedBroadcaster(object):
+    """
+        Offers the part of the broadcaster client used by the controller.
+        The session opens connect_latency seconds after creation and never
+        drops. Noise is published at noise_rate events per second, spread
+        over the subscribed targets, each carrying noise_services service
+        changes.
+    """
+
+    def __init__(self, receivers, target=None, connect_latency=0.01, noise_rate=0, noise_services=0,
+                 reactor=None, randomness=None):
+        self.receivers = receivers
+        self.target = target
+        self.noise_rate = noise_rate
+        self.noise_services = noise_services
+        self.reactor = reactor or default_reactor
+        self.random = randomness or random.Random()
+        self.client = None
+        self.subscriptions = {}
+        self.on_session_open_handlers = []
+        self.reconnect_handlers = []
+        self.requests = 0
+        self.published_events = 0
+        self.noise_call = None
+        self.reactor.callLater(connect_latency, self._open_session)
+
+    def onEvent(self, event):
+        pass
+
+    def addOnSessionOpenHandler(self, handler):
+        self.on_session_open_handlers.append(handler)
+
+    def addOnReconnectHandler(self, handler):
+        self.reconnect_handlers.append(handler)
+
+    def subscribe(self, handler, topic):
+        self.subscriptions.setdefault(topic, []).append(handler)
+
+    def publish_request_for_target(self, target, cmd, args, tracking_id=None):
+        self.requests += 1
+        self.receivers.handle_request(self, target, cmd, tracking_id)
+        return True
+
+    def forget_request(self, tracking_id):
+        pass
+
+    def publish(self, target, event):
+        self.published_events += 1
+        for handler in self.subscriptions.get(target, ()):
+            handler(event)
+
+    def stop(self):
+        if self.noise_call is not None and self.noise_call.active():
+            self.noise_call.cancel()
+        self.noise_call = None
+
+    def _open_session(self):
+        self.client = self
+        if self.target:
+            self.subscribe(lambda event: self.onEvent(event), self.target)
+        handlers, self.on_session_open_handlers = self.on_session_open_handlers, []
+        for handler in handlers:
+            handler()
+        if self.noise_rate:
+            self._schedule_noise()
+
+    def _schedule_noise(self):
+        self.noise_call = self.reactor.callLater(1.0 / self.noise_rate, self._publish_noise)
+
+    def _publish_noise(self):
+        if self.subscriptions:
+            target = self.random.choice(sorted(self.subscriptions))
+            payload = [{'uri': 'service://noise/service{0}'.format(index), 'state': 'up'}
+                       for index in range(self.noise_services)]
+            self.publish(target, _create_event('service-change', target,
+                                               'noise-{0}'.format(self.published_events), payload=payload))
+        self._schedule_noise()
+
+
+def _create_event(event_id, target, tracking_id, payload=None, **fields):
+    event = {'type': 'event', 'id': event_id, 'tracking_id': tracking_id, 'target': target, 'payload': payload}
+    event.update(fields)
+    return event
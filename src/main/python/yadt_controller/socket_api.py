@@ -0,0 +1,86 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        The protocol spoken on the Unix domain socket of the controller
+        daemon (see yadt_controller.daemon), and the client side of it.
+
+        A client sends one request as a JSON object on a single line, the
+        daemon answers with JSON messages, one per line, and closes the
+        connection after the last one (a result, an info or an error).
+        This module only needs the standard library, so that submitting a
+        request is cheap.
+"""
+
+import json
+import socket
+
+EXECUTE_REQUEST = 'execute'
+INFO_REQUEST = 'info'
+
+ACCEPTED_MESSAGE = 'accepted'
+PROGRESS_MESSAGE = 'progress'
+RESULT_MESSAGE = 'result'
+INFO_MESSAGE = 'info'
+ERROR_MESSAGE = 'error'
+
+LINE_DELIMITER = b'\r\n'
+
+
+def create_execution_request(target, command, arguments, waiting_timeout, pending_timeout, error_report_timeout):
+    return {'request': EXECUTE_REQUEST,
+            'target': target,
+            'command': command,
+            'arguments': list(arguments),
+            'waiting_timeout': waiting_timeout,
+            'pending_timeout': pending_timeout,
+            'error_report_timeout': error_report_timeout}
+
+
+def create_info_request(target, timeout):
+    return {'request': INFO_REQUEST,
+            'target': target,
+            'timeout': timeout}
+
+
+def encode_message(message):
+    return json.dumps(message).encode('utf-8')
+
+
+def decode_message(line):
+    return json.loads(line.decode('utf-8'))
+
+
+def submit(socket_path, request):
+    """
+        Sends the request to the daemon listening on socket_path and yields
+        the messages of the daemon until it closes the connection.
+
+        @raise socket.error: when the daemon is not reachable.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        connection.sendall(encode_message(request) + LINE_DELIMITER)
+        stream = connection.makefile('rb')
+        try:
+            for line in iter(stream.readline, b''):
+                if line.strip():
+                    yield decode_message(line)
+        finally:
+            stream.close()
+    finally:
+        connection.close()
@@ -14,9 +14,127 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import atexit
+import json
+import sys
+import time
+
+DEFAULT_REPORT_BUFFER_SIZE = 64 * 1024
+
+# the escape character | goes first
+TEAMCITY_ESCAPES = (('|', '||'), ("'", "|'"), ('\n', '|n'), ('\r', '|r'), ('[', '|['), (']', '|]'))
+TEAMCITY_UNICODE_ESCAPES = ((u'\u0085', u'|x'), (u'\u2028', u'|l'), (u'\u2029', u'|p'))
+
+
+def escape_teamcity_value(value):
+    for character, escaped in TEAMCITY_ESCAPES:
+        value = value.replace(character, escaped)
+    if isinstance(value, type(u'')):
+        for character, escaped in TEAMCITY_UNICODE_ESCAPES:
+            value = value.replace(character, escaped)
+    return value
+
 
 class TeamCityProgressMessageHandler(object):
+    """
+        Writes TeamCity progress messages. They are buffered and written
+        together once per iteration of the given reactor, so the hundreds
+        of service changes of one event cost one write and one flush.
+        Without a reactor they are buffered until flush() is called.
+        Buffered messages are flushed at exit as well.
+    """
+
+    def __init__(self, reactor=None):
+        self.reactor = reactor
+        self.buffers = []
+        self.delayed_flush = None
+        atexit.register(self.flush)
 
     def output_progress(self, stream, message):
-        stream.write("##teamcity[progressMessage '{0}']\n".format(message))
-        stream.flush()
+        # concatenated, since formatting into a str would encode unicode messages as ASCII
+        line = "##teamcity[progressMessage '" + escape_teamcity_value(message) + "']\n"
+        if self.buffers and self.buffers[-1][0] is stream:
+            self.buffers[-1][1].append(line)
+        else:
+            self.buffers.append((stream, [line]))
+        if self.reactor is not None and self.delayed_flush is None:
+            self.delayed_flush = self.reactor.callLater(0, self.flush)
+
+    def flush(self):
+        if self.delayed_flush is not None and self.delayed_flush.active():
+            self.delayed_flush.cancel()
+        self.delayed_flush = None
+        buffers, self.buffers = self.buffers, []
+        for stream, lines in buffers:
+            stream.write(''.join(lines))
+            stream.flush()
+
+
+class JsonLinesResultReporter(object):
+    """
+        Writes one JSON object per line for every significant event of an
+        execution, for machines consuming the results. The lines are
+        buffered and written in batches of about buffer_size characters,
+        flush() writes the remaining ones.
+    """
+
+    def __init__(self, stream, buffer_size=DEFAULT_REPORT_BUFFER_SIZE, clock=time.time):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.clock = clock
+        self.lines = []
+        self.buffered_characters = 0
+
+    def report(self, event, **fields):
+        fields['event'] = event
+        fields['timestamp'] = self.clock()
+        line = json.dumps(fields, sort_keys=True)
+        self.lines.append(line)
+        self.buffered_characters += len(line) + 1
+        if self.buffered_characters >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        self.lines.append('')
+        self.stream.write('\n'.join(self.lines))
+        self.stream.flush()
+        self.lines = []
+        self.buffered_characters = 0
+
+    def close(self):
+        self.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class CombinedResultReporter(object):
+    """
+        Passes every record on to all of the given result reporters.
+    """
+
+    def __init__(self, reporters):
+        self.reporters = reporters
+
+    def report(self, event, **fields):
+        for reporter in self.reporters:
+            reporter.report(event, **dict(fields))
+
+    def flush(self):
+        for reporter in self.reporters:
+            reporter.flush()
+
+    def close(self):
+        for reporter in self.reporters:
+            reporter.close()
+
+
+def open_json_lines_result_reporter(filename):
+    """
+        @return: a JsonLinesResultReporter writing to the given file, or to
+        stdout if the filename is -.
+    """
+    if filename == '-':
+        return JsonLinesResultReporter(sys.stdout)
+    return JsonLinesResultReporter(open(filename, 'w'))
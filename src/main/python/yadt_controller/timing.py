@@ -0,0 +1,230 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+        Timings of the phases of a command execution, measured with a
+        monotonic clock so that adjusting the system time does not distort
+        them:
+
+        connect     from connecting to the broadcaster until the session is open
+        publish     from the open session until the request is published
+        waiting     from the request until a receiver started the command
+        pending     from the start until the command finished or failed
+        drain       from a failure until the error reports arrived (or the
+                    error report timeout expired)
+
+        The timings can be written to a local file, in the format of the
+        Prometheus node exporter textfile collector or as StatsD lines.
+"""
+
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger('timing')
+
+CONNECTING = 'connecting'
+SESSION_OPEN = 'session_open'
+PUBLISHED = 'published'
+STARTED = 'started'
+FINISHED = 'finished'
+FAILED = 'failed'
+COMPLETED = 'completed'
+
+PHASES = (('connect', CONNECTING, SESSION_OPEN),
+          ('publish', SESSION_OPEN, PUBLISHED),
+          ('waiting', PUBLISHED, STARTED),
+          ('pending', STARTED, FINISHED),
+          ('drain', FAILED, COMPLETED))
+
+PROMETHEUS_FORMAT = 'prometheus'
+STATSD_FORMAT = 'statsd'
+
+_CLOCK_MONOTONIC = 1  # linux/time.h
+_STATSD_UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def _find_monotonic_clock():
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if not sys.platform.startswith('linux'):
+        return time.time
+    try:
+        import ctypes
+        import ctypes.util
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    class Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+
+    def monotonic():
+        timespec = Timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+    return monotonic
+
+
+# time.monotonic is python 3 only, python 2 on linux asks clock_gettime
+monotonic = _find_monotonic_clock()
+
+
+class ExecutionTimings(object):
+    """
+        The points in time an execution passed. Only the first time a
+        point is passed counts.
+    """
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.points = {}
+
+    def mark(self, point, at=None):
+        if point not in self.points:
+            self.points[point] = self.clock() if at is None else at
+
+    def elapsed(self, start, end):
+        """
+            @return: the seconds between both points, None unless the
+            execution passed both of them.
+        """
+        if start not in self.points or end not in self.points:
+            return None
+        return self.points[end] - self.points[start]
+
+    def phases(self):
+        """
+            @return: dictionary of the duration of every phase the execution
+            went through completely.
+        """
+        durations = {}
+        for phase, start, end in PHASES:
+            duration = self.elapsed(start, end)
+            if duration is not None:
+                durations[phase] = duration
+        return durations
+
+
+def format_phases(phases):
+    return ', '.join('{0} {1:.3f}s'.format(phase, phases[phase]) for phase, _, _ in PHASES if phase in phases)
+
+
+class PhaseTimingsFile(object):
+    """
+        A result reporter collecting the timings of the summaries it is
+        given, the whole file is (re)written atomically on flush(), as the
+        textfile collector may read it at any time.
+    """
+
+    def __init__(self, filename, file_format=PROMETHEUS_FORMAT):
+        if file_format not in (PROMETHEUS_FORMAT, STATSD_FORMAT):
+            raise ValueError('Unknown timings format {0!r}, use {1} or {2}'.format(file_format,
+                                                                                   PROMETHEUS_FORMAT,
+                                                                                   STATSD_FORMAT))
+        self.filename = filename
+        self.file_format = file_format
+        self.summaries = []
+
+    def report(self, event, **fields):
+        if event == 'summary':
+            self.summaries.append(fields)
+
+    def flush(self):
+        if not self.summaries:
+            return
+        if self.file_format == PROMETHEUS_FORMAT:
+            lines = format_prometheus_textfile(self.summaries)
+        else:
+            lines = format_statsd_lines(self.summaries)
+        try:
+            write_file_atomically(self.filename, ''.join(line + '\n' for line in lines))
+        except (IOError, OSError) as e:
+            logger.warn('Could not write timings to %s : %s', self.filename, e)
+
+    def close(self):
+        self.flush()
+
+
+def write_file_atomically(filename, content):
+    """
+        Writes to a temporary file next to the given one and renames it,
+        so that readers never see a partially written file. The file gets
+        the permissions a newly created file would get, since mkstemp
+        makes it readable by its owner only.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w') as written_file:
+            written_file.write(content)
+        os.chmod(temporary_path, 0o666 & ~_current_umask())
+        os.rename(temporary_path, filename)
+    except (IOError, OSError):
+        os.remove(temporary_path)
+        raise
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def format_prometheus_textfile(summaries):
+    lines = ['# HELP yadtcontroller_phase_duration_seconds Duration of the phases of the last command execution.',
+             '# TYPE yadtcontroller_phase_duration_seconds gauge']
+    for summary in summaries:
+        phases = summary.get('phases') or {}
+        for phase, _, _ in PHASES:
+            if phase in phases:
+                lines.append('yadtcontroller_phase_duration_seconds{{target="{0}",command="{1}",phase="{2}"}} {3!r}'
+                             .format(escape_label_value(summary.get('target')),
+                                     escape_label_value(summary.get('command')),
+                                     phase,
+                                     phases[phase]))
+    return lines
+
+
+def format_statsd_lines(summaries):
+    lines = []
+    for summary in summaries:
+        phases = summary.get('phases') or {}
+        for phase, _, _ in PHASES:
+            if phase in phases:
+                lines.append('yadtcontroller.{0}.{1}.{2}:{3}|ms'.format(_to_statsd_name(summary.get('target')),
+                                                                        _to_statsd_name(summary.get('command')),
+                                                                        phase,
+                                                                        int(round(phases[phase] * 1000))))
+    return lines
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _to_statsd_name(value):
+    return _STATSD_UNSAFE_CHARACTERS.sub('_', str(value))
@@ -17,18 +17,69 @@
 """
         Provides convenience functions for tracking the remote execution of a
         program.
+
+        Tracking IDs read like "(timestamp #pid-sequence):user@host->target".
+        The process ID and a per process sequence number make them unique,
+        also when many executions start within the same clock tick. The
+        user and host names are resolved once per process, since getfqdn()
+        blocks as long as the reverse DNS lookup takes.
 """
 
 import getpass
+import itertools
+import logging
+import os
 import socket
+import threading
 from datetime import datetime
 
 
+logger = logging.getLogger('tracking')
+
+DEFAULT_HOST_NAME_TIMEOUT = 2
+
+_identity = None
+_identity_lock = threading.Lock()
+_sequence = itertools.count(1)
+
+
 def generate_tracking_id(target):
-    user_name = getpass.getuser()
-    user_host_name = socket.getfqdn()
-    timestamp = get_timestamp()
-    return '"({0}):{1}@{2}->{3}"'.format(timestamp, user_name, user_host_name, target)
+    # the process ID is not cached, a forked process starts a sequence of its own
+    return '"({0} #{1}-{2}):{3}->{4}"'.format(get_timestamp(), os.getpid(), next(_sequence), get_identity(), target)
+
+
+def get_identity(timeout_in_seconds=DEFAULT_HOST_NAME_TIMEOUT):
+    """
+        @return: user@host of this process, resolved by the first call.
+    """
+    global _identity
+    if _identity is None:
+        with _identity_lock:
+            if _identity is None:
+                _identity = '{0}@{1}'.format(_get_user_name(), _get_host_name(timeout_in_seconds))
+    return _identity
+
+
+def _get_user_name():
+    try:
+        return getpass.getuser()
+    except (ImportError, KeyError, OSError) as e:
+        logger.warn('Could not determine the user name : {0}'.format(e))
+        return 'unknown'
+
+
+def _get_host_name(timeout_in_seconds):
+    host_names = []
+    resolver = threading.Thread(target=lambda: host_names.append(socket.getfqdn()), name='getfqdn')
+    resolver.daemon = True
+    resolver.start()
+    resolver.join(timeout_in_seconds)
+    if host_names and host_names[0]:
+        return host_names[0]
+    host_name = socket.gethostname()
+    logger.warn('Could not resolve the fully qualified host name within {0} seconds, using {1}'.format(
+        timeout_in_seconds, host_name))
+    return host_name
 
 
 # datetime.so cannot be monkey-patched, so isolate it instead
@@ -0,0 +1,184 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from mock import Mock, patch
+from twisted.internet.defer import Deferred, fail, succeed
+from yadtbroadcastclient import WampBroadcaster
+
+from yadt_controller.broadcaster import (NoBroadcasterResponded, ReconnectingWampBroadcaster, Wamp1ClientAdapter,
+                                         probe_endpoints)
+
+
+def results_of(deferred):
+    results = []
+    deferred.addBoth(results.append)
+    return results
+
+
+class ProbeEndpointsTests(unittest.TestCase):
+
+    def test_should_fire_with_first_broadcaster_accepting_connection(self):
+        probes = {'slow': Deferred(), 'fast': Deferred(), 'down': Deferred()}
+        protocols = {'slow': Mock(), 'fast': Mock()}
+
+        result = results_of(probe_endpoints([('slow', 8081), ('fast', 8082), ('down', 8081)],
+                                            connect=lambda host, port, timeout: probes[host]))
+        probes['down'].errback(IOError('connection refused'))
+        probes['fast'].callback(protocols['fast'])
+        probes['slow'].callback(protocols['slow'])
+
+        self.assertEqual(result, [('fast', 8082)])
+        protocols['fast'].transport.loseConnection.assert_called_once_with()
+        protocols['slow'].transport.loseConnection.assert_called_once_with()
+
+    def test_should_fail_when_no_broadcaster_responds(self):
+        failure, = results_of(probe_endpoints([('down1', 8081), ('down2', 8081)],
+                                              connect=lambda host, port, timeout: fail(IOError('refused'))))
+
+        self.assertTrue(failure.check(NoBroadcasterResponded))
+
+
+class Wamp1ClientAdapterTests(unittest.TestCase):
+
+    def test_should_call_subscribers_with_event_only(self):
+        client = Mock()
+        handler = Mock()
+
+        Wamp1ClientAdapter(client).subscribe(handler, 'target')
+        topic, callback = client.subscribe.call_args[0]
+        callback('target', {'id': 'cmd'})
+
+        self.assertEqual(topic, 'target')
+        handler.assert_called_once_with({'id': 'cmd'})
+
+
+@patch.object(WampBroadcaster, '_client_watchdog')
+class ReconnectingWampBroadcasterTests(unittest.TestCase):
+
+    @patch.object(WampBroadcaster, 'onSessionOpen')
+    @patch('yadt_controller.broadcaster.is_wamp1_client', return_value=True)
+    def test_should_wrap_wamp1_client_when_session_opens(self, is_wamp1_client, session_open, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        client = Mock()
+        broadcaster.client = client
+
+        broadcaster.onSessionOpen()
+
+        self.assertTrue(isinstance(broadcaster.client, Wamp1ClientAdapter))
+        self.assertTrue(broadcaster.client.client is client)
+        is_wamp1_client.assert_called_once_with(client)
+
+    @patch.object(WampBroadcaster, 'onSessionOpen')
+    def test_should_use_wamp2_session_as_it_is(self, session_open, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        client = Mock()
+        broadcaster.client = client
+
+        broadcaster.onSessionOpen()
+
+        self.assertTrue(broadcaster.client is client)
+
+    @patch.object(WampBroadcaster, 'onSessionOpen')
+    def test_should_run_reconnect_handlers_after_every_session_but_the_first(self, session_open, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        reconnect_handler = Mock()
+        broadcaster.addOnReconnectHandler(reconnect_handler)
+
+        broadcaster.onSessionOpen()
+        self.assertEqual(reconnect_handler.call_count, 0)
+
+        broadcaster.onSessionOpen()
+        broadcaster.onSessionOpen()
+
+        self.assertEqual(reconnect_handler.call_count, 2)
+        self.assertEqual(session_open.call_count, 3)
+
+    def test_should_publish_request_only_once_per_tracking_id(self, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        broadcaster.client = Mock()
+
+        self.assertTrue(broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1'))
+        self.assertFalse(broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1'))
+
+        self.assertEqual(broadcaster.client.publish.call_count, 1)
+        published_target, published_event = broadcaster.client.publish.call_args[0]
+        self.assertEqual((published_target, published_event['id'], published_event['tracking_id']),
+                         ('target', 'request', 'id-1'))
+
+    def test_should_queue_request_only_once_while_disconnected(self, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+
+        broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1')
+        broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1')
+
+        self.assertEqual(len(broadcaster.queue), 1)
+
+    def test_should_publish_request_again_once_it_was_forgotten(self, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        broadcaster.client = Mock()
+        broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1')
+
+        broadcaster.forget_request('id-1')
+
+        self.assertTrue(broadcaster.publish_request_for_target('target', 'update', [], tracking_id='id-1'))
+
+    @patch.object(WampBroadcaster, '_connect')
+    @patch('yadt_controller.broadcaster.probe_endpoints')
+    def test_should_connect_to_first_responding_broadcaster(self, probe_endpoints, connect, _):
+        probe_endpoints.return_value = succeed(('broadcaster2', 8082))
+        broadcaster = ReconnectingWampBroadcaster('broadcaster1', 8081,
+                                                  endpoints=[('broadcaster1', 8081), ('broadcaster2', 8082)])
+
+        broadcaster._connect()
+
+        probe_endpoints.assert_called_once_with([('broadcaster1', 8081), ('broadcaster2', 8082)])
+        self.assertEqual(broadcaster.url, 'ws://broadcaster2:8082/')
+        self.assertEqual(connect.call_count, 1)
+        self.assertFalse(broadcaster.probing)
+
+    @patch.object(WampBroadcaster, '_connect')
+    @patch('yadt_controller.broadcaster.probe_endpoints')
+    def test_should_not_probe_again_while_probing(self, probe_endpoints, connect, _):
+        probe_endpoints.return_value = Deferred()
+        broadcaster = ReconnectingWampBroadcaster('broadcaster1', 8081,
+                                                  endpoints=[('broadcaster1', 8081), ('broadcaster2', 8082)])
+
+        broadcaster._connect()
+        broadcaster._connect()
+
+        self.assertEqual(probe_endpoints.call_count, 1)
+        self.assertEqual(connect.call_count, 0)
+
+    @patch.object(WampBroadcaster, '_connect')
+    @patch('yadt_controller.broadcaster.probe_endpoints')
+    def test_should_connect_without_probing_single_broadcaster(self, probe_endpoints, connect, _):
+        broadcaster = ReconnectingWampBroadcaster('broadcaster', 8081)
+
+        broadcaster._connect()
+
+        self.assertFalse(probe_endpoints.called)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_should_publish_requests_without_tracking_id(self, _):
+        broadcaster = ReconnectingWampBroadcaster('host', 8081)
+        broadcaster.client = Mock()
+
+        broadcaster.publish_request_for_target('target', 'update', [])
+        broadcaster.publish_request_for_target('target', 'update', [])
+
+        self.assertEqual(broadcaster.client.publish.call_count, 2)
@@ -24,7 +24,8 @@ from yadtcommons.configuration import YadtConfigParser, ConfigurationException
 
 from yadt_controller.configuration import (SECTION_BROADCASTER,
                                            ControllerConfigLoader,
-                                           load)
+                                           load,
+                                           parse_endpoints)
 
 
 class ControllerConfigLoaderTests (unittest.TestCase):
@@ -142,3 +143,30 @@ class LoadTest (unittest.TestCase):
 
         self.assertEqual(call(), mock_loader.get_broadcaster_port.call_args)
         self.assertEqual(12345, actual_configuration['broadcaster-port'])
+
+
+class ParseEndpointsTest (unittest.TestCase):
+
+    def test_should_use_port_for_single_host(self):
+        self.assertEqual(parse_endpoints('broadcaster', 8081), [('broadcaster', 8081)])
+
+    def test_should_parse_comma_separated_hosts_with_optional_ports(self):
+        self.assertEqual(parse_endpoints('broadcaster1, broadcaster2:8082,', 8081),
+                         [('broadcaster1', 8081), ('broadcaster2', 8082)])
+
+    def test_should_not_mistake_ipv6_address_for_host_and_port(self):
+        self.assertEqual(parse_endpoints('::1', 8081), [('::1', 8081)])
+
+    @patch('yadt_controller.configuration.ControllerConfigLoader')
+    def test_should_use_first_endpoint_as_broadcaster_host_and_port(self, mock_loader_class):
+        mock_loader = Mock(ControllerConfigLoader)
+        mock_loader.get_broadcaster_host.return_value = 'broadcaster1:8082, broadcaster2'
+        mock_loader.get_broadcaster_port.return_value = 8081
+        mock_loader_class.return_value = mock_loader
+
+        actual_configuration = load('abc')
+
+        self.assertEqual(actual_configuration['broadcaster-host'], 'broadcaster1')
+        self.assertEqual(actual_configuration['broadcaster-port'], 8082)
+        self.assertEqual(actual_configuration['broadcaster-endpoints'],
+                         [('broadcaster1', 8082), ('broadcaster2', 8081)])
@@ -0,0 +1,222 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from mock import patch
+from mockito import when, verify, unstub, any as any_value, mock, never
+
+import yadt_controller.controller
+import yadt_controller.event_handler
+from yadt_controller.controller import Controller, ExecutionResult, BlockingController
+
+
+def results_of(deferred):
+    results = []
+    deferred.addBoth(results.append)
+    return results
+
+
+class ControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.wampbroadcaster = mock(ReconnectingWampBroadcaster)
+        self.wampbroadcaster.client = mock()
+        when(yadt_controller.controller).ReconnectingWampBroadcaster(
+            any_value(), any_value(), endpoints=None).thenReturn(self.wampbroadcaster)
+        when(yadt_controller.event_handler.reactor).callLater(any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        when(yadt_controller.event_handler.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).debug(any_value(), any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.controller.logger).debug(any_value()).thenReturn(None)
+        self.controller = Controller('host', 8081)
+
+    def tearDown(self):
+        unstub()
+
+    def send(self, tracking_id, **event):
+        event['tracking_id'] = tracking_id
+        event.setdefault('id', 'cmd')
+        self.controller.event_dispatcher.dispatch(event)
+
+    def test_should_publish_executions_requested_before_session_was_open_once_it_is(self):
+        self.controller.execute('target', 'update', ['--foo'], tracking_id='id-1')
+        verify(self.wampbroadcaster, never).publish_request_for_target(any_value(), any_value(), any_value(),
+                                                                       tracking_id=any_value())
+
+        self.controller.on_session_open()
+
+        verify(self.wampbroadcaster.client).subscribe(self.controller.event_dispatcher.dispatch, 'target')
+        verify(self.wampbroadcaster).publish_request_for_target('target', 'update', ['--foo', '--tracking-id=id-1'],
+                                                                tracking_id='id-1')
+
+    def test_should_fire_result_without_stopping_the_reactor(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        results = results_of(self.controller.execute('target', 'update', tracking_id='id-1'))
+
+        self.send('id-1', id='call-info', host='some-machine', log_file='/path/to/log')
+        self.send('id-1', state='started')
+        self.send('id-1', state='finished')
+
+        result, = results
+        self.assertTrue(isinstance(result, ExecutionResult))
+        self.assertEqual((result.target, result.tracking_id, result.command, result.arguments, result.exit_code,
+                          result.state, result.remote_host, result.log_file),
+                         ('target', 'id-1', 'update', [], 0, 'success', 'some-machine', '/path/to/log'))
+        verify(yadt_controller.event_handler.reactor, never).stop()
+        self.assertEqual(self.controller.event_dispatcher.event_handlers, {})
+
+    def test_should_collect_service_changes_in_result(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        results = results_of(self.controller.execute('target', 'update', tracking_id='id-1'))
+
+        self.send('id-1', id='service-change', payload=[{'uri': 'service://foo/bar', 'state': 'up'}])
+        self.send('id-1', state='started')
+        self.send('id-1', state='finished')
+
+        self.assertEqual(results[0].service_changes, [('service://foo/bar', 'up')])
+
+    def test_should_run_executions_concurrently_over_one_session(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        first = results_of(self.controller.execute('target1', 'update', tracking_id='id-1'))
+        second = results_of(self.controller.execute('target2', 'update', tracking_id='id-2'))
+
+        self.send('id-2', state='started')
+        self.send('id-2', state='finished')
+        self.send('id-1', state='started')
+        self.send('id-1', state='failed')
+        self.send('id-1', id='call-info', host='some-machine', log_file='/path/to/log')
+        self.send('id-1', state='failed', message='the internet is down')
+
+        verify(yadt_controller.controller, times=1).ReconnectingWampBroadcaster('host', 8081, endpoints=None)
+        self.assertEqual([(result.target, result.exit_code) for result in first + second],
+                         [('target1', 1), ('target2', 0)])
+
+    def test_should_subscribe_to_all_targets_again_on_reconnect(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        self.controller.execute('target1', 'update', tracking_id='id-1')
+        self.controller.execute('target2', 'update', tracking_id='id-2')
+        verify(self.wampbroadcaster).addOnReconnectHandler(self.controller.on_reconnect)
+        when(yadt_controller.controller.logger).warning(any_value()).thenReturn(None)
+
+        self.controller.on_reconnect()
+
+        verify(self.wampbroadcaster.client, times=2).subscribe(self.controller.event_dispatcher.dispatch, 'target1')
+        verify(self.wampbroadcaster.client, times=2).subscribe(self.controller.event_dispatcher.dispatch, 'target2')
+        verify(yadt_controller.controller.logger).warning(any_value())
+
+    def test_should_subscribe_on_reconnect_when_disconnected(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        self.wampbroadcaster.client = None
+
+        self.controller.execute('target', 'update', tracking_id='id-1')
+
+        self.assertEqual(self.controller.subscribed_targets, set(['target']))
+
+    def test_should_forget_request_of_completed_execution(self):
+        self.controller.connect()
+        self.controller.on_session_open()
+        self.controller.execute('target', 'update', tracking_id='id-1')
+
+        self.send('id-1', state='started')
+        self.send('id-1', state='finished')
+
+        verify(self.wampbroadcaster).forget_request('id-1')
+
+    def test_should_flush_event_journal_when_execution_completes(self):
+        event_journal = mock()
+        controller = Controller('host', 8081, event_journal=event_journal)
+        controller.connect()
+        controller.on_session_open()
+        results = results_of(controller.execute('target', 'update', tracking_id='id-1'))
+        verify(event_journal, never).flush()
+
+        controller.event_dispatcher.dispatch({'id': 'cmd', 'tracking_id': 'id-1', 'state': 'started'})
+        controller.event_dispatcher.dispatch({'id': 'cmd', 'tracking_id': 'id-1', 'state': 'finished'})
+
+        self.assertEqual(len(results), 1)
+        verify(event_journal).flush()
+        verify(event_journal, never).close()
+
+    def test_should_fail_when_tracking_id_is_already_in_use(self):
+        self.controller.execute('target', 'update', tracking_id='id-1')
+
+        failure, = results_of(self.controller.execute('target', 'update', tracking_id='id-1'))
+
+        self.assertTrue(failure.check(ValueError))
+        verify(yadt_controller.event_handler.reactor, times=1).callLater(any_value(), any_value())
+
+
+class BlockingControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = BlockingController('host', 8081)
+
+    @patch('yadt_controller.controller.atexit')
+    @patch('yadt_controller.controller.threading.Thread')
+    @patch('yadt_controller.controller.blockingCallFromThread')
+    def test_should_start_reactor_thread_once_and_block_for_results(self, blocking_call, thread, _):
+        blocking_call.return_value = 'result'
+
+        first_result = self.controller.execute('target1', 'update', ['--foo'], waiting_timeout=10)
+        second_result = self.controller.execute('target2', 'update')
+
+        self.assertEqual((first_result, second_result), ('result', 'result'))
+        self.assertEqual(thread.call_count, 1)
+        self.assertTrue(thread.return_value.daemon)
+        thread.return_value.start.assert_called_once_with()
+        blocking_call.assert_any_call(yadt_controller.controller.reactor, self.controller.controller.execute,
+                                      'target1', 'update', ['--foo'], waiting_timeout=10)
+
+    @patch('yadt_controller.controller.isInIOThread', return_value=True)
+    def test_should_refuse_to_block_the_running_reactor(self, _):
+        with patch.object(yadt_controller.controller.reactor, 'running', True):
+            self.assertRaises(RuntimeError, self.controller.execute, 'target', 'update')
+
+    @patch('yadt_controller.controller.threading.Thread')
+    @patch('yadt_controller.controller.reactor')
+    def test_should_refuse_to_execute_after_stop(self, reactor, thread):
+        reactor.running = False
+        self.controller.stop()
+
+        self.assertRaises(RuntimeError, self.controller.execute, 'target', 'update')
+        self.assertFalse(thread.called)
+
+    def test_should_close_event_journal_once_when_stopped(self):
+        event_journal = mock()
+        controller = BlockingController('host', 8081, event_journal=event_journal)
+
+        controller.stop()
+        controller.stop()
+
+        verify(event_journal, times=1).close()
+
+    @patch('yadt_controller.controller.reactor')
+    def test_should_stop_reactor_it_started(self, reactor):
+        reactor_thread = mock()
+        self.controller.reactor_thread = reactor_thread
+
+        self.controller.stop()
+        self.controller.stop()
+
+        reactor.callFromThread.assert_called_once_with(reactor.stop)
+        verify(reactor_thread).join()
@@ -0,0 +1,234 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from mockito import when, verify, unstub, any as any_value, mock, never
+from twisted.internet.defer import succeed, fail
+from twisted.test.proto_helpers import StringTransport
+
+import yadt_controller.controller
+import yadt_controller.daemon
+import yadt_controller.event_handler
+from yadt_controller.daemon import ControllerDaemon, ControllerRequestProtocol
+from yadt_controller.rest_api import EndpointException
+from yadt_controller.socket_api import encode_message, decode_message
+
+
+def connect(protocol):
+    transport = StringTransport()
+    protocol.makeConnection(transport)
+    return transport
+
+
+def sent_messages(transport):
+    return [decode_message(line) for line in transport.value().split(b'\r\n') if line]
+
+
+class ControllerDaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.wampbroadcaster = mock(ReconnectingWampBroadcaster)
+        self.wampbroadcaster.client = mock()
+        when(yadt_controller.controller).ReconnectingWampBroadcaster(
+            any_value(), any_value(), endpoints=None).thenReturn(self.wampbroadcaster)
+        when(yadt_controller.daemon).generate_tracking_id('target').thenReturn('id-target')
+        when(yadt_controller.daemon.reactor).run().thenReturn(None)
+        when(yadt_controller.daemon.reactor).callInThread(any_value()).thenReturn(None)
+        when(yadt_controller.daemon.reactor).listenUNIX(any_value(), any_value(), mode=any_value(),
+                                                        wantPID=any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.reactor).callLater(any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.daemon.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.daemon.logger).debug(any_value()).thenReturn(None)
+        when(yadt_controller.controller.logger).debug(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).debug(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).error(any_value()).thenReturn(None)
+
+        self.daemon = ControllerDaemon('host', 8081, '/run/controller.sock')
+        self.daemon.serve()
+        self.client = ControllerRequestProtocol(self.daemon)
+        self.transport = connect(self.client)
+
+    def tearDown(self):
+        unstub()
+
+    def send_execution_request(self):
+        self.client.lineReceived(encode_message({'request': 'execute',
+                                                 'target': 'target',
+                                                 'command': 'update',
+                                                 'arguments': ['--foo'],
+                                                 'waiting_timeout': 30,
+                                                 'pending_timeout': 60,
+                                                 'error_report_timeout': 5}))
+        return self.daemon.controller.event_dispatcher.event_handlers.get('id-target')
+
+    def test_should_listen_on_socket_with_one_broadcaster_session(self):
+        verify(yadt_controller.controller, times=1).ReconnectingWampBroadcaster('host', 8081, endpoints=None)
+        verify(yadt_controller.daemon.reactor).listenUNIX('/run/controller.sock', any_value(),
+                                                          mode=0o660, wantPID=True)
+        self.assertEqual(self.wampbroadcaster.onEvent, self.daemon.controller.event_dispatcher.dispatch)
+
+    def test_should_resolve_identity_for_tracking_ids_in_background(self):
+        verify(yadt_controller.daemon.reactor).callInThread(yadt_controller.daemon.get_identity)
+
+    def test_should_accept_execution_request_and_publish_it_once_session_is_open(self):
+        event_handler = self.send_execution_request()
+        verify(self.wampbroadcaster, never).publish_request_for_target(any_value(), any_value(), any_value(),
+                                                                       tracking_id=any_value())
+
+        self.daemon.controller.on_session_open()
+
+        self.assertEqual(sent_messages(self.transport),
+                         [{'type': 'accepted', 'target': 'target', 'tracking_id': 'id-target'}])
+        self.assertEqual(event_handler.error_report_timeout, 5)
+        verify(self.wampbroadcaster.client).subscribe(self.daemon.controller.event_dispatcher.dispatch, 'target')
+        verify(self.wampbroadcaster).publish_request_for_target('target', 'update',
+                                                                ['--foo', '--tracking-id=id-target'],
+                                                                tracking_id='id-target')
+
+    def test_should_publish_immediately_and_subscribe_only_once_per_target_when_session_is_open(self):
+        self.daemon.controller.on_session_open()
+        self.send_execution_request()
+        self.daemon.controller.event_dispatcher.event_handlers.clear()
+        when(yadt_controller.daemon).generate_tracking_id('target').thenReturn('id-target-2')
+        second_client = ControllerRequestProtocol(self.daemon)
+        connect(second_client)
+
+        second_client.lineReceived(encode_message({'request': 'execute', 'target': 'target', 'command': 'update',
+                                                   'arguments': [], 'waiting_timeout': 30, 'pending_timeout': 60}))
+
+        dispatch = self.daemon.controller.event_dispatcher.dispatch
+        verify(self.wampbroadcaster.client, times=1).subscribe(dispatch, 'target')
+        verify(self.wampbroadcaster).publish_request_for_target('target', 'update', ['--tracking-id=id-target-2'],
+                                                                tracking_id='id-target-2')
+
+    def test_should_stream_progress_and_send_result_when_execution_completes(self):
+        self.daemon.controller.on_session_open()
+        event_handler = self.send_execution_request()
+
+        event_handler.on_pending_command_execution(mock())
+        event_handler.on_command_execution_success(mock())
+
+        self.assertEqual(sent_messages(self.transport)[1:],
+                         [{'type': 'progress', 'text': '--foo started'},
+                          {'type': 'progress', 'text': '--foo successful'},
+                          {'type': 'result', 'target': 'target', 'tracking_id': 'id-target', 'exit_code': 0,
+                           'remote_host': None, 'log_file': None, 'error_report': None}])
+        self.assertTrue(self.transport.disconnecting)
+        self.assertEqual(self.daemon.controller.event_dispatcher.event_handlers, {})
+
+    def test_should_forward_error_report_with_result(self):
+        self.daemon.controller.on_session_open()
+        self.send_execution_request()
+        dispatch = self.daemon.controller.event_dispatcher.dispatch
+        dispatch({'id': 'cmd', 'tracking_id': 'id-target', 'state': 'started'})
+        dispatch({'id': 'call-info', 'tracking_id': 'id-target', 'host': 'some-machine', 'log_file': '/path/to/log'})
+        dispatch({'id': 'cmd', 'tracking_id': 'id-target', 'state': 'failed', 'message': 'first\nsecond'})
+
+        result = sent_messages(self.transport)[-1]
+        self.assertEqual((result['type'], result['exit_code'], result['error_report']), ('result', 1, 'first\nsecond'))
+
+    def test_should_refuse_execution_request_with_invalid_timeout_before_accepting_it(self):
+        when(yadt_controller.daemon.logger).warn(any_value(), any_value(), any_value()).thenReturn(None)
+
+        self.client.lineReceived(encode_message({'request': 'execute', 'target': 'target', 'command': 'update',
+                                                 'arguments': [], 'waiting_timeout': 'soon', 'pending_timeout': 60}))
+
+        error_message, = sent_messages(self.transport)
+        self.assertEqual(error_message['type'], 'error')
+        self.assertTrue('invalid literal' in error_message['error'])
+        self.assertEqual(self.daemon.controller.event_dispatcher.event_handlers, {})
+
+    def test_should_refuse_execution_request_without_command_before_accepting_it(self):
+        when(yadt_controller.daemon.logger).warn(any_value(), any_value(), any_value()).thenReturn(None)
+
+        self.client.lineReceived(encode_message({'request': 'execute', 'target': 'target', 'arguments': [],
+                                                 'waiting_timeout': 30, 'pending_timeout': 60}))
+
+        self.assertEqual(sent_messages(self.transport),
+                         [{'type': 'error', 'error': 'invalid request: missing command'}])
+        self.assertEqual(self.daemon.controller.event_dispatcher.event_handlers, {})
+
+    def test_should_route_events_to_execution_of_the_client(self):
+        self.daemon.controller.on_session_open()
+        event_handler = self.send_execution_request()
+
+        self.daemon.controller.event_dispatcher.dispatch({'id': 'call-info', 'tracking_id': 'id-target',
+                                                          'host': 'some-machine', 'log_file': '/path/to/log'})
+
+        self.assertEqual(event_handler.remote_host, 'some-machine')
+
+    def test_should_keep_going_when_client_disconnected_before_completion(self):
+        self.daemon.controller.on_session_open()
+        event_handler = self.send_execution_request()
+        self.client.connectionLost(None)
+
+        event_handler.on_command_execution_success(mock())
+
+        self.assertEqual(self.daemon.controller.event_dispatcher.event_handlers, {})
+
+    def test_should_send_info_fetched_in_a_thread(self):
+        when(yadt_controller.daemon).deferToThread(any_value(), 'target', 2).thenReturn(succeed('blob of target info'))
+
+        self.client.lineReceived(encode_message({'request': 'info', 'target': 'target', 'timeout': 2}))
+
+        self.assertEqual(sent_messages(self.transport), [{'type': 'info', 'info': 'blob of target info'}])
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_should_fetch_info_from_selected_broadcaster(self):
+        daemon = ControllerDaemon('b1', 8081, '/run/controller.sock', endpoints=[('b1', 8081), ('b2', 8082)])
+        endpoint = mock()
+        when(yadt_controller.daemon).select_endpoint([('b1', 8081), ('b2', 8082)]).thenReturn(('b2', 8082))
+        when(yadt_controller.daemon).TargetInfoEndpoint('target', 'b2', 8082, cache=None).thenReturn(endpoint)
+        when(endpoint).fetch(2).thenReturn('blob of target info')
+
+        self.assertEqual(daemon._fetch_info('target', 2), 'blob of target info')
+
+    def test_should_send_error_when_info_could_not_be_fetched(self):
+        when(yadt_controller.daemon).deferToThread(any_value(), 'target', 5).thenReturn(
+            fail(EndpointException('Info request returned non-ok code 404 (Not Found)')))
+
+        self.client.lineReceived(encode_message({'request': 'info', 'target': 'target'}))
+
+        self.assertEqual(sent_messages(self.transport),
+                         [{'type': 'error', 'error': 'Info request returned non-ok code 404 (Not Found)'}])
+
+    def test_should_refuse_invalid_requests(self):
+        when(yadt_controller.daemon.logger).warn(any_value(), any_value(), any_value()).thenReturn(None)
+
+        self.client.lineReceived(b'{"request": "reboot"}')
+
+        error_message, = sent_messages(self.transport)
+        self.assertEqual(error_message['type'], 'error')
+        self.assertTrue('unknown request' in error_message['error'])
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_should_serve_metrics_of_executions_when_metrics_port_was_given(self):
+        when(yadt_controller.daemon.reactor).listenTCP(any_value(), any_value()).thenReturn(None)
+        daemon = ControllerDaemon('host', 8081, '/run/controller.sock', metrics_port=9100)
+        daemon.serve()
+        daemon.controller.on_session_open()
+        client = ControllerRequestProtocol(daemon)
+        connect(client)
+        client.lineReceived(encode_message({'request': 'execute', 'target': 'target', 'command': 'update',
+                                            'arguments': [], 'waiting_timeout': 30, 'pending_timeout': 60}))
+
+        daemon.controller.event_dispatcher.event_handlers['id-target'].on_command_execution_success(mock())
+
+        verify(yadt_controller.daemon.reactor).listenTCP(9100, any_value())
+        self.assertTrue('yadtcontroller_executions_total{outcome="success"} 1' in daemon.metrics.format())
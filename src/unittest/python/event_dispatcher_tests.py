@@ -0,0 +1,66 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from mockito import mock, verify, never, any as any_value
+
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+
+
+class TrackingIdDispatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = TrackingIdDispatcher()
+        self.event_handler = mock()
+        self.event_handler.tracking_id = '123'
+        self.dispatcher.register(self.event_handler)
+
+    def test_should_dispatch_event_to_handler_owning_the_tracking_id(self):
+        event = {'id': 'cmd', 'tracking_id': '123'}
+
+        self.dispatcher.dispatch(event)
+
+        verify(self.event_handler).handle_event(event)
+        self.assertEqual(self.dispatcher.dispatched_events, 1)
+
+    def test_should_drop_events_with_foreign_tracking_id(self):
+        self.dispatcher.dispatch({'id': 'cmd', 'tracking_id': 'something-else'})
+        self.dispatcher.dispatch({'id': 'heartbeat'})
+
+        verify(self.event_handler, never).handle_event(any_value())
+        self.assertEqual(self.dispatcher.dropped_events, 2)
+
+    def test_should_not_dispatch_to_unregistered_handler(self):
+        self.dispatcher.unregister(self.event_handler)
+
+        self.dispatcher.dispatch({'id': 'cmd', 'tracking_id': '123'})
+
+        verify(self.event_handler, never).handle_event(any_value())
+
+    def test_should_refuse_to_register_two_handlers_for_the_same_tracking_id(self):
+        other_event_handler = mock()
+        other_event_handler.tracking_id = '123'
+
+        self.assertRaises(ValueError, self.dispatcher.register, other_event_handler)
+
+    def test_should_not_unregister_a_handler_that_does_not_own_the_tracking_id(self):
+        other_event_handler = mock()
+        other_event_handler.tracking_id = '123'
+
+        self.dispatcher.unregister(other_event_handler)
+
+        self.assertEqual(self.dispatcher.event_handlers, {'123': self.event_handler})
@@ -14,68 +14,83 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import print_function
+import logging
 import unittest
 import sys
 
-from yadtbroadcastclient import WampBroadcaster
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
 from mock import patch, call
 from mockito import when, verify, unstub, any as any_value, mock, never
+from twisted.internet.task import Clock
 
 import yadt_controller.configuration
 from yadt_controller.event_handler import EventHandler
+from yadt_controller.timing import ExecutionTimings
 
 
+@patch('yadt_controller.event_handler.logger')
 class ErrorReportTests(unittest.TestCase):
 
-    def test_should_not_mark_finished_events_as_error_report(self):
-        event_handler = EventHandler('host', 8081, 'target')
-        success_event = {'id': 'cmd',
-                         'type': 'event',
-                         'target': 'target',
-                         'tracking_id': '123',
-                         'state': 'finished',
-                         'message': 'the internet is down'
-                         }
-        self.assertFalse(
-            event_handler._event_is_an_error_report(success_event))
-
-    def test_should_not_mark_failed_events_as_error_report(self):
+    def setUp(self):
+        self.event_handler = EventHandler('host', 8081, 'target')
+        self.event_handler.execution_state_machine = mock()
+
+    def test_should_not_mark_finished_events_as_error_report(self, _):
+        self.event_handler.handle_event({'id': 'cmd', 'tracking_id': '123', 'state': 'finished',
+                                         'message': 'the internet is down'})
+
+        self.assertFalse(self.event_handler.error_report_received)
+
+    def test_should_mark_failed_events_with_message_as_error_report(self, _):
+        self.event_handler.handle_event({'id': 'cmd', 'tracking_id': '123', 'state': 'failed',
+                                         'message': 'the internet is down'})
+
+        self.assertTrue(self.event_handler.error_report_received)
+
+    def test_should_not_mark_failed_events_as_error_report_when_message_is_missing(self, _):
+        self.event_handler.handle_event({'id': 'cmd', 'tracking_id': '123', 'state': 'failed'})
+
+        self.assertFalse(self.event_handler.error_report_received)
+
+
+class CallInfoTests(unittest.TestCase):
+
+    @patch('yadt_controller.event_handler.logger')
+    def test_should_not_treat_other_events_as_call_info(self, _):
         event_handler = EventHandler('host', 8081, 'target')
-        failure_event_with_message = {'id': 'cmd',
-                                      'type': 'event',
-                                      'target': 'target',
-                                      'tracking_id': '123',
-                                      'state': 'failed',
-                                      'message': 'the internet is down'
-                                      }
-        self.assertTrue(
-            event_handler._event_is_an_error_report(failure_event_with_message))
 
-    def test_should_not_mark_failed_events_as_error_report_when_message_is_missing(self):
+        event_handler.handle_event({'id': 'cmd', 'host': 'some-machine'})
+
+        self.assertFalse(event_handler.call_info_received)
+        self.assertEqual(event_handler.remote_host, None)
+
+    @patch('yadt_controller.event_handler.logger')
+    def test_should_dispatch_call_info(self, _):
         event_handler = EventHandler('host', 8081, 'target')
-        failure_event_with_message = {'id': 'cmd',
-                                      'type': 'event',
-                                      'target': 'target',
-                                      'tracking_id': '123',
-                                      'state': 'failed'
-                                      }
-        self.assertFalse(
-            event_handler._event_is_an_error_report(failure_event_with_message))
 
+        event_handler.handle_event({'id': 'call-info', 'host': 'some-machine', 'log_file': '/path/to/logfile'})
 
-class CallInfoTests(unittest.TestCase):
+        self.assertTrue(event_handler.call_info_received)
+        self.assertEqual(event_handler.remote_host, 'some-machine')
 
-    def test_should_not_mark_other_events_as_call_info(self):
+    @patch('yadt_controller.event_handler.logger')
+    def test_should_dispatch_call_info_carrying_a_state(self, _):
         event_handler = EventHandler('host', 8081, 'target')
-        command_event = {'id': 'cmd'}
-        self.assertFalse(
-            event_handler._event_is_a_call_info(command_event))
 
-    def test_should_mark_call_info_as_call_info(self):
+        event_handler.handle_event({'id': 'call-info', 'state': 'started', 'host': 'some-machine',
+                                    'log_file': '/path/to/logfile'})
+
+        self.assertTrue(event_handler.call_info_received)
+        self.assertEqual(event_handler.remote_host, 'some-machine')
+
+    @patch('yadt_controller.event_handler.logger')
+    def test_should_dispatch_service_change_carrying_a_state(self, _):
         event_handler = EventHandler('host', 8081, 'target')
-        call_info = {'id': 'call-info'}
-        self.assertTrue(
-            event_handler._event_is_a_call_info(call_info))
+
+        event_handler.handle_event({'id': 'service-change', 'state': 'finished',
+                                    'payload': [{'uri': 'service://host/service', 'state': 'up'}]})
+
+        self.assertEqual(event_handler.service_changes, [('service://host/service', 'up')])
 
     @patch('yadt_controller.event_handler.logger', create=True)
     def test_should_output_call_info(self, logger):
@@ -87,23 +102,24 @@ class CallInfoTests(unittest.TestCase):
 
         self.assertEqual(logger.info.call_args_list,
                          [
-                             call('Logfile on some-machine is at : /path/to/logfile')
+                             call('Logfile on %s is at : %s', 'some-machine', '/path/to/logfile')
                          ])
 
 
 class EventHandlerTests(unittest.TestCase):
 
     def setUp(self):
-        self.wampbroadcaster = mock(WampBroadcaster)
+        self.wampbroadcaster = mock(ReconnectingWampBroadcaster)
         self.wampbroadcaster.connect = lambda: None
         when(yadt_controller.event_handler.reactor).run().thenReturn(None)
         when(yadt_controller.event_handler.reactor).callWhenRunning(
             any_value()).thenReturn(None)
         when(yadt_controller.event_handler.reactor).callLater(
             any_value(), any_value(), any_value()).thenReturn(None)
-        when(yadt_controller.event_handler).WampBroadcaster(any_value(),
-                                                            any_value(),
-                                                            any_value()).thenReturn(self.wampbroadcaster)
+        when(yadt_controller.event_handler).ReconnectingWampBroadcaster(any_value(),
+                                                                        any_value(),
+                                                                        any_value(),
+                                                                        endpoints=None).thenReturn(self.wampbroadcaster)
         when(yadt_controller.event_handler.logger).info(
             any_value()).thenReturn(None)
         when(yadt_controller.event_handler.logger).debug(
@@ -114,8 +130,10 @@ class EventHandlerTests(unittest.TestCase):
             any_value()).thenReturn(None)
         when(yadt_controller.event_handler.sys).exit(
             any_value()).thenReturn(None)
+        self.original_log_level = yadt_controller.event_handler.logger.level
 
     def tearDown(self):
+        yadt_controller.event_handler.logger.setLevel(self.original_log_level)
         unstub()
 
     def test_should_instantiate_event_handler_with_host_and_port(self):
@@ -153,6 +171,7 @@ class EventHandlerTests(unittest.TestCase):
                                                           any_value(),
                                                           any_value(),
                                                           any_value(),
+                                                          any_value(),
                                                           any_value()).thenReturn(mock_state_machine)
         event_handler = EventHandler('hostname', 12345, 'target')
 
@@ -179,7 +198,7 @@ class EventHandlerTests(unittest.TestCase):
         event_handler.initialize_for_execution_request()
 
         verify(mock_broadcaster).addOnSessionOpenHandler(
-            event_handler.publish_execution_request)
+            event_handler.on_session_open)
 
     def test_should_log_error_when_waiting_execution_request_times_out(self):
         event_handler = EventHandler('host', 8081, 'target')
@@ -241,7 +260,7 @@ class EventHandlerTests(unittest.TestCase):
         event_handler.publish_execution_request()
 
         verify(mock_broadcaster).publish_request_for_target(
-            'target', 'command', ['arg1', 'arg2'])
+            'target', 'command', ['arg1', 'arg2'], tracking_id=None)
 
     def test_should_stop_reactor_and_set_exit_code_when_command_execution_was_sucessful(self):
         when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
@@ -264,7 +283,146 @@ class EventHandlerTests(unittest.TestCase):
 
         self.assertEqual(event_handler.exit_code, 1)
         verify(yadt_controller.event_handler.reactor).callLater(
-            10, yadt_controller.event_handler.reactor.stop)
+            10, event_handler._complete_execution)
+
+        event_handler._complete_execution()
+
+        verify(yadt_controller.event_handler.reactor).stop()
+
+    def test_should_wait_for_error_reports_as_long_as_configured_when_command_execution_failed(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.prepare_execution_request(waiting_timeout=30, error_report_timeout=3)
+
+        event_handler.on_command_execution_failure(mock())
+
+        verify(yadt_controller.event_handler.reactor).callLater(
+            3, event_handler._complete_execution)
+
+    def test_should_stop_reactor_immediately_when_failure_was_already_reported(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        event_handler._output_call_info({'id': 'call-info', 'host': 'some-machine', 'log_file': '/path/to/log'})
+        event_handler._output_error_report({'id': 'cmd', 'state': 'failed', 'message': 'boom'})
+
+        event_handler.on_command_execution_failure(mock())
+
+        verify(yadt_controller.event_handler.reactor).stop()
+        verify(yadt_controller.event_handler.reactor, never).callLater(
+            10, event_handler._complete_execution)
+
+    def test_should_stop_reactor_immediately_when_execution_failed_by_waiting_timeout(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        when(yadt_controller.event_handler.logger).error(any_value()).thenReturn(None)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        waiting_timeout = mock()
+        waiting_timeout.event = 'waiting_timeout'
+
+        event_handler.on_command_execution_failure(waiting_timeout)
+
+        self.assertEqual(event_handler.exit_code, 1)
+        verify(yadt_controller.event_handler.reactor).stop()
+        verify(yadt_controller.event_handler.reactor, never).callLater(
+            10, event_handler._complete_execution)
+
+    def test_should_complete_execution_when_failure_was_reported(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        completion_callback = mock()
+        event_handler.completion_callback = completion_callback.complete
+        event_handler.exit_code = 1
+        event_handler.call_info_received = True
+        event_handler.error_report_received = True
+
+        event_handler._complete_execution_if_failure_was_reported()
+
+        verify(completion_callback).complete()
+
+    def test_should_not_complete_execution_when_failure_was_reported_only_partially(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        completion_callback = mock()
+        event_handler.completion_callback = completion_callback.complete
+        event_handler.exit_code = 1
+        event_handler.error_report_received = True
+
+        event_handler._complete_execution_if_failure_was_reported()
+
+        verify(completion_callback, never).complete()
+
+    def test_should_not_complete_execution_on_error_report_before_command_failed(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        completion_callback = mock()
+        event_handler.completion_callback = completion_callback.complete
+        event_handler.call_info_received = True
+        event_handler.error_report_received = True
+
+        event_handler._complete_execution_if_failure_was_reported()
+
+        verify(completion_callback, never).complete()
+
+    def test_should_stop_reactor_as_soon_as_error_report_arrives_after_failure(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        delayed_completion = mock()
+        when(delayed_completion).active().thenReturn(True)
+        when(yadt_controller.event_handler.reactor).callLater(
+            any_value(), any_value()).thenReturn(delayed_completion)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        event_handler._output_call_info({'id': 'call-info', 'host': 'some-machine', 'log_file': '/path/to/log'})
+        event_handler.on_command_execution_failure(mock())
+        verify(yadt_controller.event_handler.reactor, never).stop()
+
+        event_handler._output_error_report({'id': 'cmd', 'state': 'failed', 'message': 'boom'})
+
+        verify(yadt_controller.event_handler.reactor).stop()
+        verify(delayed_completion).cancel()
+
+    def test_should_wait_for_error_report_of_started_receiver_after_other_receiver_failed_while_waiting(self):
+        clock = Clock()
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.reactor = clock
+        completion_callback = mock()
+        event_handler.completion_callback = completion_callback.complete
+        event_handler.prepare_execution_request(waiting_timeout=30, pending_timeout=60, arguments=['update'],
+                                                error_report_timeout=3)
+        event_handler.wamp_broadcaster = mock()
+        event_handler.publish_execution_request()
+        event_handler.handle_event({'id': 'call-info', 'host': 'failing-machine', 'log_file': '/path/to/log'})
+        event_handler.handle_event({'id': 'cmd', 'state': 'failed', 'message': 'no such command'})
+        event_handler.handle_event({'id': 'cmd', 'state': 'started'})
+        event_handler.handle_event({'id': 'cmd', 'state': 'failed'})
+
+        verify(completion_callback, never).complete()
+
+        event_handler.handle_event({'id': 'call-info', 'host': 'some-machine', 'log_file': '/path/to/log'})
+        event_handler.handle_event({'id': 'cmd', 'state': 'failed', 'message': 'boom'})
+
+        verify(completion_callback).complete()
+        self.assertEqual(event_handler.error_report, 'boom')
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    def test_should_complete_execution_only_once(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        event_handler = EventHandler('hostname', 12345, 'target')
+
+        event_handler._complete_execution()
+        event_handler._complete_execution()
+
+        verify(yadt_controller.event_handler.reactor, times=1).stop()
+
+    def test_should_cancel_pending_timeouts_when_execution_completes(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        timeout_call = mock()
+        when(timeout_call).active().thenReturn(True)
+        when(yadt_controller.event_handler.reactor).callLater(
+            any_value(), any_value()).thenReturn(timeout_call)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.prepare_execution_request(waiting_timeout=30, pending_timeout=60, arguments=['update'])
+        event_handler.on_pending_command_execution(mock())
+
+        event_handler.on_command_execution_success(mock())
+
+        verify(timeout_call, times=2).cancel()
 
     def test_on_waiting_command_execution_should_schedule_waiting_timeout(self):
         event_handler = EventHandler('hostname', 12345, 'target')
@@ -295,6 +453,7 @@ class EventHandlerTests(unittest.TestCase):
         event_handler.on_pending_command_execution(mock())
         verify(mock_progress_handler).output_progress(
             sys.stdout, 'update started')
+        verify(mock_progress_handler).flush()
 
     def test_on_command_execution_failure_should_report_progress(self):
         event_handler = EventHandler('hostname', 12345, 'target')
@@ -352,6 +511,7 @@ class EventHandlerTests(unittest.TestCase):
             'The command failed.')
 
     def test_on_command_execution_event_should_log_payload_if_present(self):
+        yadt_controller.event_handler.logger.setLevel(logging.DEBUG)
         event_handler = EventHandler('hostname', 12345, 'target')
         event_handler.tracking_id = '123'
         event = {'id': 'service-change',
@@ -361,13 +521,13 @@ class EventHandlerTests(unittest.TestCase):
                  'payload': [{'state': 'up',
                               'uri': 'service://host/service'}]}
 
-        event_handler.on_command_execution_event('target', event)
+        event_handler.on_command_execution_event(event)
 
         verify(yadt_controller.event_handler.logger).\
-            debug(
-                'Event "service-change state=up uri=service://host/service" received')
+            debug('Event "%s" received', 'service-change state=up uri=service://host/service')
 
     def test_on_command_execution_event_should_be_wamp_v2_compatible(self):
+        yadt_controller.event_handler.logger.setLevel(logging.DEBUG)
         event_handler = EventHandler('hostname', 12345, 'target')
         event_handler.tracking_id = '123'
         event = {'id': 'service-change',
@@ -380,8 +540,7 @@ class EventHandlerTests(unittest.TestCase):
         event_handler.on_command_execution_event(event)  # wamp v2: no topic in onEvent
 
         verify(yadt_controller.event_handler.logger).\
-            debug(
-                'Event "service-change state=up uri=service://host/service" received')
+            debug('Event "%s" received', 'service-change state=up uri=service://host/service')
 
     def test_on_command_execution_event_should_log_error_abstract(self):
         event_handler = EventHandler('hostname', 12345, 'target')
@@ -396,7 +555,7 @@ class EventHandlerTests(unittest.TestCase):
                  'state': 'failed',
                  'message': 'The internet was shut down.\nSeriously.'}
 
-        event_handler.on_command_execution_event('target', event)
+        event_handler.on_command_execution_event(event)
 
         verify(yadt_controller.event_handler.logger). \
             error('The internet was shut down.')
@@ -413,7 +572,7 @@ class EventHandlerTests(unittest.TestCase):
                  'payload': [{'state': 'up',
                               'uri': 'service://host/service'}]}
 
-        event_handler.on_command_execution_event('target', event)
+        event_handler.on_command_execution_event(event)
 
         verify(yadt_controller.event_handler.logger, never). \
             info(
@@ -429,41 +588,55 @@ class EventHandlerTests(unittest.TestCase):
                                'state': 1,  # blows up if uncaught
                                'uri': 'service://host/service'}}
 
-        event_handler.on_command_execution_event('target', malformed_event)
+        event_handler.on_command_execution_event(malformed_event)
 
     def test_on_command_execution_event_should_call_state_machine_transition_when_state_change_occurs(self):
         mock_state_machine = mock()
         event_handler = EventHandler('hostname', 12345, 'target')
         event_handler.tracking_id = '123'
         event_handler.execution_state_machine = mock_state_machine
-        when(mock_state_machine).test_state(msg=any_value()).thenReturn(None)
+        when(mock_state_machine).can('started').thenReturn(True)
+        when(mock_state_machine).trigger('started', msg=any_value()).thenReturn(None)
 
         event = {'cmd': 'update',
-                     'state': 'test_state',
-                     'tracking_id': '123',
-                     'message': None,
-                     'type': 'event',
-                     'id': 'cmd'}
-        event_handler.on_command_execution_event('target', event)
+                 'state': 'started',
+                 'tracking_id': '123',
+                 'message': None,
+                 'type': 'event',
+                 'id': 'cmd'}
+        event_handler.on_command_execution_event(event)
+
+        verify(mock_state_machine).trigger('started', msg='cmd')
+
+    def test_on_command_execution_event_should_ignore_events_not_permitted_in_current_state(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.prepare_execution_request(waiting_timeout=30, pending_timeout=60, arguments=['update'],
+                                                tracking_id='123')
+        when(yadt_controller.event_handler.logger).debug(any_value(), any_value(), any_value()).thenReturn(None)
 
-        verify(mock_state_machine).test_state(msg='cmd')
+        event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': '123', 'state': 'started'})
+        event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': '123', 'state': 'exploded'})
+
+        self.assertEqual(event_handler.execution_state_machine.current, 'idle')
+        verify(yadt_controller.event_handler.logger).debug('Ignoring event "%s" in state "%s".', 'started', 'idle')
+        verify(yadt_controller.event_handler.logger).debug('Ignoring event "%s" in state "%s".', 'exploded', 'idle')
 
     def test_on_command_execution_event_should_not_call_state_machine_transition_when_id_does_not_match(self):
         mock_state_machine = mock()
         event_handler = EventHandler('hostname', 12345, 'target')
         event_handler.tracking_id = 'something-else'
         event_handler.execution_state_machine = mock_state_machine
-        when(mock_state_machine).test_state(msg=any_value()).thenReturn(None)
+        when(mock_state_machine).trigger('started', msg=any_value()).thenReturn(None)
 
         event = {'cmd': 'update',
-                 'state': 'test_state',
+                 'state': 'started',
                  'tracking_id': '123',
                  'message': None,
                  'type': 'event',
                  'id': 'cmd'}
-        event_handler.on_command_execution_event('target', event)
+        event_handler.on_command_execution_event(event)
 
-        verify(mock_state_machine, never).test_state(msg='cmd')
+        verify(mock_state_machine, never).trigger('started', msg='cmd')
 
     def test_output_service_change_should_call_progress_handler(self):
         event_handler = EventHandler('hostname', 12345, 'target')
@@ -481,3 +654,132 @@ class EventHandlerTests(unittest.TestCase):
 
         verify(mock_progress_handler).output_progress(
             sys.stdout, 'service://host/service is now up.')
+
+    def test_should_call_completion_callback_instead_of_stopping_reactor_when_command_execution_was_successful(self):
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        completion_callback = mock()
+        event_handler.completion_callback = completion_callback.complete
+
+        event_handler.on_command_execution_success(mock())
+
+        verify(completion_callback).complete()
+        verify(yadt_controller.event_handler.reactor, never).stop()
+
+    def test_prepare_execution_request_should_not_prepare_broadcast_client(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        when(event_handler)._prepare_broadcast_client().thenReturn(None)
+
+        event_handler.prepare_execution_request(waiting_timeout=10, command_to_execute='command')
+
+        verify(event_handler, never)._prepare_broadcast_client()
+        self.assertEqual(event_handler.execution_state_machine.current, 'idle')
+        verify(yadt_controller.event_handler.reactor, never).run()
+
+    def test_should_notify_outcome_callback_immediately_when_command_execution_failed(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        outcome_callback = mock()
+        event_handler.outcome_callback = outcome_callback.finished
+
+        event_handler.on_command_execution_failure(mock())
+
+        verify(outcome_callback).finished()
+
+    def test_on_command_execution_event_should_not_log_events_with_foreign_tracking_id(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.tracking_id = 'something-else'
+        event = {'id': 'cmd', 'state': 'started', 'tracking_id': '123'}
+
+        event_handler.on_command_execution_event(event)
+
+        verify(yadt_controller.event_handler.logger, never).debug(any_value())
+
+    def test_on_command_execution_event_should_count_dispatched_and_dropped_events(self):
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.tracking_id = '123'
+        when(event_handler).handle_event(any_value()).thenReturn(None)
+
+        event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': '123'})
+        event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': 'foreign'})
+        event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': 'foreign'})
+
+        self.assertEqual((event_handler.dispatched_events, event_handler.dropped_events), (1, 2))
+
+    def test_on_command_execution_event_should_not_format_event_when_debug_logging_is_disabled(self):
+        yadt_controller.event_handler.logger.setLevel(logging.INFO)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.tracking_id = '123'
+        event_handler.progress_handler = None
+        event = {'id': 'service-change',
+                 'type': 'event',
+                 'target': 'target',
+                 'tracking_id': '123',
+                 'payload': [{'state': 'up',
+                              'uri': 'service://host/service'}]}
+
+        event_handler.on_command_execution_event(event)
+
+        verify(yadt_controller.event_handler.logger, never).debug(any_value(), any_value())
+
+    def test_output_service_change_should_not_log_when_info_logging_is_disabled(self):
+        yadt_controller.event_handler.logger.setLevel(logging.WARN)
+        event_handler = EventHandler('hostname', 12345, 'target')
+        event_handler.progress_handler = None
+        event = {'id': 'service-change',
+                 'payload': [{'state': 'up', 'uri': 'service://host/service'}]}
+
+        event_handler._output_service_change(event)
+
+        verify(yadt_controller.event_handler.logger, never).info(any_value(), any_value(), any_value())
+
+
+class ResultReportTests(unittest.TestCase):
+
+    def setUp(self):
+        when(yadt_controller.event_handler.reactor).callLater(any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.reactor).stop().thenReturn(None)
+        when(yadt_controller.event_handler.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).info(any_value(), any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).debug(any_value(), any_value(), any_value()).thenReturn(None)
+        self.records = []
+        self.result_reporter = mock()
+        self.result_reporter.report = lambda event, **fields: self.records.append(dict(fields, event=event))
+        self.event_handler = EventHandler('hostname', 12345, 'target')
+        self.event_handler.timings = ExecutionTimings(clock=iter([100, 110, 140, 142.5]).next)
+        self.event_handler.wamp_broadcaster = mock()
+        self.event_handler.prepare_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                     command_to_execute='update',
+                                                     arguments=['--foo', '--tracking-id=123'],
+                                                     tracking_id='123',
+                                                     result_reporter=self.result_reporter)
+
+    def tearDown(self):
+        unstub()
+
+    def test_should_report_transitions_call_info_and_summary(self):
+        self.event_handler.publish_execution_request()
+        self.event_handler.on_command_execution_event({'id': 'call-info', 'tracking_id': '123',
+                                                       'host': 'some-machine', 'log_file': '/path/to/log'})
+        self.event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': '123', 'state': 'started'})
+        self.event_handler.on_command_execution_event({'id': 'cmd', 'tracking_id': '123', 'state': 'finished'})
+
+        self.assertEqual([record['event'] for record in self.records],
+                         ['transition', 'call-info', 'transition', 'transition', 'summary'])
+        self.assertEqual(self.records[0], {'event': 'transition', 'target': 'target', 'tracking_id': '123',
+                                           'source': 'idle', 'destination': 'waiting', 'trigger': 'request'})
+        self.assertEqual(self.records[-1], {'event': 'summary', 'target': 'target', 'tracking_id': '123',
+                                            'command': 'update', 'arguments': ['--foo'], 'exit_code': 0,
+                                            'state': 'success', 'remote_host': 'some-machine',
+                                            'log_file': '/path/to/log', 'duration': 42.5,
+                                            'phases': {'waiting': 10, 'pending': 30}})
+
+    def test_should_report_service_changes(self):
+        self.event_handler.progress_handler = None
+
+        self.event_handler._output_service_change({'id': 'service-change',
+                                                   'payload': [{'uri': 'service://foo/bar', 'state': 'up'}]})
+
+        self.assertEqual(self.records, [{'event': 'service-change', 'target': 'target', 'tracking_id': '123',
+                                         'uri': 'service://foo/bar', 'state': 'up'}])
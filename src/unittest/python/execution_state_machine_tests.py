@@ -16,7 +16,20 @@
 
 import unittest
 
-from yadt_controller.execution_state_machine import create_execution_state_machine_with_callbacks
+from yadt_controller.execution_state_machine import (create_execution_state_machine_with_callbacks, STATES, EVENTS,
+                                                     InvalidTransitionError, UnknownEventError)
+
+# destination of every event in every state (idle, waiting, pending, success, failure), None if not permitted
+EXPECTED_TRANSITIONS = {
+    'request': ('waiting', None, None, None, 'failure'),
+    'started': (None, 'pending', 'pending', None, None),
+    'finished': ('success', None, 'success', 'success', None),
+    'failed': (None, 'waiting', 'failure', None, 'failure'),
+    'pending_timeout': (None, None, 'failure', None, None),
+    'waiting_timeout': ('failure', 'failure', 'pending', 'success', 'failure'),
+}
+STATE_CALLBACKS = ('waiting', 'pending', 'success', 'failure')
+EVENT_CALLBACKS = ('failed', 'waiting_timeout', 'pending_timeout')
 
 
 class ExecutionStateMachineTests(unittest.TestCase):
@@ -46,33 +59,41 @@ class ExecutionStateMachineTests(unittest.TestCase):
     def pending_timeout_callback(self):
         self.calls.append("pending_timeout")
 
+    def create_state_machine(self):
+        return create_execution_state_machine_with_callbacks(
+            waiting_callback=lambda event: self.waiting_callback(),
+            failed_callback=lambda event: self.failed_callback(),
+            pending_callback=lambda event: self.pending_callback(),
+            success_callback=lambda event: self.success_callback(),
+            failure_callback=lambda event: self.failure_callback(),
+            waiting_timeout_callback=lambda event: self.waiting_timeout_callback(),
+            pending_timeout_callback=lambda event: self.pending_timeout_callback())
+
     def test_should_create_state_machine_with_callbacks(self):
-        fsm = create_execution_state_machine_with_callbacks(
-            waiting_callback=self.waiting_callback,
-            failed_callback=self.failed_callback,
-            pending_callback=self.pending_callback,
-            success_callback=self.success_callback,
-            failure_callback=self.failure_callback,
-            waiting_timeout_callback=self.waiting_timeout_callback,
-            pending_timeout_callback=self.pending_timeout_callback)
+        fsm = self.create_state_machine()
 
-        fsm.onwaiting()
-        fsm.onfailed()
-        fsm.onpending()
-        fsm.onsuccess()
-        fsm.onfailure()
-        fsm.onwaiting_timeout()
-        fsm.onpending_timeout()
+        fsm.request()
+        fsm.failed()
+        fsm.started()
+        fsm.finished()
+        fsm.waiting_timeout()
 
         self.assertEqual(
-            self.calls, 
+            self.calls,
             ['waiting',
              'failed',
              'pending',
              'success',
-             'failure',
-             'waiting_timeout',
-             'pending_timeout'])
+             'waiting_timeout'])
+
+    def test_should_call_failure_state_callback_before_event_callback(self):
+        fsm = self.create_state_machine()
+        fsm.request()
+        fsm.started()
+
+        fsm.pending_timeout()
+
+        self.assertEqual(self.calls, ['waiting', 'pending', 'failure', 'pending_timeout'])
 
     def test_state_machine_should_be_in_idle_state_initially(self):
         fsm = create_execution_state_machine_with_callbacks(
@@ -101,3 +122,92 @@ class ExecutionStateMachineTests(unittest.TestCase):
         fsm.finished()
         fsm.waiting_timeout()
         self.assertEqual(fsm.current, 'success')
+
+    def test_should_report_transition_before_entering_the_new_state(self):
+        calls = []
+        record = lambda event: calls.append(event.event)
+        fsm = create_execution_state_machine_with_callbacks(
+            record, record, record, record, record, record, record,
+            transition_callback=lambda event: calls.append('{0} -> {1}'.format(event.src, event.dst)))
+
+        fsm.request()
+        fsm.started()
+
+        self.assertEqual(calls, ['idle -> waiting', 'request', 'waiting -> pending', 'started'])
+
+    def test_should_not_report_transition_when_state_does_not_change(self):
+        transitions = []
+        id = lambda x: x
+        fsm = create_execution_state_machine_with_callbacks(id, id, id, id, id, id, id,
+                                                            transition_callback=transitions.append)
+        fsm.request()
+        fsm.started()
+        fsm.finished()
+
+        fsm.waiting_timeout()
+
+        self.assertEqual([(event.src, event.dst, event.event) for event in transitions],
+                         [('idle', 'waiting', 'request'),
+                          ('waiting', 'pending', 'started'),
+                          ('pending', 'success', 'finished')])
+
+
+class TransitionTableTests(unittest.TestCase):
+
+    def create_state_machine_in(self, state, calls):
+        record = lambda name: lambda event: calls.append((name, event.src, event.dst, event.event))
+        fsm = create_execution_state_machine_with_callbacks(
+            record('waiting'), record('failed'), record('pending'), record('success'), record('failure'),
+            record('waiting_timeout'), record('pending_timeout'),
+            transition_callback=record('transition'))
+        fsm.state = STATES.index(state)
+        return fsm
+
+    def test_should_cover_every_event(self):
+        self.assertEqual(sorted(EXPECTED_TRANSITIONS), sorted(EVENTS))
+
+    def test_should_transition_exactly_as_expected_for_every_event_in_every_state(self):
+        for event in EVENTS:
+            for state, expected_destination in zip(STATES, EXPECTED_TRANSITIONS[event]):
+                calls = []
+                fsm = self.create_state_machine_in(state, calls)
+
+                if expected_destination is None:
+                    self.assertFalse(fsm.can(event), (event, state))
+                    self.assertRaises(InvalidTransitionError, getattr(fsm, event))
+                    self.assertEqual((fsm.current, calls), (state, []), (event, state))
+                    continue
+
+                self.assertTrue(fsm.can(event), (event, state))
+                getattr(fsm, event)()
+
+                expected_calls = []
+                if expected_destination != state:
+                    expected_calls.append('transition')
+                    if expected_destination in STATE_CALLBACKS:
+                        expected_calls.append(expected_destination)
+                if event in EVENT_CALLBACKS:
+                    expected_calls.append(event)
+                self.assertEqual(fsm.current, expected_destination, (event, state))
+                self.assertEqual(calls, [(name, state, expected_destination, event) for name in expected_calls],
+                                 (event, state))
+
+    def test_should_pass_event_attributes_to_callbacks(self):
+        calls = []
+        fsm = create_execution_state_machine_with_callbacks(calls.append, *([None] * 6))
+
+        fsm.trigger('request', message='Execute update on target.')
+
+        self.assertEqual(calls[0].message, 'Execute update on target.')
+
+    def test_should_refuse_unknown_events(self):
+        fsm = self.create_state_machine_in('pending', [])
+
+        self.assertFalse(fsm.can('exploded'))
+        self.assertRaises(UnknownEventError, fsm.trigger, 'exploded')
+        self.assertEqual(fsm.current, 'pending')
+
+    def test_should_hold_only_state_and_callbacks(self):
+        fsm = self.create_state_machine_in('idle', [])
+
+        self.assertFalse(hasattr(fsm, '__dict__'))
@@ -0,0 +1,168 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from yadt_controller.info_cache import InfoCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class InfoCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_return_nothing_for_unknown_target(self):
+        cache = InfoCache(clock=self.clock)
+
+        self.assertEqual(cache.get('host', 8081, 'target'), None)
+
+    def test_should_return_fresh_entry_within_ttl(self):
+        cache = InfoCache(ttl_in_seconds=30, clock=self.clock)
+        cache.put('host', 8081, 'target', 'info')
+        self.clock.now += 29
+
+        entry = cache.get('host', 8081, 'target')
+
+        self.assertEqual(entry.info, 'info')
+        self.assertTrue(cache.is_fresh(entry))
+
+    def test_should_key_entries_by_broadcaster_and_target(self):
+        cache = InfoCache(clock=self.clock)
+        cache.put('host', 8081, 'target', 'info')
+
+        self.assertEqual(cache.get('other-host', 8081, 'target'), None)
+        self.assertEqual(cache.get('host', 8082, 'target'), None)
+        self.assertEqual(cache.get('host', 8081, 'other-target'), None)
+
+    def test_should_evict_expired_entry_without_validators(self):
+        cache = InfoCache(ttl_in_seconds=30, clock=self.clock)
+        cache.put('host', 8081, 'target', 'info')
+        self.clock.now += 30
+
+        self.assertEqual(cache.get('host', 8081, 'target'), None)
+        self.assertEqual(cache.entries, {})
+
+    def test_should_keep_expired_entry_with_validators_for_revalidation(self):
+        cache = InfoCache(ttl_in_seconds=30, clock=self.clock)
+        cache.put('host', 8081, 'target', 'info', etag='"abc"')
+        self.clock.now += 60
+
+        entry = cache.get('host', 8081, 'target')
+
+        self.assertEqual(entry.etag, '"abc"')
+        self.assertFalse(cache.is_fresh(entry))
+
+    def test_should_restart_ttl_when_refreshed(self):
+        cache = InfoCache(ttl_in_seconds=30, clock=self.clock)
+        cache.put('host', 8081, 'target', 'info', etag='"abc"')
+        self.clock.now += 60
+
+        cache.refresh('host', 8081, 'target')
+
+        self.assertTrue(cache.is_fresh(cache.get('host', 8081, 'target')))
+
+    def test_should_evict_oldest_entries_beyond_size_bound(self):
+        cache = InfoCache(max_entries=2, clock=self.clock)
+        for target in ('target1', 'target2', 'target3'):
+            cache.put('host', 8081, target, 'info')
+            self.clock.now += 1
+
+        self.assertEqual(cache.get('host', 8081, 'target1'), None)
+        self.assertEqual(len(cache.entries), 2)
+
+    def test_should_share_entries_through_directory(self):
+        InfoCache(directory=self.directory, clock=self.clock).put('host', 8081, 'target', 'info',
+                                                                  last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+
+        entry = InfoCache(directory=self.directory, clock=self.clock).get('host', 8081, 'target')
+
+        self.assertEqual(entry.info, 'info')
+        self.assertEqual(entry.last_modified, 'Wed, 21 Oct 2015 07:28:00 GMT')
+
+    def test_should_bound_number_of_files_in_directory(self):
+        cache = InfoCache(max_entries=2, directory=self.directory, clock=self.clock)
+        for target in ('target1', 'target2', 'target3'):
+            cache.put('host', 8081, target, 'info')
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_should_bound_number_of_files_written_by_other_controllers(self):
+        other_cache = InfoCache(max_entries=5, directory=self.directory, clock=self.clock)
+        for target in ('target1', 'target2', 'target3'):
+            other_cache.put('host', 8081, target, 'info')
+        for name in os.listdir(self.directory):
+            os.utime(os.path.join(self.directory, name), (0, 0))
+
+        cache = InfoCache(max_entries=2, directory=self.directory, clock=self.clock)
+
+        cache.put('host', 8081, 'target4', 'info')
+
+        shared_entry = InfoCache(directory=self.directory, clock=self.clock).get('host', 8081, 'target4')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(shared_entry.info, 'info')
+
+    def test_should_list_directory_only_once_while_below_size_bound(self):
+        cache = InfoCache(max_entries=10, directory=self.directory, clock=self.clock)
+
+        with patch('yadt_controller.info_cache.os.listdir', wraps=os.listdir) as listdir:
+            for target in ('target1', 'target2', 'target3'):
+                cache.put('host', 8081, target, 'info')
+                cache.put('host', 8081, target, 'changed info')
+
+        self.assertEqual(listdir.call_count, 1)
+        self.assertEqual(cache.cache_files, 3)
+
+    @patch('yadt_controller.info_cache.logger')
+    def test_should_remove_temporary_file_when_write_fails(self, logger):
+        cache = InfoCache(directory=self.directory, clock=self.clock)
+
+        with patch('yadt_controller.info_cache.os.rename', side_effect=OSError('disk full')):
+            cache.put('host', 8081, 'target', 'info')
+
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertTrue(logger.warn.called)
+        self.assertEqual(cache.get('host', 8081, 'target').info, 'info')
+
+    def test_should_ignore_corrupt_cache_files(self):
+        cache = InfoCache(directory=self.directory, clock=self.clock)
+        cache.put('host', 8081, 'target', 'info')
+        for name in os.listdir(self.directory):
+            with open(os.path.join(self.directory, name), 'w') as cache_file:
+                cache_file.write('{"info": ')
+
+        self.assertEqual(InfoCache(directory=self.directory, clock=self.clock).get('host', 8081, 'target'), None)
+
+    def test_should_refuse_invalid_bounds(self):
+        self.assertRaises(ValueError, InfoCache, ttl_in_seconds=-1)
+        self.assertRaises(ValueError, InfoCache, max_entries=0)
@@ -0,0 +1,200 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+from mock import Mock, patch
+from twisted.internet.task import Clock
+
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+from yadt_controller.event_handler import EventHandler
+from yadt_controller.journal import EventJournal, read_journal, replay, run_replay
+
+
+EXECUTION = {'t': 0.0, 'execution': {'tracking_id': 'id-1', 'target': 'target', 'command': 'update',
+                                     'arguments': ['--tracking-id=id-1'], 'waiting_timeout': 30,
+                                     'pending_timeout': 300}}
+
+
+def event(t, tracking_id='id-1', **fields):
+    fields.update({'id': fields.get('id', 'cmd'), 'tracking_id': tracking_id})
+    return {'t': t, 'event': fields}
+
+
+class EventJournalTests(unittest.TestCase):
+
+    def test_should_write_one_compact_line_per_event(self):
+        journal_file = BytesIO()
+        journal = EventJournal(journal_file, clock=iter([10, 10.5, 12.25]).next)
+
+        journal.record({'id': 'cmd', 'state': 'started'})
+        journal.record({'id': 'cmd', 'state': 'finished'})
+
+        lines = journal_file.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'t': 0.5, 'event': {'id': 'cmd', 'state': 'started'}},
+                          {'t': 2.25, 'event': {'id': 'cmd', 'state': 'finished'}}])
+        self.assertFalse(' ' in lines[0])
+
+    def test_should_record_execution_of_event_handler(self):
+        journal_file = BytesIO()
+        journal = EventJournal(journal_file, clock=iter([0, 0]).next)
+        event_handler = Mock(tracking_id='id-1', target='target', command_to_execute='update',
+                             arguments=['--tracking-id=id-1'], waiting_timeout=30, pending_timeout=300)
+
+        journal.record_execution(event_handler)
+
+        self.assertEqual(list(read_journal(BytesIO(journal_file.getvalue()))), [EXECUTION])
+
+    def test_should_read_entries_and_skip_blank_lines(self):
+        journal_file = BytesIO(b'{"t":0,"event":{"id":"cmd"}}\n\n{"t":1,"event":{"id":"heartbeat"}}\n')
+
+        self.assertEqual(list(read_journal(journal_file)), [{'t': 0, 'event': {'id': 'cmd'}},
+                                                            {'t': 1, 'event': {'id': 'heartbeat'}}])
+
+
+class RecordingTests(unittest.TestCase):
+
+    def test_event_handler_should_record_foreign_events_as_well(self):
+        event_handler = EventHandler('host', 8081, 'target')
+        event_handler.tracking_id = 'id-1'
+        event_handler.event_journal = Mock()
+        foreign_event = {'id': 'cmd', 'tracking_id': 'foreign'}
+
+        event_handler.on_command_execution_event(foreign_event)
+
+        event_handler.event_journal.record.assert_called_once_with(foreign_event)
+
+    def test_dispatcher_should_record_events(self):
+        dispatcher = TrackingIdDispatcher()
+        dispatcher.event_journal = Mock()
+        foreign_event = {'id': 'cmd', 'tracking_id': 'foreign'}
+
+        dispatcher.dispatch(foreign_event)
+
+        dispatcher.event_journal.record.assert_called_once_with(foreign_event)
+
+
+@patch('yadt_controller.event_handler.logger')
+@patch('yadt_controller.event_handler.reactor')
+class ReplayTests(unittest.TestCase):
+
+    def test_should_replay_execution_as_fast_as_possible(self, reactor, _):
+        sleep = Mock()
+        entries = [EXECUTION,
+                   event(0.5, tracking_id='foreign', state='started'),
+                   event(1, state='started'),
+                   event(20, state='finished')]
+
+        result = replay(entries, sleep=sleep)
+
+        event_handler, = result.event_handlers
+        self.assertEqual((event_handler.exit_code, event_handler.execution_state_machine.current), (0, 'success'))
+        self.assertEqual((result.events, result.dispatched_events, result.dropped_events), (3, 2, 1))
+        self.assertFalse(sleep.called)
+        self.assertFalse(reactor.stop.called)
+        self.assertFalse(reactor.callLater.called)
+
+    def test_should_schedule_timeouts_of_replayed_executions_on_given_reactor(self, reactor, _):
+        clock = Clock()
+
+        result = replay([EXECUTION], reactor=clock)
+        clock.advance(30)
+
+        event_handler, = result.event_handlers
+        self.assertEqual((event_handler.exit_code, event_handler.execution_state_machine.current), (1, 'failure'))
+        self.assertFalse(reactor.callLater.called)
+
+    def test_should_replay_at_multiple_of_recorded_pace(self, reactor, _):
+        sleep = Mock()
+        entries = [EXECUTION, event(1, state='started'), event(3, state='finished')]
+
+        replay(entries, speed=2, sleep=sleep, clock=lambda: 100)
+
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [0.5, 1.5])
+
+    def test_should_restart_pace_with_next_run_appended_to_journal(self, reactor, _):
+        sleep = Mock()
+        second_execution = {'t': 0.0, 'execution': dict(EXECUTION['execution'], tracking_id='id-2')}
+        entries = [EXECUTION, event(4, state='started'), second_execution, event(1, tracking_id='id-2')]
+
+        replay(entries, speed=1, sleep=sleep, clock=lambda: 100)
+
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [4, 1])
+
+    def test_should_keep_pace_of_next_run_appended_to_journal(self, reactor, _):
+        clock = FakeClock()
+        second_execution = {'t': 0.0, 'execution': dict(EXECUTION['execution'], tracking_id='id-2')}
+        entries = [EXECUTION, event(4, state='started'), event(6, state='finished'),
+                   second_execution, event(1, tracking_id='id-2', state='started'),
+                   event(3, tracking_id='id-2', state='finished')]
+
+        replay(entries, speed=1, sleep=clock.sleep, clock=clock)
+
+        self.assertEqual(clock.sleeps, [4, 2, 1, 2])
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 100
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@patch('yadt_controller.journal.logging')
+@patch('yadt_controller.event_handler.logger')
+@patch('yadt_controller.event_handler.reactor')
+class RunReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = os.path.join(self.directory, 'events.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_journal(self, *entries):
+        with open(self.journal, 'w') as journal_file:
+            for entry in entries:
+                journal_file.write(json.dumps(entry) + '\n')
+
+    @patch('yadt_controller.journal.sys')
+    def test_should_exit_with_zero_when_replayed_executions_succeeded(self, sys, *_):
+        self.write_journal(EXECUTION, event(1, state='started'), event(2, state='finished'))
+
+        run_replay([self.journal])
+
+        sys.exit.assert_called_once_with(0)
+
+    @patch('yadt_controller.journal.sys')
+    def test_should_exit_with_one_when_replayed_execution_did_not_complete(self, sys, *_):
+        self.write_journal(EXECUTION, event(1, state='started'))
+
+        run_replay([self.journal])
+
+        sys.exit.assert_called_once_with(1)
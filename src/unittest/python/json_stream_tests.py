@@ -0,0 +1,126 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+from yadt_controller.json_stream import JsonEventParser, project
+
+DOCUMENT = json.dumps({'name': 'target',
+                       'hosts': ['host1', 'host2'],
+                       'services': [{'uri': 'service://host1/a', 'state': 'up', 'port': -1.5e3},
+                                    {'uri': 'service://host2/b', 'state': 'down', 'tags': []}],
+                       'escaped': 'quote " backslash \\ unicode \u00e9',
+                       'flags': [True, False, None, 0, 12]})
+
+
+def split_into_chunks(text, size):
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+class JsonEventParserTests(unittest.TestCase):
+
+    def test_should_emit_events_for_nested_document(self):
+        parser = JsonEventParser()
+
+        events = list(parser.feed('{"a": [1, {"b": null}], "c": "d"}')) + list(parser.close())
+
+        self.assertEqual(events, [('start_map', None),
+                                  ('map_key', 'a'),
+                                  ('start_array', None),
+                                  ('value', 1),
+                                  ('start_map', None),
+                                  ('map_key', 'b'),
+                                  ('value', None),
+                                  ('end_map', None),
+                                  ('end_array', None),
+                                  ('map_key', 'c'),
+                                  ('value', 'd'),
+                                  ('end_map', None)])
+
+    def test_should_parse_the_same_events_regardless_of_chunk_boundaries(self):
+        parser = JsonEventParser()
+        expected_events = list(parser.feed(DOCUMENT)) + list(parser.close())
+
+        for size in range(1, 12):
+            parser = JsonEventParser()
+            events = []
+            for chunk in split_into_chunks(DOCUMENT, size):
+                events.extend(parser.feed(chunk))
+            events.extend(parser.close())
+
+            self.assertEqual(events, expected_events, 'chunk size {0}'.format(size))
+
+    def test_should_not_emit_number_before_it_is_complete(self):
+        parser = JsonEventParser()
+
+        self.assertEqual(list(parser.feed('[12')), [('start_array', None)])
+        self.assertEqual(list(parser.feed('.5]')), [('value', 12.5), ('end_array', None)])
+
+    def test_should_refuse_invalid_documents(self):
+        for document in ('{"a" 1}', '[1 2]', '{"a": 1]', '[1,]x', '{1: 2}', '[] []'):
+            parser = JsonEventParser()
+            self.assertRaises(ValueError, lambda: list(parser.feed(document)) + list(parser.close()))
+
+    def test_should_refuse_incomplete_documents(self):
+        parser = JsonEventParser()
+        list(parser.feed('{"a": [1, 2'))
+
+        self.assertRaises(ValueError, list, parser.close())
+
+    def test_should_skip_rest_of_container_on_request(self):
+        parser = JsonEventParser()
+        events = []
+        for event in parser.feed('{"a": {"b": [1, "]}"], "c": {}}, "d": 2}'):
+            events.append(event)
+            if len(events) == 3:
+                parser.skip_container()
+        events.extend(parser.close())
+
+        self.assertEqual(events, [('start_map', None),
+                                  ('map_key', 'a'),
+                                  ('start_map', None),
+                                  ('end_map', None),
+                                  ('map_key', 'd'),
+                                  ('value', 2),
+                                  ('end_map', None)])
+
+
+class ProjectTests(unittest.TestCase):
+
+    def test_should_yield_requested_subtrees(self):
+        values = list(project(split_into_chunks(DOCUMENT, 7), ['hosts', 'name']))
+
+        self.assertEqual(sorted(values), [('hosts', ['host1', 'host2']), ('name', 'target')])
+
+    def test_should_look_through_arrays(self):
+        values = list(project(split_into_chunks(DOCUMENT, 5), ['services.state']))
+
+        self.assertEqual(values, [('services.state', 'up'), ('services.state', 'down')])
+
+    def test_should_yield_whole_document_for_matching_nested_objects(self):
+        values = list(project([DOCUMENT], ['services']))
+
+        self.assertEqual(values, [('services', json.loads(DOCUMENT)['services'])])
+
+    def test_should_yield_nothing_when_no_field_matches(self):
+        self.assertEqual(list(project([DOCUMENT], ['missing', 'services.missing'])), [])
+
+    def test_should_yield_matches_before_the_document_is_complete(self):
+        values = project(iter(['{"name": "target", ', '"hosts": [']), ['name'])
+
+        self.assertEqual(next(values), ('name', 'target'))
+        self.assertRaises(ValueError, list, values)
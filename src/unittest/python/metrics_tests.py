@@ -0,0 +1,117 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mockito import mock
+from twisted.web.test.requesthelper import DummyRequest
+
+from yadt_controller.event_dispatcher import TrackingIdDispatcher
+from yadt_controller.metrics import ControllerMetrics, Histogram, create_metrics_resource
+
+
+def samples(metrics):
+    return [line for line in metrics.format().splitlines() if not line.startswith('#')]
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_should_count_observations_in_cumulative_buckets(self):
+        histogram = Histogram(buckets=(1, 5))
+
+        histogram.observe(0.5)
+        histogram.observe(3)
+        histogram.observe(7)
+
+        self.assertEqual(histogram.format_samples('duration', 'phase="waiting"'),
+                         ['duration_bucket{phase="waiting",le="1"} 1',
+                          'duration_bucket{phase="waiting",le="5"} 2',
+                          'duration_bucket{phase="waiting",le="+Inf"} 3',
+                          'duration_sum{phase="waiting"} 10.5',
+                          'duration_count{phase="waiting"} 3'])
+
+
+class ControllerMetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = ControllerMetrics(buckets=(10,))
+
+    def test_should_count_executions_by_outcome(self):
+        self.metrics.report('summary', target='dev01', exit_code=0, phases={})
+        self.metrics.report('summary', target='dev02', exit_code=0, phases={})
+        self.metrics.report('summary', target='dev03', exit_code=1, phases={})
+
+        self.assertTrue('yadtcontroller_executions_total{outcome="success"} 2' in samples(self.metrics))
+        self.assertTrue('yadtcontroller_executions_total{outcome="failure"} 1' in samples(self.metrics))
+
+    def test_should_count_timeouts_by_phase(self):
+        self.metrics.report('transition', source='waiting', destination='failure', trigger='waiting_timeout')
+        self.metrics.report('transition', source='pending', destination='failure', trigger='pending_timeout')
+        self.metrics.report('transition', source='pending', destination='failure', trigger='failed')
+
+        self.assertTrue('yadtcontroller_timeouts_total{phase="waiting"} 1' in samples(self.metrics))
+        self.assertTrue('yadtcontroller_timeouts_total{phase="pending"} 1' in samples(self.metrics))
+
+    def test_should_observe_phase_durations(self):
+        self.metrics.report('summary', exit_code=0, phases={'waiting': 2, 'pending': 12})
+
+        self.assertTrue('yadtcontroller_execution_phase_seconds_bucket{phase="waiting",le="10"} 1'
+                        in samples(self.metrics))
+        self.assertTrue('yadtcontroller_execution_phase_seconds_bucket{phase="pending",le="10"} 0'
+                        in samples(self.metrics))
+        self.assertTrue('yadtcontroller_execution_phase_seconds_count{phase="pending"} 1' in samples(self.metrics))
+
+    def test_should_sum_up_events_of_all_sources(self):
+        dispatcher = TrackingIdDispatcher()
+        dispatcher.dispatch({'tracking_id': 'foreign'})
+        event_handler = mock()
+        event_handler.dispatched_events = 3
+        event_handler.dropped_events = 1
+        self.metrics.add_event_source(dispatcher)
+        self.metrics.add_event_source(event_handler)
+
+        self.assertTrue('yadtcontroller_events_received_total 5' in samples(self.metrics))
+        self.assertTrue('yadtcontroller_events_dropped_total 2' in samples(self.metrics))
+
+    def test_should_serve_metrics_via_http(self):
+        request = DummyRequest([b'metrics'])
+
+        body = create_metrics_resource(self.metrics).render_GET(request)
+
+        self.assertEqual(body, self.metrics.format().encode('utf-8'))
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'content-type'), [b'text/plain; version=0.0.4'])
+
+
+class MetricsFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'yadtcontroller.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_write_metrics_to_file_on_flush(self):
+        metrics = ControllerMetrics(self.filename)
+        metrics.report('summary', exit_code=0, phases={})
+
+        metrics.close()
+
+        with open(self.filename) as metrics_file:
+            self.assertEqual(metrics_file.read(), metrics.format())
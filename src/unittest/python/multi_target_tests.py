@@ -0,0 +1,298 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+from mock import patch
+from twisted.internet.task import Clock
+from yadt_controller.broadcaster import ReconnectingWampBroadcaster
+from mockito import when, verify, unstub, any as any_value, mock, never
+
+import yadt_controller.multi_target
+from yadt_controller.multi_target import MultiTargetExecution, read_targets_file
+from yadt_controller.timing import ExecutionTimings
+
+
+class ReadTargetsFileTests(unittest.TestCase):
+
+    def setUp(self):
+        file_descriptor, self.targets_file = tempfile.mkstemp()
+        os.close(file_descriptor)
+
+    def tearDown(self):
+        os.remove(self.targets_file)
+
+    def test_should_read_one_target_per_line_and_skip_blank_lines_and_comments(self):
+        with open(self.targets_file, 'w') as targets_file:
+            targets_file.write('target1\n\n# a comment\n  target2  \n')
+
+        self.assertEqual(read_targets_file(self.targets_file), ['target1', 'target2'])
+
+
+class MultiTargetExecutionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.wampbroadcaster = mock(ReconnectingWampBroadcaster)
+        self.wampbroadcaster.client = mock()
+        when(yadt_controller.multi_target).ReconnectingWampBroadcaster(
+            any_value(), any_value(), endpoints=None).thenReturn(self.wampbroadcaster)
+        for target in ['target1', 'target2', 'target3']:
+            when(yadt_controller.multi_target).generate_tracking_id(target).thenReturn('id-' + target)
+        when(yadt_controller.multi_target.reactor).run().thenReturn(None)
+        when(yadt_controller.multi_target.reactor).stop().thenReturn(None)
+        when(yadt_controller.multi_target.sys).exit(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.reactor).callLater(any_value(), any_value()).thenReturn(None)
+        when(yadt_controller.multi_target.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.multi_target.logger).error(any_value()).thenReturn(None)
+        when(yadt_controller.multi_target.logger).debug(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).info(any_value()).thenReturn(None)
+        when(yadt_controller.event_handler.logger).debug(any_value()).thenReturn(None)
+
+    def tearDown(self):
+        unstub()
+
+    def test_should_refuse_execution_without_targets(self):
+        self.assertRaises(ValueError, MultiTargetExecution, 'host', 8081, [])
+
+    def test_should_create_one_event_handler_per_target(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+
+        self.assertEqual([handler.target for handler in execution.event_handlers], ['target1', 'target2'])
+
+    def test_should_share_one_broadcaster_between_all_targets(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=['--foo'])
+
+        verify(yadt_controller.multi_target, times=1).ReconnectingWampBroadcaster('host', 8081, endpoints=None)
+        for handler in execution.event_handlers:
+            self.assertTrue(handler.wamp_broadcaster is self.wampbroadcaster)
+
+    def test_should_append_tracking_id_to_a_copy_of_the_arguments_for_each_target(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        arguments = ['--foo']
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=arguments)
+
+        execution.publish_execution_requests()
+
+        self.assertEqual(arguments, ['--foo'])
+        for handler in execution.event_handlers:
+            self.assertEqual(handler.arguments, ['--foo', '--tracking-id=id-' + handler.target])
+            self.assertEqual(handler.tracking_id, 'id-' + handler.target)
+
+    def test_should_subscribe_to_all_targets_and_publish_requests_when_session_opens(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        execution.publish_execution_requests()
+
+        verify(self.wampbroadcaster.client).subscribe(execution.event_dispatcher.dispatch, 'target1')
+        verify(self.wampbroadcaster.client).subscribe(execution.event_dispatcher.dispatch, 'target2')
+        verify(self.wampbroadcaster).publish_request_for_target('target1', 'update', ['--tracking-id=id-target1'],
+                                                                tracking_id='id-target1')
+        verify(self.wampbroadcaster).publish_request_for_target('target2', 'update', ['--tracking-id=id-target2'],
+                                                                tracking_id='id-target2')
+
+    def test_should_subscribe_to_all_targets_again_when_broadcaster_reconnects(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        verify(self.wampbroadcaster).addOnReconnectHandler(execution.subscribe_targets)
+
+        execution.publish_execution_requests()
+        execution.subscribe_targets()
+
+        verify(self.wampbroadcaster.client, times=2).subscribe(execution.event_dispatcher.dispatch, 'target1')
+        verify(self.wampbroadcaster.client, times=2).subscribe(execution.event_dispatcher.dispatch, 'target2')
+
+    def test_should_share_connect_timings_with_every_execution(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.timings = ExecutionTimings(clock=iter([10, 12]).next)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        execution.publish_execution_requests()
+
+        for handler in execution.event_handlers:
+            self.assertEqual(handler.timings.elapsed('connecting', 'session_open'), 2)
+
+    def test_should_not_start_more_executions_than_allowed_in_flight(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2', 'target3'], max_in_flight=2)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        execution.publish_execution_requests()
+
+        self.assertEqual([handler.target for handler in execution.started_event_handlers], ['target1', 'target2'])
+        verify(self.wampbroadcaster, never).publish_request_for_target('target3', any_value(), any_value(),
+                                                                       tracking_id=any_value())
+
+    def test_should_start_next_execution_as_soon_as_an_execution_finished(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2', 'target3'], max_in_flight=2)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+        first_handler = execution.event_handlers[0]
+        first_handler.exit_code = 1
+
+        execution.on_execution_finished(first_handler)
+
+        self.assertEqual(execution.executions_in_flight(), 2)
+        verify(self.wampbroadcaster).publish_request_for_target('target3', 'update', ['--tracking-id=id-target3'],
+                                                                tracking_id='id-target3')
+
+    def test_should_stop_rollout_after_maximum_number_of_failures(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2', 'target3'],
+                                         max_in_flight=1, max_failures=1)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+        first_handler = execution.event_handlers[0]
+        first_handler.exit_code = 1
+
+        execution.on_execution_finished(first_handler)
+        execution.on_execution_complete(first_handler)
+
+        self.assertTrue(execution.rollout_aborted)
+        self.assertEqual(execution.started_event_handlers, [first_handler])
+        verify(yadt_controller.multi_target.reactor).stop()
+
+    def test_should_keep_rolling_out_when_failures_are_below_maximum(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'],
+                                         max_in_flight=1, max_failures=2)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+        first_handler = execution.event_handlers[0]
+        first_handler.exit_code = 1
+
+        execution.on_execution_finished(first_handler)
+
+        self.assertFalse(execution.rollout_aborted)
+        self.assertEqual(len(execution.started_event_handlers), 2)
+
+    def test_should_refuse_invalid_rollout_limits(self):
+        self.assertRaises(ValueError, MultiTargetExecution, 'host', 8081, ['target'], max_in_flight=0)
+        self.assertRaises(ValueError, MultiTargetExecution, 'host', 8081, ['target'], max_failures=0)
+
+    def test_should_register_started_executions_with_dispatcher(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'], max_in_flight=1)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        execution.publish_execution_requests()
+
+        self.assertEqual(execution.event_dispatcher.event_handlers, {'id-target1': execution.event_handlers[0]})
+
+    def test_should_unregister_completed_executions_from_dispatcher(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+
+        execution.on_execution_complete(execution.event_handlers[0])
+
+        self.assertEqual(execution.event_dispatcher.event_handlers, {'id-target2': execution.event_handlers[1]})
+
+    def test_should_stop_reactor_only_when_all_executions_are_complete(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+        first_handler, second_handler = execution.event_handlers
+
+        execution.on_execution_complete(first_handler)
+        verify(yadt_controller.multi_target.reactor, never).stop()
+
+        execution.on_execution_complete(second_handler)
+        verify(yadt_controller.multi_target.reactor).stop()
+
+    def test_should_exit_with_zero_when_all_targets_succeeded(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        for handler in execution.event_handlers:
+            handler.exit_code = 0
+
+        self.assertEqual(execution.determine_exit_code(), 0)
+
+    def test_should_exit_with_one_when_any_target_failed(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.event_handlers[0].exit_code = 0
+        execution.event_handlers[1].exit_code = 1
+
+        self.assertEqual(execution.determine_exit_code(), 1)
+
+    def test_should_exit_with_one_when_a_target_never_completed(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+        execution.event_handlers[0].exit_code = 0
+
+        self.assertEqual(execution.determine_exit_code(), 1)
+
+    def test_should_exit_with_aggregated_exit_code_after_reactor_stopped(self):
+        execution = MultiTargetExecution('host', 8081, ['target1'])
+
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        verify(yadt_controller.multi_target.sys).exit(1)
+        verify(yadt_controller.multi_target.logger).error('Skipped targets: target1')
+
+    @patch('yadt_controller.multi_target.reactor')
+    def test_should_fail_all_targets_when_broadcaster_session_never_opens(self, reactor):
+        clock = Clock()
+        reactor.callLater.side_effect = clock.callLater
+        reactor.run.side_effect = lambda: clock.advance(30)
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'])
+
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        reactor.stop.assert_called_with()
+        self.assertEqual([handler.exit_code for handler in execution.event_handlers], [1, 1])
+        verify(yadt_controller.multi_target.logger).error('Failed targets: target1, target2')
+        verify(yadt_controller.multi_target.sys).exit(1)
+
+    @patch('yadt_controller.multi_target.reactor')
+    def test_should_not_fail_targets_when_broadcaster_session_opens_in_time(self, reactor):
+        clock = Clock()
+        reactor.callLater.side_effect = clock.callLater
+        execution = MultiTargetExecution('host', 8081, ['target1'])
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+
+        execution.publish_execution_requests()
+        clock.advance(30)
+
+        self.assertFalse(reactor.stop.called)
+        self.assertEqual(execution.event_handlers[0].exit_code, None)
+
+    def test_should_report_targets_that_were_never_started_as_skipped(self):
+        execution = MultiTargetExecution('host', 8081, ['target1', 'target2'], max_in_flight=1, max_failures=1)
+        execution.initialize_for_execution_request(waiting_timeout=30, pending_timeout=60,
+                                                   command_to_execute='update', arguments=[])
+        execution.publish_execution_requests()
+        first_handler = execution.event_handlers[0]
+        first_handler.exit_code = 1
+        execution.on_execution_finished(first_handler)
+
+        execution.display_summary()
+
+        verify(yadt_controller.multi_target.logger).error('Failed targets: target1')
+        verify(yadt_controller.multi_target.logger).error('Skipped targets: target2')
@@ -14,11 +14,15 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading
 from unittest import TestCase
 
 from mock import patch, Mock
 
-from yadt_controller.rest_api import (EndpointException, TargetInfoEndpoint)
+import yadt_controller.rest_api
+from yadt_controller.info_cache import InfoCache
+from yadt_controller.rest_api import (EndpointException, TargetInfoEndpoint, TargetInfo, create_session,
+                                      configure_pool_size, fetch_target_infos, get_shared_session, select_endpoint)
 
 
 class Test(TestCase):
@@ -39,26 +43,196 @@ class Test(TestCase):
         self.assertRaises(EndpointException,
                           self.endpoint.validate_response, Mock(status_code=400, reason="bad request"))
 
-    @patch("yadt_controller.rest_api.get")
-    def test_should_fetch_info_and_return_it_with_default_timeout(self, get):
-        get.return_value = Mock(text="this is the body of the get response", status_code=200)
+    @patch("yadt_controller.rest_api.get_shared_session")
+    def test_should_fetch_info_and_return_it_with_default_timeout(self, get_shared_session):
+        get_shared_session.return_value.get.return_value = Mock(text="this is the body of the get response",
+                                                                status_code=200)
 
         actual_info = self.endpoint.fetch()
 
         self.assertEqual(actual_info, "this is the body of the get response")
 
-    @patch("yadt_controller.rest_api.get")
-    def test_should_call_specified_url_with_default_timeout(self, get):
+    @patch("yadt_controller.rest_api.get_shared_session")
+    def test_should_call_specified_url_with_default_timeout(self, get_shared_session):
+        get = get_shared_session.return_value.get
         get.return_value = Mock(status_code=200)
 
-        actual_info = self.endpoint.fetch()
+        self.endpoint.fetch()
 
         get.assert_called_with('http://any-host:8080/api/v1/targets/any-target/full', timeout=5)
 
-    @patch("yadt_controller.rest_api.get")
-    def test_should_call_specified_url_with_userset_timeout(self, get):
+    @patch("yadt_controller.rest_api.get_shared_session")
+    def test_should_call_specified_url_with_userset_timeout(self, get_shared_session):
+        get = get_shared_session.return_value.get
         get.return_value = Mock(status_code=200)
 
-        actual_info = self.endpoint.fetch(42)
+        self.endpoint.fetch(42)
 
         get.assert_called_with('http://any-host:8080/api/v1/targets/any-target/full', timeout=42)
+
+    def test_should_use_given_session_instead_of_shared_one(self):
+        session = Mock()
+        session.get.return_value = Mock(text="info", status_code=200)
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session)
+
+        self.assertEqual(endpoint.fetch(), "info")
+
+    def test_should_wrap_connection_errors_in_endpoint_exception(self):
+        session = Mock()
+        session.get.side_effect = IOError("connection refused")
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session)
+
+        self.assertRaises(EndpointException, endpoint.fetch)
+
+    def test_should_serve_fresh_info_from_cache_without_request(self):
+        session = Mock()
+        cache = InfoCache(ttl_in_seconds=30)
+        cache.put("any-host", 8080, "any-target", "cached info")
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session, cache=cache)
+
+        self.assertEqual(endpoint.fetch(), "cached info")
+        self.assertFalse(session.get.called)
+
+    def test_should_store_fetched_info_with_validators_in_cache(self):
+        session = Mock()
+        session.get.return_value = Mock(text="info", status_code=200,
+                                        headers={'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        cache = InfoCache(ttl_in_seconds=30)
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session, cache=cache)
+
+        endpoint.fetch()
+
+        entry = cache.get("any-host", 8080, "any-target")
+        self.assertEqual((entry.info, entry.etag, entry.last_modified),
+                         ("info", '"abc"', 'Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    def test_should_revalidate_expired_info_and_reuse_it_when_not_modified(self):
+        session = Mock()
+        session.get.return_value = Mock(status_code=304, headers={})
+        cache = InfoCache(ttl_in_seconds=0)
+        cache.put("any-host", 8080, "any-target", "cached info", etag='"abc"',
+                  last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session, cache=cache)
+
+        self.assertEqual(endpoint.fetch(), "cached info")
+        session.get.assert_called_with('http://any-host:8080/api/v1/targets/any-target/full', timeout=5,
+                                       headers={'If-None-Match': '"abc"',
+                                                'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+    def test_should_stream_decoded_chunks(self):
+        session = Mock()
+        response = Mock(status_code=200, encoding=None)
+        response.iter_content.return_value = iter([b'{"name": "caf', b'\xc3', b'\xa9"}'])
+        session.get.return_value = response
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session)
+
+        chunks = list(endpoint.stream(42))
+
+        self.assertEqual(u''.join(chunks), u'{"name": "caf\u00e9"}')
+        session.get.assert_called_with('http://any-host:8080/api/v1/targets/any-target/full', timeout=42,
+                                       stream=True)
+        self.assertTrue(response.close.called)
+
+    def test_should_raise_before_streaming_when_response_is_invalid(self):
+        session = Mock()
+        session.get.return_value = Mock(status_code=404, reason="Not Found")
+        endpoint = TargetInfoEndpoint("any-target", "any-host", 8080, session=session)
+
+        self.assertRaises(EndpointException, endpoint.stream)
+
+
+class SessionTests(TestCase):
+
+    def setUp(self):
+        self.original_session = yadt_controller.rest_api._shared_session
+        yadt_controller.rest_api._shared_session = None
+
+    def tearDown(self):
+        yadt_controller.rest_api._shared_session = self.original_session
+
+    def test_should_share_one_session_between_all_requests(self):
+        self.assertTrue(get_shared_session() is get_shared_session())
+
+    def test_should_pool_connections_with_configured_size(self):
+        configure_pool_size(42)
+
+        adapter = get_shared_session().get_adapter('http://any-host:8080/')
+        self.assertEqual(adapter._pool_maxsize, 42)
+
+    def test_should_refuse_empty_pool(self):
+        self.assertRaises(ValueError, create_session, 0)
+
+
+class FetchTargetInfosTests(TestCase):
+
+    def setUp(self):
+        self.logging_patcher = patch("yadt_controller.rest_api.logger")
+        self.logging_patcher.start()
+
+    def tearDown(self):
+        self.logging_patcher.stop()
+
+    def test_should_fetch_all_targets_over_the_same_session_and_report_errors_inline(self):
+        session = Mock()
+        session.get.side_effect = [Mock(text="info of target1", status_code=200),
+                                   Mock(status_code=404, reason="Not Found")]
+
+        target_infos = list(fetch_target_infos(['target1', 'target2'], 'any-host', 8080, session=session))
+
+        self.assertEqual(target_infos[0], TargetInfo('target1', 'info of target1', None))
+        self.assertEqual(target_infos[1].target, 'target2')
+        self.assertTrue(isinstance(target_infos[1].error, EndpointException))
+        session.get.assert_called_with('http://any-host:8080/api/v1/targets/target2/full', timeout=5)
+
+    def test_should_yield_target_infos_in_completion_order_when_fetching_concurrently(self):
+        release_target1 = threading.Event()
+
+        def get(url, timeout):
+            if 'target1' in url:
+                release_target1.wait(5)
+            return Mock(text=url, status_code=200)
+        session = Mock()
+        session.get.side_effect = get
+
+        target_infos = fetch_target_infos(['target1', 'target2'], 'any-host', 8080, session=session, max_workers=2)
+
+        self.assertEqual(next(target_infos).target, 'target2')
+        release_target1.set()
+        self.assertEqual(next(target_infos).target, 'target1')
+        self.assertEqual(list(target_infos), [])
+
+    def test_should_report_errors_inline_when_fetching_concurrently(self):
+        session = Mock()
+        session.get.side_effect = lambda url, timeout: Mock(status_code=404, reason='Not Found')
+
+        target_infos = list(fetch_target_infos(['target1', 'target2', 'target3'], 'any-host', 8080,
+                                               session=session, max_workers=2))
+
+        self.assertEqual(sorted(target_info.target for target_info in target_infos), ['target1', 'target2', 'target3'])
+        for target_info in target_infos:
+            self.assertTrue(isinstance(target_info.error, EndpointException))
+
+    def test_should_refuse_fetching_without_workers(self):
+        self.assertRaises(ValueError, list, fetch_target_infos(['target'], 'any-host', 8080, max_workers=0))
+
+
+class SelectEndpointTests(TestCase):
+
+    def test_should_not_probe_single_broadcaster(self):
+        connect = Mock()
+
+        self.assertEqual(select_endpoint([('broadcaster', 8081)], connect=connect), ('broadcaster', 8081))
+        self.assertFalse(connect.called)
+
+    def test_should_select_broadcaster_accepting_connection(self):
+        def connect(endpoint, timeout_in_seconds):
+            if endpoint[0] == 'down':
+                raise IOError('connection refused')
+            return Mock()
+
+        self.assertEqual(select_endpoint([('down', 8081), ('up', 8081)], connect=connect), ('up', 8081))
+
+    def test_should_raise_when_no_broadcaster_responds(self):
+        connect = Mock(side_effect=IOError('connection refused'))
+
+        self.assertRaises(EndpointException, select_endpoint, [('down1', 8081), ('down2', 8081)], connect=connect)
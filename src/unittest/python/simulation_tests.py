@@ -0,0 +1,111 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+
+from mock import patch
+from twisted.internet.task import Clock
+
+from yadt_controller.controller import Controller
+from yadt_controller.simulation import SimulatedBroadcaster, SimulatedReceivers
+
+
+def results_of(deferred):
+    results = []
+    deferred.addBoth(results.append)
+    return results
+
+
+@patch('yadt_controller.controller.logger')
+@patch('yadt_controller.event_handler.logger')
+class SimulationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.reactor_patcher = patch('yadt_controller.event_handler.reactor', self.clock)
+        self.reactor_patcher.start()
+
+    def tearDown(self):
+        self.reactor_patcher.stop()
+
+    def execute(self, receivers, noise_rate=0, **execution_options):
+        self.broadcaster = SimulatedBroadcaster(receivers, noise_rate=noise_rate, noise_services=2,
+                                                reactor=self.clock, randomness=random.Random(0))
+        self.controller = Controller('localhost', 8081)
+        self.controller.connect(self.broadcaster)
+        result = results_of(self.controller.execute('target', 'update', tracking_id='id-1', **execution_options))
+        # opens the session, which publishes the request
+        self.clock.advance(0.01)
+        return result
+
+    def test_should_complete_execution_with_events_of_simulated_receiver(self, *_):
+        result = self.execute(SimulatedReceivers(start_latency=1, execution_time=2, jitter=0, services=3))
+
+        self.assertEqual(self.broadcaster.requests, 1)
+        self.clock.advance(3)
+
+        result, = result
+        self.assertEqual((result.exit_code, result.state, result.remote_host), (0, 'success', 'receiver-target'))
+        self.assertEqual(len(result.service_changes), 3)
+
+    def test_should_complete_failed_execution_after_error_report(self, *_):
+        result = self.execute(SimulatedReceivers(start_latency=1, execution_time=1, jitter=0, failure_ratio=1))
+
+        self.clock.advance(2)
+
+        result, = result
+        self.assertEqual((result.exit_code, result.state), (1, 'failure'))
+
+    def test_should_time_out_waiting_when_request_is_not_answered(self, *_):
+        result = self.execute(SimulatedReceivers(unanswered_ratio=1), waiting_timeout=5, error_report_timeout=1)
+
+        self.clock.advance(4.98)
+        self.assertEqual(result, [])
+        self.clock.advance(0.01)
+
+        result, = result
+        self.assertEqual((result.exit_code, result.state), (1, 'failure'))
+
+    def test_should_time_out_pending_when_command_never_finishes(self, *_):
+        result = self.execute(SimulatedReceivers(start_latency=1, jitter=0, stuck_ratio=1),
+                              pending_timeout=10, error_report_timeout=1)
+
+        self.clock.advance(1)
+        self.clock.advance(10)
+        self.assertEqual(result, [])
+        self.clock.advance(1)
+
+        result, = result
+        self.assertEqual((result.exit_code, result.remote_host), (1, 'receiver-target'))
+
+    def test_should_drop_noise_on_subscribed_targets(self, *_):
+        self.execute(SimulatedReceivers(unanswered_ratio=1), noise_rate=10)
+
+        self.clock.pump([0.1] * 10)
+
+        self.assertEqual(self.controller.event_dispatcher.dropped_events, 10)
+        self.assertEqual(self.controller.event_dispatcher.dispatched_events, 0)
+
+    def test_should_subscribe_constructor_target_for_on_event(self, *_):
+        broadcaster = SimulatedBroadcaster(SimulatedReceivers(), target='target', reactor=self.clock)
+        events = []
+        broadcaster.onEvent = events.append
+
+        self.clock.advance(0.01)
+        broadcaster.publish('target', {'id': 'cmd'})
+
+        self.assertEqual(events, [{'id': 'cmd'}])
@@ -0,0 +1,85 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from yadt_controller.socket_api import (submit, create_execution_request, create_info_request,
+                                        encode_message, decode_message)
+
+
+class SocketApiTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'controller.sock')
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        self.server.listen(1)
+        self.received_lines = []
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def serve_once(self, response_lines):
+        def serve():
+            connection, _ = self.server.accept()
+            stream = connection.makefile('rb')
+            self.received_lines.append(stream.readline())
+            for line in response_lines:
+                connection.sendall(line)
+            stream.close()
+            connection.close()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def test_should_create_execution_request(self):
+        self.assertEqual(create_execution_request('target', 'update', ('--foo',), 30, 60, 10),
+                         {'request': 'execute',
+                          'target': 'target',
+                          'command': 'update',
+                          'arguments': ['--foo'],
+                          'waiting_timeout': 30,
+                          'pending_timeout': 60,
+                          'error_report_timeout': 10})
+
+    def test_should_create_info_request(self):
+        self.assertEqual(create_info_request('target', 5), {'request': 'info', 'target': 'target', 'timeout': 5})
+
+    def test_should_send_request_as_one_line_and_yield_all_messages_until_connection_is_closed(self):
+        thread = self.serve_once([encode_message({'type': 'accepted'}) + b'\r\n',
+                                  encode_message({'type': 'progress', 'text': 'update started'}) + b'\r\n' +
+                                  encode_message({'type': 'result', 'exit_code': 0}) + b'\r\n'])
+
+        messages = list(submit(self.socket_path, create_info_request('target', 5)))
+        thread.join()
+
+        self.assertEqual(decode_message(self.received_lines[0]), {'request': 'info', 'target': 'target',
+                                                                  'timeout': 5})
+        self.assertEqual(messages, [{'type': 'accepted'},
+                                    {'type': 'progress', 'text': 'update started'},
+                                    {'type': 'result', 'exit_code': 0}])
+
+    def test_should_raise_socket_error_when_daemon_is_not_listening(self):
+        generator = submit(os.path.join(self.directory, 'missing.sock'), create_info_request('target', 5))
+
+        self.assertRaises(socket.error, list, generator)
@@ -14,11 +14,16 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import unittest
+from StringIO import StringIO
 
+from mock import Mock, patch
 from mockito import mock, verify
+from twisted.internet.task import Clock
 
-from yadt_controller.terminal import TeamCityProgressMessageHandler
+from yadt_controller.terminal import (TeamCityProgressMessageHandler, JsonLinesResultReporter, CombinedResultReporter,
+                                      escape_teamcity_value)
 
 
 class TeamcityMessageTest(unittest.TestCase):
@@ -29,5 +34,119 @@ class TeamcityMessageTest(unittest.TestCase):
         progress_handler = TeamCityProgressMessageHandler()
 
         progress_handler.output_progress(mock_stream, 'service foo is now up')
+        progress_handler.flush()
 
         verify(mock_stream).write("##teamcity[progressMessage 'service foo is now up']\n")
+        verify(mock_stream).flush()
+
+    def test_should_escape_teamcity_values(self):
+        self.assertEqual(escape_teamcity_value("it's [up] | down\r\n"), "it|'s |[up|] || down|r|n")
+        self.assertEqual(escape_teamcity_value(u'next\u0085line\u2028and\u2029paragraph'),
+                         u'next|xline|land|pparagraph')
+
+    def test_should_write_messages_of_one_reactor_iteration_at_once(self):
+        clock = Clock()
+        stream = Mock()
+        progress_handler = TeamCityProgressMessageHandler(clock)
+
+        progress_handler.output_progress(stream, 'service://host/foo is now up.')
+        progress_handler.output_progress(stream, "service://host/b'ar is now up.")
+        self.assertFalse(stream.write.called)
+
+        clock.advance(0)
+
+        stream.write.assert_called_once_with("##teamcity[progressMessage 'service://host/foo is now up.']\n"
+                                             "##teamcity[progressMessage 'service://host/b|'ar is now up.']\n")
+        stream.flush.assert_called_once_with()
+
+    def test_should_write_buffered_messages_when_flushed_before_reactor_iteration(self):
+        clock = Clock()
+        stream = Mock()
+        progress_handler = TeamCityProgressMessageHandler(clock)
+        progress_handler.output_progress(stream, 'update started')
+
+        progress_handler.flush()
+        clock.advance(0)
+
+        self.assertEqual(stream.write.call_count, 1)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+
+class JsonLinesResultReporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO()
+        self.reporter = JsonLinesResultReporter(self.stream, buffer_size=100, clock=lambda: 42)
+
+    def test_should_buffer_records_until_flushed(self):
+        self.reporter.report('call-info', target='target', host='some-machine')
+
+        self.assertEqual(self.stream.getvalue(), '')
+
+        self.reporter.flush()
+
+        self.assertEqual(self.stream.getvalue(),
+                         '{"event": "call-info", "host": "some-machine", "target": "target", "timestamp": 42}\n')
+
+    def test_should_write_buffered_records_once_buffer_size_is_reached(self):
+        self.reporter.report('service-change', uri='service://foo/bar', state='up')
+        self.reporter.report('service-change', uri='service://foo/baz', state='up')
+
+        self.assertEqual([json.loads(line)['uri'] for line in self.stream.getvalue().splitlines()],
+                         ['service://foo/bar', 'service://foo/baz'])
+
+    def test_should_close_file(self):
+        self.reporter.stream = mock()
+
+        self.reporter.close()
+
+        verify(self.reporter.stream).close()
+
+    @patch('yadt_controller.terminal.sys')
+    def test_should_not_close_stdout(self, mock_sys):
+        self.reporter.stream = mock_sys.stdout
+
+        self.reporter.close()
+
+        self.assertFalse(mock_sys.stdout.close.called)
+
+
+class CombinedResultReporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.first_reporter = mock()
+        self.second_reporter = mock()
+        self.reporter = CombinedResultReporter([self.first_reporter, self.second_reporter])
+
+    def test_should_report_records_to_all_reporters(self):
+        self.reporter.report('call-info', target='target', host='some-machine')
+
+        verify(self.first_reporter).report('call-info', target='target', host='some-machine')
+        verify(self.second_reporter).report('call-info', target='target', host='some-machine')
+
+    def test_should_not_pass_changes_of_one_reporter_on_to_the_next(self):
+        received_fields = []
+
+        class ChangingReporter(object):
+
+            def report(self, event, **fields):
+                received_fields.append(dict(fields))
+                fields['host'] = 'changed'
+
+        self.reporter.reporters = [ChangingReporter(), ChangingReporter()]
+
+        self.reporter.report('call-info', host='some-machine')
+
+        self.assertEqual(received_fields, [{'host': 'some-machine'}, {'host': 'some-machine'}])
+
+    def test_should_flush_all_reporters(self):
+        self.reporter.flush()
+
+        verify(self.first_reporter).flush()
+        verify(self.second_reporter).flush()
+
+    def test_should_close_all_reporters(self):
+        self.reporter.close()
+
+        verify(self.first_reporter).close()
+        verify(self.second_reporter).close()
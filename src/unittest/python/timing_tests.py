@@ -0,0 +1,146 @@
+#   yadtcontroller
+#   Copyright (C) 2014 Immobilien Scout GmbH
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from yadt_controller.timing import (ExecutionTimings, PhaseTimingsFile, escape_label_value, format_phases,
+                                    format_prometheus_textfile, format_statsd_lines, monotonic,
+                                    write_file_atomically)
+
+
+class MonotonicTests(unittest.TestCase):
+
+    def test_should_never_go_backwards(self):
+        first = monotonic()
+        second = monotonic()
+
+        self.assertTrue(second >= first)
+
+
+class ExecutionTimingsTests(unittest.TestCase):
+
+    def test_should_determine_phases_the_execution_went_through(self):
+        timings = ExecutionTimings(clock=iter([10, 11, 12, 15, 40]).next)
+
+        for point in ('connecting', 'session_open', 'published', 'started', 'finished'):
+            timings.mark(point)
+
+        self.assertEqual(timings.phases(), {'connect': 1, 'publish': 1, 'waiting': 3, 'pending': 25})
+
+    def test_should_keep_first_time_a_point_was_passed(self):
+        timings = ExecutionTimings(clock=iter([10, 20]).next)
+
+        timings.mark('published')
+        timings.mark('published')
+        timings.mark('started')
+
+        self.assertEqual(timings.elapsed('published', 'started'), 10)
+
+    def test_should_determine_drain_after_failure(self):
+        timings = ExecutionTimings()
+
+        timings.mark('finished', at=5)
+        timings.mark('failed', at=5)
+        timings.mark('completed', at=8)
+
+        self.assertEqual(timings.phases(), {'drain': 3})
+
+    def test_should_not_determine_elapsed_time_of_points_not_passed(self):
+        timings = ExecutionTimings()
+        timings.mark('published', at=5)
+
+        self.assertEqual(timings.elapsed('published', 'started'), None)
+
+    def test_should_format_phases_in_order(self):
+        self.assertEqual(format_phases({'pending': 25, 'waiting': 3.5}), 'waiting 3.500s, pending 25.000s')
+
+
+class TimingsFormatTests(unittest.TestCase):
+
+    summaries = [{'target': 'dev"01', 'command': 'update', 'phases': {'waiting': 1.5, 'pending': 20.25}},
+                 {'target': 'dev02', 'command': 'update', 'phases': {}}]
+
+    def test_should_format_prometheus_textfile(self):
+        self.assertEqual(format_prometheus_textfile(self.summaries),
+                         ['# HELP yadtcontroller_phase_duration_seconds Duration of the phases of the last '
+                          'command execution.',
+                          '# TYPE yadtcontroller_phase_duration_seconds gauge',
+                          'yadtcontroller_phase_duration_seconds{target="dev\\"01",command="update",phase="waiting"} '
+                          '1.5',
+                          'yadtcontroller_phase_duration_seconds{target="dev\\"01",command="update",phase="pending"} '
+                          '20.25'])
+
+    def test_should_escape_backslashes_in_label_values(self):
+        self.assertEqual(escape_label_value('C:\\temp'), 'C:\\\\temp')
+
+    def test_should_escape_newlines_in_label_values(self):
+        self.assertEqual(escape_label_value('dev\n01'), 'dev\\n01')
+
+    def test_should_escape_double_quotes_in_label_values(self):
+        self.assertEqual(escape_label_value('dev"01'), 'dev\\"01')
+
+    def test_should_escape_backslashes_before_other_characters(self):
+        self.assertEqual(escape_label_value('\\"'), '\\\\\\"')
+
+    def test_should_convert_label_values_to_strings(self):
+        self.assertEqual(escape_label_value(42), '42')
+
+    def test_should_format_statsd_timers_in_milliseconds(self):
+        self.assertEqual(format_statsd_lines(self.summaries),
+                         ['yadtcontroller.dev_01.update.waiting:1500|ms',
+                          'yadtcontroller.dev_01.update.pending:20250|ms'])
+
+
+class PhaseTimingsFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'yadtcontroller.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_write_timings_of_summaries_on_flush(self):
+        timings_file = PhaseTimingsFile(self.filename, 'statsd')
+        timings_file.report('transition', target='dev01', source='idle', destination='waiting')
+        timings_file.report('summary', target='dev01', command='update', phases={'waiting': 2})
+
+        timings_file.close()
+
+        with open(self.filename) as written_file:
+            self.assertEqual(written_file.read(), 'yadtcontroller.dev01.update.waiting:2000|ms\n')
+        self.assertEqual(os.listdir(self.directory), ['yadtcontroller.prom'])
+
+    def test_should_write_file_readable_according_to_umask(self):
+        previous_umask = os.umask(0o022)
+        try:
+            write_file_atomically(self.filename, 'content\n')
+        finally:
+            os.umask(previous_umask)
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o644)
+
+    def test_should_not_write_file_without_summaries(self):
+        PhaseTimingsFile(self.filename).flush()
+
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_should_refuse_unknown_format(self):
+        self.assertRaises(ValueError, PhaseTimingsFile, self.filename, 'graphite')
@@ -14,27 +14,72 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
+import threading
 import unittest
 
-from mockito import when, unstub, verify
+from mock import patch
+from mockito import when, unstub, verify, any as any_value
 
 import yadt_controller
-from yadt_controller.tracking import generate_tracking_id
+from yadt_controller.tracking import generate_tracking_id, get_identity
 
 
 class TrackingTests(unittest.TestCase):
 
+    def setUp(self):
+        yadt_controller.tracking._identity = None
+        yadt_controller.tracking._sequence = itertools.count(1)
+        when(yadt_controller.tracking.logger).warn(any_value()).thenReturn(None)
+
     def tearDown(self):
         unstub()
+        yadt_controller.tracking._identity = None
 
     def test_generate_tracking_id_should_use_hostname_and_timestamp_and_target_for_generation(self):
         when(yadt_controller.tracking.getpass).getuser().thenReturn('user')
         when(yadt_controller.tracking.socket).getfqdn().thenReturn('host')
+        when(yadt_controller.tracking.os).getpid().thenReturn(4711)
         when(yadt_controller.tracking).get_timestamp().thenReturn('timestamp')
         actual_tracking_id = generate_tracking_id('target')
 
-        self.assertEqual('"(timestamp):user@host->target"', actual_tracking_id)
+        self.assertEqual('"(timestamp #4711-1):user@host->target"', actual_tracking_id)
 
         verify(yadt_controller.tracking.getpass).getuser()
         verify(yadt_controller.tracking.socket).getfqdn()
         verify(yadt_controller.tracking).get_timestamp()
+
+    def test_should_generate_distinct_tracking_ids_within_the_same_timestamp(self):
+        when(yadt_controller.tracking).get_identity().thenReturn('user@host')
+        when(yadt_controller.tracking).get_timestamp().thenReturn('timestamp')
+
+        tracking_ids = set(generate_tracking_id('target') for _ in range(1000))
+
+        self.assertEqual(len(tracking_ids), 1000)
+
+    def test_should_resolve_identity_only_once(self):
+        when(yadt_controller.tracking.getpass).getuser().thenReturn('user')
+        when(yadt_controller.tracking.socket).getfqdn().thenReturn('host')
+
+        self.assertEqual(get_identity(), 'user@host')
+        self.assertEqual(get_identity(), 'user@host')
+
+        verify(yadt_controller.tracking.getpass, times=1).getuser()
+        verify(yadt_controller.tracking.socket, times=1).getfqdn()
+
+    def test_should_fall_back_to_host_name_when_fqdn_does_not_resolve_in_time(self):
+        resolved = threading.Event()
+        when(yadt_controller.tracking.getpass).getuser().thenReturn('user')
+        when(yadt_controller.tracking.socket).gethostname().thenReturn('short-host')
+
+        with patch('yadt_controller.tracking.socket.getfqdn', side_effect=lambda: resolved.wait(1) and 'host'):
+            identity = get_identity(timeout_in_seconds=0.01)
+            resolved.set()
+
+        self.assertEqual(identity, 'user@short-host')
+
+    def test_should_fall_back_to_unknown_user_name(self):
+        when(yadt_controller.tracking.getpass).getuser().thenRaise(KeyError('uid not found: 4711'))
+        when(yadt_controller.tracking.socket).getfqdn().thenReturn('host')
+
+        self.assertEqual(get_identity(), 'unknown@host')
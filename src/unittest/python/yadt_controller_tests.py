@@ -16,20 +16,35 @@
 
 from __future__ import print_function
 
+import json
+import os
+import subprocess
+import sys
 import unittest
 
 from mockito import when, verify, unstub, any as any_value, mock, never
-from mock import patch
-from docopt import Option
+from mock import patch, Mock
+from docopt import DocoptExit, Option
+from twisted.internet.defer import fail, succeed
 
 import yadt_controller
+import yadt_controller.event_handler
+import yadt_controller.multi_target
+import yadt_controller.rest_api
+import yadt_controller.daemon
+import yadt_controller.socket_api
+import yadt_controller.journal
+from yadt_controller.broadcaster import probe_endpoints
+from yadt_controller.daemon import ControllerDaemon
 from yadt_controller.event_handler import EventHandler
-from yadt_controller.rest_api import TargetInfoEndpoint
+from yadt_controller.rest_api import TargetInfoEndpoint, TargetInfo, EndpointException
+from yadt_controller.multi_target import MultiTargetExecution
 
 
 class YadtControllerTests(unittest.TestCase):
 
     def setUp(self):
+        yadt_controller._cached_defaults = None
         when(yadt_controller).basicConfig(format=any_value()).thenReturn(None)
         self.mock_root_logger = mock()
         when(yadt_controller).getLogger(any_value()).thenReturn(self.mock_root_logger)
@@ -39,13 +54,18 @@ class YadtControllerTests(unittest.TestCase):
                                                                                    '--broadcaster-host': 'host',
                                                                                    '--broadcaster-port': '54321'})
         when(yadt_controller).load(any_value(), any_value()).thenReturn({'broadcaster-host': 'localhost',
-                                                                         'broadcaster-port': 12345})
+                                                                         'broadcaster-port': 12345,
+                                                                         'broadcaster-endpoints': [('localhost',
+                                                                                                    12345)]})
         self.event_handler_mock = mock(EventHandler)
-        when(yadt_controller).EventHandler(any_value(), any_value(), any_value()).thenReturn(self.event_handler_mock)
+        when(yadt_controller.event_handler).EventHandler(any_value(), any_value(), any_value(),
+                                                         endpoints=any_value()).thenReturn(self.event_handler_mock)
         self.info_endpoint_mock = mock(TargetInfoEndpoint)
-        when(yadt_controller).TargetInfoEndpoint(any_value(), any_value(), any_value()).thenReturn(self.info_endpoint_mock)
+        when(yadt_controller.rest_api).TargetInfoEndpoint(any_value(), any_value(), any_value(),
+                                                          cache=any_value()).thenReturn(self.info_endpoint_mock)
 
     def tearDown(self):
+        yadt_controller._cached_defaults = None
         unstub()
 
     def test_should_initialize_logging(self):
@@ -55,15 +75,16 @@ class YadtControllerTests(unittest.TestCase):
         verify(yadt_controller).getLogger()
         verify(self.mock_root_logger).setLevel(yadt_controller.INFO)
 
-    def test_should_parse_command_line_using_docopt_with_program_version_when_run(self):
+    def test_should_parse_command_line_once_using_docopt_with_program_version_when_run(self):
         yadt_controller.run()
 
-        verify(yadt_controller, times=2).docopt(yadt_controller.__doc__, version='${version}')
+        verify(yadt_controller, times=1).docopt(yadt_controller.__doc__, version='${version}')
 
     def test_should_initialize_event_handler_with_provided_host_and_port(self):
         yadt_controller.run()
 
-        verify(yadt_controller).EventHandler('host', '54321', 'target')
+        verify(yadt_controller.event_handler).EventHandler('host', 54321, 'target',
+                                                           endpoints=[('host', 54321)])
 
     def test_should_load_configuration_file_and_pass_defaults(self):
         when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
@@ -84,11 +105,11 @@ class YadtControllerTests(unittest.TestCase):
                                                                                    'info': True})
         yadt_controller.run()
 
-        verify(yadt_controller).TargetInfoEndpoint(any_value(), any_value(), any_value())
+        verify(yadt_controller.rest_api).TargetInfoEndpoint(any_value(), any_value(), any_value(), cache=None)
 
     @patch("yadt_controller.print", create=True)
     def test_should_fetch_and_print_info_when_requesting_info(self, print_function):
-        when(yadt_controller.rest_api.TargetInfoEndpoint).fetch(any_value()).thenReturn('blob of target info')
+        when(self.info_endpoint_mock).fetch(any_value()).thenReturn('blob of target info')
         when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
                                                                                    '--broadcaster-host': 'any-host',
                                                                                    '<target>': 'target',
@@ -97,7 +118,7 @@ class YadtControllerTests(unittest.TestCase):
                                                                                    'info': True})
         yadt_controller.run()
 
-        verify(yadt_controller.rest_api.TargetInfoEndpoint).fetch(2)
+        verify(self.info_endpoint_mock).fetch(2)
         print_function.assert_called_with('blob of target info')
 
 
@@ -159,12 +180,15 @@ class YadtControllerTests(unittest.TestCase):
                                                                                     'baz',
                                                                                     '--tracking-id=test'],
                                                                          tracking_id='test',
-                                                                         progress_handler=None)
+                                                                         progress_handler=None,
+                                                                         error_report_timeout=10,
+                                                                         result_reporter=None,
+                                                                         event_journal=None)
 
     def test_should_use_teamcity_progress_handler_if_options_was_given(self):
         when(yadt_controller).generate_tracking_id(any_value()).thenReturn('test')
         mock_teamcity_progress_handler = mock()
-        when(yadt_controller).TeamCityProgressMessageHandler().thenReturn(mock_teamcity_progress_handler)
+        when(yadt_controller).TeamCityProgressMessageHandler(any_value()).thenReturn(mock_teamcity_progress_handler)
         when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
                                                                                    '--broadcaster-host': None,
                                                                                    '<target>': 'target',
@@ -183,7 +207,10 @@ class YadtControllerTests(unittest.TestCase):
                                                                                     'baz',
                                                                                     '--tracking-id=test'],
                                                                          tracking_id='test',
-                                                                         progress_handler=mock_teamcity_progress_handler)
+                                                                         progress_handler=mock_teamcity_progress_handler,
+                                                                         error_report_timeout=10,
+                                                                         result_reporter=None,
+                                                                         event_journal=None)
 
     def test_should_not_initialize_for_info_when_info_option_was_not_given(self):
         when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
@@ -210,7 +237,8 @@ class YadtControllerTests(unittest.TestCase):
                                                                                          'default-host')])
         yadt_controller.run()
 
-        verify(yadt_controller).EventHandler('localhost', '1234', 'target')
+        verify(yadt_controller.event_handler).EventHandler('localhost', 1234, 'target',
+                                                           endpoints=[('localhost', 1234)])
 
     def test_determine_configuration_should_not_override_broadcaster_port_from_config_file_with_default(self):
         when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
@@ -227,7 +255,46 @@ class YadtControllerTests(unittest.TestCase):
                                                                                          'default-host')])
         yadt_controller.run()
 
-        verify(yadt_controller).EventHandler('host', 12345, 'target')
+        verify(yadt_controller.event_handler).EventHandler('host', 12345, 'target',
+                                                           endpoints=[('host', 12345)])
+
+    def test_determine_configuration_should_fail_over_between_broadcaster_hosts_given_on_command_line(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'b1, b2:8082',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '8081'})
+        when(yadt_controller).parse_defaults(yadt_controller.__doc__).thenReturn([Option('-p',
+                                                                                         '--broadcaster-port',
+                                                                                         1,
+                                                                                         '8081'),
+                                                                                  Option('-b',
+                                                                                         '--broadcaster-host',
+                                                                                         1,
+                                                                                         'localhost')])
+        yadt_controller.run()
+
+        verify(yadt_controller.event_handler).EventHandler('b1', 12345, 'target',
+                                                           endpoints=[('b1', 12345), ('b2', 8082)])
+
+    def test_should_probe_broadcasters_given_on_command_line_with_numeric_port(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'b1,b2',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '9000'})
+        probed = []
+
+        def connect(host, port, timeout):
+            # a TCP endpoint does not connect to a port given as string
+            probed.append((host, port))
+            return succeed(Mock()) if isinstance(port, int) else fail(TypeError('port must be a number'))
+
+        options = yadt_controller.parse_options()
+        results = []
+        probe_endpoints(options.broadcaster_endpoints, connect=connect).addBoth(results.append)
+
+        self.assertEqual(sorted(probed), [('b1', 9000), ('b2', 9000)])
+        self.assertEqual(results, [('b1', 9000)])
+        self.assertEqual((options.broadcaster_host, options.broadcaster_port), ('b1', 9000))
 
     def test_get_defaults_should_return_default_broadcaster_and_port(self):
         when(yadt_controller).parse_defaults(yadt_controller.__doc__).thenReturn([Option('-p',
@@ -243,3 +310,465 @@ class YadtControllerTests(unittest.TestCase):
 
         self.assertEqual(actual_defaults, {'--broadcaster-host': 'default-host',
                                            '--broadcaster-port': 'default-port'})
+
+    def test_should_execute_on_all_targets_when_a_comma_separated_list_of_targets_was_given(self):
+        multi_target_execution_mock = mock(MultiTargetExecution)
+        when(yadt_controller.multi_target).MultiTargetExecution(
+            any_value(), any_value(), any_value(), max_in_flight=any_value(), max_failures=any_value(),
+            endpoints=any_value()).thenReturn(multi_target_execution_mock)
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'localhost',
+                                                                                   '<target>': 'target1,target2',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--teamcity': False})
+        yadt_controller.run()
+
+        verify(yadt_controller.multi_target).MultiTargetExecution('localhost', 12345, ['target1', 'target2'],
+                                                                  max_in_flight=None, max_failures=None,
+                                                                  endpoints=[('localhost', 12345)])
+        verify(multi_target_execution_mock).initialize_for_execution_request(waiting_timeout=30, pending_timeout=3,
+                                                                             command_to_execute='foo',
+                                                                             arguments=['bar'],
+                                                                             progress_handler=None,
+                                                                             error_report_timeout=10,
+                                                                             result_reporter=None,
+                                                                             event_journal=None)
+        verify(self.event_handler_mock, times=never).initialize_for_execution_request(
+            waiting_timeout=any_value(), pending_timeout=any_value(), command_to_execute=any_value(),
+            arguments=any_value(), tracking_id=any_value(), progress_handler=any_value(),
+            error_report_timeout=any_value())
+
+    def test_should_read_targets_from_targets_file(self):
+        when(yadt_controller.multi_target).read_targets_file('/path/to/targets').thenReturn(
+            ['target1', 'target2', 'target1'])
+
+        actual_targets = yadt_controller._determine_targets({'--targets-file': '/path/to/targets',
+                                                             '<target>': None})
+
+        self.assertEqual(actual_targets, ['target1', 'target2'])
+
+    def test_should_split_comma_separated_targets_and_ignore_empty_entries(self):
+        actual_targets = yadt_controller._determine_targets({'<target>': 'target1, target2,,'})
+
+        self.assertEqual(actual_targets, ['target1', 'target2'])
+
+    def test_should_not_treat_a_single_target_as_multi_target_request(self):
+        self.assertFalse(yadt_controller._is_multi_target_request({'<target>': 'target'}))
+
+    def test_should_refuse_multi_target_request_without_targets(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'localhost',
+                                                                                   '<target>': ',',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar']})
+
+        self.assertRaises(DocoptExit, yadt_controller.parse_options)
+
+    def test_should_refuse_empty_targets_file(self):
+        when(yadt_controller.multi_target).read_targets_file('/path/to/targets').thenReturn([])
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'localhost',
+                                                                                   '<target>': None,
+                                                                                   '--targets-file': '/path/to/targets',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   'info': True})
+
+        self.assertRaises(DocoptExit, yadt_controller.parse_options)
+
+    def test_should_pass_rollout_limits_to_multi_target_execution(self):
+        multi_target_execution_mock = mock(MultiTargetExecution)
+        when(yadt_controller.multi_target).MultiTargetExecution(
+            any_value(), any_value(), any_value(), max_in_flight=any_value(), max_failures=any_value(),
+            endpoints=any_value()).thenReturn(multi_target_execution_mock)
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'localhost',
+                                                                                   '<target>': 'target1,target2',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--max-in-flight': '5',
+                                                                                   '--max-failures': '2'})
+        yadt_controller.run()
+
+        verify(yadt_controller.multi_target).MultiTargetExecution('localhost', 12345, ['target1', 'target2'],
+                                                                  max_in_flight=5, max_failures=2,
+                                                                  endpoints=[('localhost', 12345)])
+
+    def test_should_refuse_rollout_limits_below_one(self):
+        for option, value in [('--max-in-flight', '0'), ('--max-in-flight', '-2'), ('--max-failures', '0')]:
+            when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn(
+                {'--config-file': '/configuration',
+                 '--broadcaster-host': 'localhost',
+                 '<target>': 'target1,target2',
+                 '--broadcaster-port': '8081',
+                 '<waiting_timeout>': '30',
+                 '<pending_timeout>': '3',
+                 'info': False,
+                 '<cmd>': 'foo',
+                 '<args>': ['bar'],
+                 option: value})
+
+            self.assertRaises(DocoptExit, yadt_controller.parse_options)
+
+    def test_should_pass_error_report_timeout_to_event_handler(self):
+        when(yadt_controller).generate_tracking_id(any_value()).thenReturn('test')
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': None,
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--error-report-timeout': '2'})
+        yadt_controller.run()
+
+        verify(self.event_handler_mock).initialize_for_execution_request(waiting_timeout=30, pending_timeout=3,
+                                                                         command_to_execute='foo',
+                                                                         arguments=['bar', '--tracking-id=test'],
+                                                                         tracking_id='test',
+                                                                         progress_handler=None,
+                                                                         error_report_timeout=2,
+                                                                         result_reporter=None,
+                                                                         event_journal=None)
+
+    def test_should_pass_json_result_reporter_to_event_handler(self):
+        result_reporter = mock()
+        json_output = '/path/to/results.json'
+        when(yadt_controller).open_json_lines_result_reporter(json_output).thenReturn(result_reporter)
+        when(yadt_controller).generate_tracking_id(any_value()).thenReturn('test')
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': None,
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--json-output': json_output})
+        yadt_controller.run()
+
+        verify(self.event_handler_mock).initialize_for_execution_request(waiting_timeout=30, pending_timeout=3,
+                                                                         command_to_execute='foo',
+                                                                         arguments=['bar', '--tracking-id=test'],
+                                                                         tracking_id='test',
+                                                                         progress_handler=None,
+                                                                         error_report_timeout=10,
+                                                                         result_reporter=result_reporter,
+                                                                         event_journal=None)
+
+    def test_should_pass_event_journal_to_event_handler(self):
+        event_journal = mock()
+        when(yadt_controller.journal).open_event_journal('/path/to/events.journal').thenReturn(event_journal)
+        when(yadt_controller).generate_tracking_id(any_value()).thenReturn('test')
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': None,
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--record-events':
+                                                                                   '/path/to/events.journal'})
+        yadt_controller.run()
+
+        verify(self.event_handler_mock).initialize_for_execution_request(waiting_timeout=30, pending_timeout=3,
+                                                                         command_to_execute='foo',
+                                                                         arguments=['bar', '--tracking-id=test'],
+                                                                         tracking_id='test',
+                                                                         progress_handler=None,
+                                                                         error_report_timeout=10,
+                                                                         result_reporter=None,
+                                                                         event_journal=event_journal)
+
+    def test_should_combine_json_output_and_timings_file(self):
+        when(yadt_controller).open_json_lines_result_reporter('-').thenReturn(mock())
+
+        result_reporter = yadt_controller._create_result_reporter(Mock(json_output='-',
+                                                                       timings_file='/path/to/timings.prom',
+                                                                       timings_format='statsd'))
+
+        json_reporter, timings_file = result_reporter.reporters
+        self.assertEqual(timings_file.filename, '/path/to/timings.prom')
+        self.assertEqual(timings_file.file_format, 'statsd')
+
+    def test_should_not_create_result_reporter_without_outputs(self):
+        self.assertEqual(yadt_controller._create_result_reporter(Mock(json_output=None, timings_file=None)), None)
+
+    def test_get_defaults_should_parse_usage_text_only_once(self):
+        when(yadt_controller).parse_defaults(yadt_controller.__doc__).thenReturn([Option('-b',
+                                                                                         '--broadcaster-host',
+                                                                                         1,
+                                                                                         'default-host')])
+        yadt_controller._get_defaults()
+        yadt_controller._get_defaults()
+
+        verify(yadt_controller, times=1).parse_defaults(yadt_controller.__doc__)
+
+    def test_parse_options_should_return_immutable_options(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'localhost',
+                                                                                   '<target>': 'target1,target2',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   'info': False,
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--max-in-flight': '5'})
+
+        options = yadt_controller.parse_options()
+
+        self.assertEqual(options.broadcaster_host, 'localhost')
+        self.assertEqual(options.broadcaster_port, 12345)
+        self.assertEqual(options.targets, ('target1', 'target2'))
+        self.assertEqual(options.waiting_timeout, 30)
+        self.assertEqual(options.pending_timeout, 3)
+        self.assertEqual(options.command, 'foo')
+        self.assertEqual(options.arguments, ('bar',))
+        self.assertEqual(options.max_in_flight, 5)
+        self.assertEqual(options.max_failures, None)
+        self.assertRaises(AttributeError, setattr, options, 'command', 'other')
+
+    @patch("yadt_controller.print", create=True)
+    def test_should_print_info_of_many_targets_as_json_documents_and_fail_when_any_target_failed(
+            self, print_function):
+        when(yadt_controller.sys).exit(any_value()).thenReturn(None)
+        when(yadt_controller.rest_api).configure_pool_size(any_value()).thenReturn(None)
+        when(yadt_controller.rest_api).fetch_target_infos(any_value(), any_value(), any_value(), any_value(),
+                                                          max_workers=any_value(), cache=any_value()).thenReturn(
+            [TargetInfo('target2', '{"hosts": []}', None),
+             TargetInfo('target1', None, EndpointException('Info request returned non-ok code 404 (Not Found)'))])
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'any-host',
+                                                                                   '<target>': 'target1,target2',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   '--max-in-flight': '4',
+                                                                                   'info': True})
+
+        yadt_controller.run()
+
+        verify(yadt_controller.rest_api).configure_pool_size(4)
+        verify(yadt_controller.rest_api).fetch_target_infos(('target1', 'target2'), 'any-host', 1234, 2, max_workers=4,
+                                                            cache=None)
+        self.assertEqual([json.loads(call_args[0][0]) for call_args in print_function.call_args_list],
+                         [{'target': 'target2', 'info': {'hosts': []}, 'error': None},
+                          {'target': 'target1', 'info': None,
+                           'error': 'Info request returned non-ok code 404 (Not Found)'}])
+        verify(yadt_controller.sys).exit(1)
+
+    def test_should_refuse_info_of_many_targets_with_max_in_flight_below_one(self):
+        when(yadt_controller.rest_api).configure_pool_size(any_value()).thenReturn(None)
+        for max_in_flight in ['0', '-1']:
+            when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn(
+                {'--config-file': '/configuration',
+                 '--broadcaster-host': 'any-host',
+                 '<target>': 'target1,target2',
+                 '--broadcaster-port': '1234',
+                 '<waiting_timeout>': '2',
+                 '--max-in-flight': max_in_flight,
+                 'info': True})
+
+            self.assertRaises(DocoptExit, yadt_controller.run)
+
+        verify(yadt_controller.rest_api, times=never).configure_pool_size(any_value())
+
+    def test_should_refuse_to_stream_info_of_many_targets(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'any-host',
+                                                                                   '<target>': 'target1,target2',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   '--fields': 'hosts',
+                                                                                   'info': True})
+
+        self.assertRaises(DocoptExit, yadt_controller.parse_options)
+
+    @patch("yadt_controller.print", create=True)
+    def test_should_print_requested_fields_of_streamed_info(self, print_function):
+        when(self.info_endpoint_mock).stream(any_value()).thenReturn(iter(['{"hosts": ["host1"], ', '"name": "t"}']))
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'any-host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   '--fields': 'hosts, services.state',
+                                                                                   'info': True})
+
+        yadt_controller.run()
+
+        verify(self.info_endpoint_mock).stream(2)
+        verify(self.info_endpoint_mock, never).fetch(any_value())
+        print_function.assert_called_once_with('{"field": "hosts", "value": ["host1"]}')
+
+    def test_should_cache_info_when_a_ttl_was_given(self):
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'any-host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '1234',
+                                                                                   '--info-cache-ttl': '60',
+                                                                                   '--info-cache-dir': '/var/cache/yc'})
+
+        info_cache = yadt_controller._create_info_cache(yadt_controller.parse_options())
+
+        self.assertEqual(info_cache.ttl_in_seconds, 60)
+        self.assertEqual(info_cache.directory, '/var/cache/yc')
+
+    def test_should_not_cache_info_without_ttl(self):
+        self.assertEqual(yadt_controller._create_info_cache(yadt_controller.parse_options()), None)
+
+    def test_should_serve_requests_on_socket_when_serve_was_given(self):
+        daemon = mock(ControllerDaemon)
+        when(yadt_controller.daemon).ControllerDaemon(any_value(), any_value(), any_value(),
+                                                      info_cache=any_value(),
+                                                      metrics_port=any_value(),
+                                                      endpoints=any_value()).thenReturn(daemon)
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'host',
+                                                                                   '<target>': None,
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   'serve': True,
+                                                                                   '<socket_path>': '/run/yc.sock'})
+
+        yadt_controller.run()
+
+        verify(yadt_controller.daemon).ControllerDaemon('host', 12345, '/run/yc.sock', info_cache=None,
+                                                        metrics_port=None, endpoints=[('host', 12345)])
+        verify(daemon).serve()
+        verify(yadt_controller.event_handler, never).EventHandler(any_value(), any_value(), any_value(),
+                                                                  endpoints=any_value())
+
+    def test_should_submit_execution_to_daemon_and_exit_with_its_result(self):
+        when(yadt_controller.sys).exit(any_value()).thenReturn(None)
+        when(yadt_controller.socket_api).submit(any_value(), any_value()).thenReturn(
+            [{'type': 'accepted', 'target': 'target', 'tracking_id': 'id'},
+             {'type': 'progress', 'text': 'bar started'},
+             {'type': 'result', 'target': 'target', 'exit_code': 0, 'remote_host': None, 'log_file': None}])
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--error-report-timeout': '10',
+                                                                                   '--socket': '/run/yc.sock'})
+
+        yadt_controller.run()
+
+        verify(yadt_controller.socket_api).submit('/run/yc.sock', {'request': 'execute',
+                                                                   'target': 'target',
+                                                                   'command': 'foo',
+                                                                   'arguments': ['bar'],
+                                                                   'waiting_timeout': 30,
+                                                                   'pending_timeout': 3,
+                                                                   'error_report_timeout': 10})
+        verify(self.mock_root_logger).info('bar started')
+        verify(yadt_controller.sys).exit(0)
+        verify(yadt_controller.event_handler, never).EventHandler(any_value(), any_value(), any_value(),
+                                                                  endpoints=any_value())
+
+    def test_should_log_error_report_returned_by_daemon(self):
+        when(yadt_controller.sys).exit(any_value()).thenRaise(SystemExit)
+        when(yadt_controller.socket_api).submit(any_value(), any_value()).thenReturn(
+            [{'type': 'result', 'target': 'target', 'exit_code': 1, 'remote_host': 'some-machine',
+              'log_file': '/path/to/log', 'error_report': 'first\nsecond'}])
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '30',
+                                                                                   '<pending_timeout>': '3',
+                                                                                   '<cmd>': 'foo',
+                                                                                   '<args>': ['bar'],
+                                                                                   '--error-report-timeout': '10',
+                                                                                   '--socket': '/run/yc.sock'})
+
+        self.assertRaises(SystemExit, yadt_controller.run)
+
+        verify(self.mock_root_logger).error('*****Error report*****')
+        verify(self.mock_root_logger).error('first')
+        verify(self.mock_root_logger).error('second')
+        verify(self.mock_root_logger).error('See also full log on some-machine : /path/to/log')
+        verify(yadt_controller.sys).exit(1)
+
+    @patch("yadt_controller.print", create=True)
+    def test_should_print_info_returned_by_daemon(self, print_function):
+        when(yadt_controller.socket_api).submit(any_value(), any_value()).thenReturn(
+            [{'type': 'info', 'info': 'blob of target info'}])
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   'info': True,
+                                                                                   '--socket': '/run/yc.sock'})
+
+        yadt_controller.run()
+
+        verify(yadt_controller.socket_api).submit('/run/yc.sock', {'request': 'info', 'target': 'target',
+                                                                   'timeout': 2})
+        print_function.assert_called_with('blob of target info')
+
+    def test_should_exit_with_one_when_daemon_is_not_reachable(self):
+        when(yadt_controller.sys).exit(any_value()).thenRaise(SystemExit)
+        when(yadt_controller).docopt(any_value(), version=any_value()).thenReturn({'--config-file': '/configuration',
+                                                                                   '--broadcaster-host': 'host',
+                                                                                   '<target>': 'target',
+                                                                                   '--broadcaster-port': '8081',
+                                                                                   '<waiting_timeout>': '2',
+                                                                                   'info': True,
+                                                                                   '--socket': '/does/not/exist'})
+
+        self.assertRaises(SystemExit, yadt_controller.run)
+
+        verify(yadt_controller.sys).exit(1)
+
+
+class LazyImportTests(unittest.TestCase):
+
+    def loaded_modules_after(self, statements):
+        script = 'import sys\n{0}\nprint(" ".join(sorted(sys.modules)))'.format(statements)
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+        output = subprocess.Popen([sys.executable, '-c', script],
+                                  stdout=subprocess.PIPE,
+                                  env=environment).communicate()[0]
+        return output.decode('utf-8').split()
+
+    def test_should_not_import_twisted_nor_requests_when_importing_the_package(self):
+        loaded_modules = self.loaded_modules_after('import yadt_controller')
+
+        for module in ('twisted', 'yadtbroadcastclient', 'requests', 'yadt_controller.event_handler'):
+            self.assertFalse(module in loaded_modules, '{0} was imported'.format(module))
+
+    def test_should_not_import_twisted_when_submitting_to_the_daemon(self):
+        loaded_modules = self.loaded_modules_after('import yadt_controller.socket_api')
+
+        for module in ('twisted', 'yadtbroadcastclient', 'requests'):
+            self.assertFalse(module in loaded_modules, '{0} was imported'.format(module))
+
+    def test_should_not_import_twisted_when_requesting_info(self):
+        loaded_modules = self.loaded_modules_after('import yadt_controller.rest_api')
+
+        for module in ('twisted', 'yadtbroadcastclient'):
+            self.assertFalse(module in loaded_modules, '{0} was imported'.format(module))